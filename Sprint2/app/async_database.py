@@ -0,0 +1,904 @@
+"""
+Асинхронный слой доступа к базе данных для обработчиков FastAPI.
+Повторяет методы DatabaseManager, но работает через psycopg 3
+и собственный асинхронный пул, не блокируя цикл событий.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
+from psycopg import AsyncCursor
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+from datetime import date
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional
+from functools import wraps
+from database import (DatabaseSettings, PEREVAL_DETAIL_QUERY, pereval_from_row, CLIENT_ERRORS,
+                      USER_PEREVALS_DEFAULT_LIMIT, build_user_perevals_query, user_perevals_page,
+                      BULK_INSERT_QUERY, bulk_insert_params, log_bulk_throughput,
+                      CLAIM_IDEMPOTENCY_KEY_QUERY, GET_IDEMPOTENCY_KEY_QUERY, SET_IDEMPOTENCY_RESULT_QUERY,
+                      PURGE_IDEMPOTENCY_KEYS_QUERY, IdempotencyKeyMismatch, submit_request_hash,
+                      resolve_idempotency_replay, PEREVALS_NEAREST_QUERY, build_bbox_query,
+                      nearest_query_params, geo_summary_from_row, rank_nearest,
+                      build_export_query, export_record_from_row, PEREVAL_VERSION_QUERY,
+                      PEREVAL_LOCK_QUERY, PerevalVersionMismatch, pereval_update_plan,
+                      INTERN_COORDS_QUERY, INTERN_LEVEL_QUERY, UPDATE_PEREVAL_QUERY,
+                      DELETE_IMAGES_QUERY, INSERT_IMAGES_QUERY, DELETE_ACTIVITIES_QUERY,
+                      INSERT_ACTIVITIES_QUERY, build_moderation_queue_query, short_info_from_row,
+                      CLAIM_MODERATION_QUERY, SET_PEREVALS_STATUS_QUERY, moderation_results,
+                      PEREVAL_STATUS_LOCK_QUERY, INSERT_PENDING_IMAGE_QUERY, BUMP_PEREVAL_VERSION_QUERY,
+                      PENDING_IMAGES_QUERY, SET_IMAGE_PROCESSED_QUERY, SET_IMAGE_FAILED_QUERY,
+                      REFRESH_IMAGE_CLAIMS_QUERY, SET_SIMILARITY_THRESHOLD_QUERY, build_search_query, search_page,
+                      ENQUEUE_SUBMISSION_QUERY, GET_SUBMISSION_BY_KEY_QUERY, CLAIM_SUBMISSIONS_QUERY,
+                      COMPLETE_SUBMISSIONS_QUERY, SUBMISSION_STATUS_QUERY, PURGE_SUBMISSIONS_QUERY,
+                      submission_from_row)
+from search import SEARCH_DEFAULT_LIMIT, SEARCH_SIMILARITY_THRESHOLD
+from stats import STATS_QUERY, USER_STATS_QUERY, stats_from_rows, user_stats_from_rows
+
+from metrics import track_db_method, record_query, record_pool_wait
+from reference import REFERENCE_CHANNEL, ACTIVITY_TYPES_QUERY
+from breaker import DatabaseUnavailable, create_breaker
+from queries import Statement, check_columns
+from replicas import READ_AFTER_LSN, REPLICA_STATUS_QUERY, CURRENT_WAL_LSN_QUERY, create_replica_set
+
+logger = logging.getLogger(__name__)
+
+# Данные запроса не прошли ограничения схемы (тип, длина, внешний ключ): ответ 400, а не сбой базы
+INVALID_DATA_ERRORS = (psycopg.DataError, psycopg.IntegrityError)
+
+
+def is_connection_error(error: Exception) -> bool:
+    """
+    Ошибка доступности базы, а не конкретного запроса. Не считаются таймаут запроса и блокировки,
+    а также PoolTimeout (подкласс OperationalError): занятый пул — перегрузка, база при этом отвечает
+    """
+    if isinstance(error, PoolTimeout):
+        return False
+    return (isinstance(error, psycopg.OperationalError)
+            and not isinstance(error, (psycopg.errors.QueryCanceled, psycopg.errors.LockNotAvailable)))
+
+
+def handle_async_db_errors(func):
+    @wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        try:
+            with track_db_method(func.__name__):
+                result = await func(self, *args, **kwargs)
+            self.breaker.record_success()
+            return result
+        except DatabaseUnavailable:
+            raise
+        except CLIENT_ERRORS + INVALID_DATA_ERRORS as e:
+            # Отклонён сам запрос (ответ 4xx), а не сбой базы: автомат защиты не учитывает
+            logger.debug(f"{func.__name__} rejected the request: {e}")
+            raise
+        except PoolTimeout as e:
+            # Все соединения заняты: 503 только этому запросу, автомат защиты не учитывает
+            logger.warning(f"No free connection for {func.__name__}: {e}")
+            raise DatabaseUnavailable(1) from e
+        except psycopg.Error as e:
+            # Откат выполняет пул при возврате соединения
+            logger.error(f"Database error in {func.__name__}: {e}")
+            if is_connection_error(e):
+                self.breaker.record_failure()
+                raise DatabaseUnavailable(self.breaker.retry_after() or self.breaker.reset_timeout) from e
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in {func.__name__}: {e}")
+            raise
+    return wrapper
+
+
+class InstrumentedAsyncCursor(AsyncCursor):
+    """Замеряет каждый execute курсора для метрик и журнала медленных запросов"""
+
+    async def execute(self, query, params=None, **kwargs):
+        if isinstance(query, Statement):
+            # Запрос из реестра готовится на сервере при первом выполнении на этом соединении
+            kwargs.setdefault('prepare', True)
+        started = time.perf_counter()
+        try:
+            result = await super().execute(query, params, **kwargs)
+        finally:
+            record_query(query, time.perf_counter() - started)
+        check_columns(query, self.description)
+        return result
+
+    async def executemany(self, query, params_seq, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+
+class InstrumentedAsyncConnectionPool(AsyncConnectionPool):
+    """Пул, который сообщает время ожидания соединения в метрики"""
+
+    async def getconn(self, timeout: Optional[float] = None):
+        started = time.perf_counter()
+        conn = await super().getconn(timeout)
+        record_pool_wait(time.perf_counter() - started)
+        return conn
+
+
+class AsyncDatabaseManager(DatabaseSettings):
+    """Асинхронный менеджер, используется обработчиками API"""
+
+    def __init__(self):
+        super().__init__()
+        # Автомат защиты (FSTR_DB_BREAKER_*) и период фоновой проверки базы
+        self.breaker = create_breaker()
+        self.health_interval = float(os.getenv('FSTR_DB_HEALTH_INTERVAL', '5'))
+        self._connect_lock = asyncio.Lock()
+        # Реплики для чтения (FSTR_DB_REPLICAS); их проверяет maintain_replicas
+        self.replicas = create_replica_set(self)
+        # Отложенные повторные сбросы кэша (invalidate_cache)
+        self._cache_tasks = set()
+
+    def conninfo(self) -> str:
+        return make_conninfo(host=self.db_host, port=self.db_port, user=self.db_login,
+                             password=self.db_pass, dbname=self.db_name)
+
+    def create_pool(self, conninfo: str) -> InstrumentedAsyncConnectionPool:
+        """Пул с параметрами FSTR_DB_POOL_* (ещё не открытый)"""
+        return InstrumentedAsyncConnectionPool(
+            conninfo,
+            kwargs={'cursor_factory': InstrumentedAsyncCursor,
+                    'prepare_threshold': self.prepare_threshold},
+            min_size=self.pool_min,
+            max_size=self.pool_max,
+            timeout=self.pool_timeout,
+            max_lifetime=self.pool_max_lifetime,
+            check=AsyncConnectionPool.check_connection if self.pool_pre_ping else None,
+            open=False
+        )
+
+    async def connect(self) -> bool:
+        """Открывает асинхронный пул соединений"""
+        if self.pool:
+            return True
+        pool = self.create_pool(self.conninfo())
+        try:
+            await pool.open(wait=True, timeout=self.pool_timeout)
+        except PoolTimeout as e:
+            logger.error(f"Failed to open async connection pool: {e}")
+            await pool.close()
+            self.breaker.trip()
+            return False
+        self.pool = pool
+        self.breaker.reset()
+        logger.info(f"Async connection pool to {self.db_host}:{self.db_port}/{self.db_name} opened "
+                    f"(min={self.pool_min}, max={self.pool_max})")
+        return True
+
+    async def require_pool(self):
+        """
+        Проверка перед запросом: при разомкнутой цепи сразу DatabaseUnavailable.
+        Подключается, только если пула ещё нет и цепь замкнута, — один запрос за раз,
+        остальные после неудачи получают отказ без ожидания.
+        """
+        self.breaker.check()
+        if self.pool:
+            return
+        async with self._connect_lock:
+            self.breaker.check()
+            if not self.pool and not await self.connect():
+                raise DatabaseUnavailable(self.breaker.retry_after())
+
+    async def ping(self) -> bool:
+        """SELECT 1 через пул; ошибки не пробрасываются"""
+        try:
+            async with self.pool.connection(timeout=self.pool_timeout) as conn:
+                await conn.execute("SELECT 1")
+            return True
+        except (psycopg.Error, PoolTimeout) as e:
+            logger.warning(f"Database health check failed: {e}")
+            return False
+
+    async def maintain_connection(self, on_connect: Optional[Callable[[], Awaitable[Any]]] = None):
+        """
+        Фоновая задача: открывает пул (on_connect вызывается после первого подключения), раз
+        в health_interval проверяет базу, а при разомкнутой цепи проверяет её с растущей паузой
+        и замыкает цепь, когда база снова отвечает.
+        """
+        ready = False
+        while True:
+            try:
+                if self.breaker.is_open and not self.breaker.attempt_due():
+                    await asyncio.sleep(min(self.breaker.retry_after(), self.health_interval))
+                    continue
+                if not self.pool:
+                    was_open = self.breaker.is_open
+                    async with self._connect_lock:
+                        connected = self.pool is not None or await self.connect()
+                    if not connected:
+                        if was_open:
+                            self.breaker.record_probe_failure()
+                        logger.warning(f"Database is unavailable, next attempt in {self.breaker.backoff:g} s")
+                        continue
+                elif await self.ping():
+                    if self.breaker.is_open:
+                        logger.info("Database is available again, closing circuit")
+                        self.breaker.reset()
+                    else:
+                        self.breaker.record_success()
+                elif self.breaker.is_open:
+                    self.breaker.record_probe_failure()
+                    logger.warning(f"Database is unavailable, next attempt in {self.breaker.backoff:g} s")
+                    continue
+                else:
+                    self.breaker.record_failure()
+                if self.pool and not ready and on_connect is not None:
+                    await on_connect()
+                    ready = True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Database health check task failed: {e}")
+            await asyncio.sleep(self.health_interval)
+
+    async def maintain_replicas(self):
+        """Фоновая задача: раз в health_interval проверяет реплики (доступность, режим, отставание)"""
+        if not self.replicas:
+            return
+        logger.info(f"Reads are routed to {len(self.replicas.replicas)} replica(s)")
+        while True:
+            for replica in self.replicas:
+                try:
+                    await self.check_replica(replica)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Replica {replica.name} health check failed: {e}")
+            await asyncio.sleep(self.health_interval)
+
+    async def check_replica(self, replica):
+        """Открывает пул реплики при первой проверке и обновляет её состояние"""
+        if replica.pool is None:
+            pool = self.create_pool(replica.conninfo)
+            try:
+                await pool.open(wait=True, timeout=self.pool_timeout)
+            except PoolTimeout as e:
+                await pool.close()
+                replica.mark_down(f"cannot open pool: {e}")
+                return
+            replica.pool = pool
+        try:
+            async with replica.pool.connection(timeout=self.pool_timeout) as conn, \
+                    conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(REPLICA_STATUS_QUERY)
+                row = await cursor.fetchone()
+        except (psycopg.Error, PoolTimeout) as e:
+            replica.mark_down(str(e))
+            return
+        replica.update(row['in_recovery'], row['replay_lsn'], row['lag'], self.replicas.max_lag)
+
+    async def run_read(self, read: Callable[[Any], Awaitable[Any]]) -> Any:
+        """
+        Выполняет read(conn) на реплике (см. replicas.py). Если подходящей реплики нет, она
+        не отвечает или отменила запрос из-за конфликта с восстановлением — на основном сервере.
+        Пока база недоступна, чтение с реплик продолжается.
+        """
+        replica = self.replicas.choose(READ_AFTER_LSN.get())
+        if replica is not None:
+            try:
+                async with replica.pool.connection(timeout=self.pool_timeout) as conn:
+                    result = await read(conn)
+                replica.reads += 1
+                return result
+            except PoolTimeout as e:
+                # Пул реплики занят — это не отказ реплики
+                logger.warning(f"No free connection on replica {replica.name}, reading from primary: {e}")
+            except psycopg.Error as e:
+                if is_connection_error(e):
+                    replica.mark_down(str(e))
+                elif not isinstance(e, psycopg.errors.SerializationFailure):
+                    raise
+                logger.warning(f"Read on replica {replica.name} failed, retrying on primary: {e}")
+        elif self.replicas:
+            self.replicas.primary_reads += 1
+
+        await self.require_pool()
+        async with self.pool.connection() as conn:
+            return await read(conn)
+
+    async def read_pool(self):
+        """Пул для потокового чтения (выгрузки): реплика без повтора на основном сервере"""
+        replica = self.replicas.choose(READ_AFTER_LSN.get())
+        if replica is not None:
+            replica.reads += 1
+            return replica.pool
+        if self.replicas:
+            self.replicas.primary_reads += 1
+        await self.require_pool()
+        return self.pool
+
+    @handle_async_db_errors
+    async def current_wal_lsn(self) -> str:
+        """Текущая позиция WAL основного сервера — после записи её должна догнать реплика"""
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(CURRENT_WAL_LSN_QUERY)
+            return (await cursor.fetchone())['lsn']
+
+    async def cache_call(self, method, *args):
+        """
+        Вызов метода кэша карточек. Redis отвечает по сети, а клиент синхронный, поэтому
+        его вызовы выполняются в потоке и не блокируют цикл событий; LRU в памяти — сразу
+        """
+        if self.cache.blocking:
+            return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+        return method(*args)
+
+    async def invalidate_cache(self, *pereval_ids: int):
+        """
+        Сбрасывает карточки в кэше. С репликами сбрасывает ещё раз через max_lag секунд:
+        чтение с отстающей реплики могло успеть положить в кэш старую версию
+        """
+        if not pereval_ids:
+            return
+        await self.cache_call(self.cache.invalidate, *pereval_ids)
+        if self.replicas:
+            task = asyncio.create_task(self._invalidate_later(self.replicas.max_lag, pereval_ids))
+            self._cache_tasks.add(task)
+            task.add_done_callback(self._cache_tasks.discard)
+
+    async def _invalidate_later(self, delay: float, pereval_ids):
+        await asyncio.sleep(delay)
+        try:
+            await self.cache_call(self.cache.invalidate, *pereval_ids)
+        except Exception as e:
+            logger.warning(f"Delayed cache invalidation failed: {e}")
+
+    def is_ready(self) -> bool:
+        return self.pool is not None and not self.breaker.is_open
+
+    def get_stale_pereval(self, pereval_id: int) -> Optional[Dict[str, Any]]:
+        """Карточка из кэша, даже с истёкшим TTL, — для ответа, пока база недоступна"""
+        return self.cache.get_stale(pereval_id)
+
+    async def close(self):
+        """Закрывает асинхронные пулы основного сервера и реплик"""
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+                replica.healthy = False
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Счётчики пула в том же формате, что и у синхронного ConnectionPool"""
+        if not self.pool:
+            return {}
+        raw = self.pool.get_stats()
+        size = raw.get('pool_size', 0)
+        idle = raw.get('pool_available', 0)
+        acquired = raw.get('requests_num', 0)
+        wait_total = raw.get('requests_wait_ms', 0) / 1000
+        return {
+            'min_size': raw.get('pool_min', self.pool_min),
+            'max_size': raw.get('pool_max', self.pool_max),
+            'size': size,
+            'in_use': size - idle,
+            'idle': idle,
+            'waiting': raw.get('requests_waiting', 0),
+            'acquired_total': acquired,
+            'timeouts_total': raw.get('requests_errors', 0),
+            'broken_total': raw.get('connections_lost', 0),
+            'wait_time_total': round(wait_total, 6),
+            'wait_time_avg': round(wait_total / acquired, 6) if acquired else 0.0,
+        }
+
+    @handle_async_db_errors
+    async def add_pereval(self, pereval_data: Dict[str, Any], images_data: List[Dict[str, Any]],
+                          activities: List[int], idempotency_key: Optional[str] = None) -> int:
+        """
+        Добавляет перевал одним запросом, пользователь с тем же email переиспользуется.
+        С idempotency_key повтор того же запроса возвращает ID уже созданного перевала.
+        Данные, не прошедшие ограничения схемы, — INVALID_DATA_ERRORS.
+        """
+        await self.require_pool()
+
+        # Неизвестный вид деятельности отклоняем до начала транзакции, а не по внешнему ключу
+        self.activity_types.check(activities)
+
+        item = {'data': pereval_data, 'images': images_data, 'activities': activities}
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            if idempotency_key:
+                request_hash = submit_request_hash(item)
+                await cursor.execute(CLAIM_IDEMPOTENCY_KEY_QUERY, (idempotency_key, request_hash))
+                if not await cursor.fetchone():
+                    # Ключ уже использован: отдаём сохранённый результат
+                    await cursor.execute(GET_IDEMPOTENCY_KEY_QUERY, (idempotency_key,))
+                    stored = await cursor.fetchone()
+                    return resolve_idempotency_replay(idempotency_key, request_hash,
+                                                      stored['request_hash'], stored['pereval_id'])
+
+            await cursor.execute(BULK_INSERT_QUERY, bulk_insert_params([item]))
+            pereval_id = (await cursor.fetchone())['pereval_id']
+
+            if idempotency_key:
+                await cursor.execute(SET_IDEMPOTENCY_RESULT_QUERY, (pereval_id, idempotency_key))
+
+            await conn.commit()
+            logger.info(f"Successfully added pereval with ID {pereval_id}")
+            return pereval_id
+
+    @handle_async_db_errors
+    async def purge_idempotency_keys(self) -> int:
+        """Удаляет ключи идемпотентности старше FSTR_IDEMPOTENCY_TTL_HOURS"""
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(PURGE_IDEMPOTENCY_KEYS_QUERY, (self.idempotency_ttl_hours,))
+            await conn.commit()
+            return cursor.rowcount
+
+    @handle_async_db_errors
+    async def add_perevals_bulk(self, items: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Добавляет пачку перевалов в одной транзакции, по каждому возвращает ID или ошибку"""
+        # Перевалы с неизвестными видами деятельности в базу не отправляем
+        rejected, valid = [], []
+        for index, item in enumerate(items):
+            unknown = self.activity_types.unknown(item['activities'])
+            if unknown:
+                rejected.append({'index': index, 'id': None,
+                                 'error': f"Неизвестные виды деятельности: {', '.join(map(str, unknown))}"})
+            else:
+                valid.append(index)
+        if not valid:
+            return rejected
+
+        results = await self._insert_perevals_bulk([items[index] for index in valid])
+        if results is None:
+            return None
+        for result in results:
+            result['index'] = valid[result['index']]
+        return sorted(results + rejected, key=lambda result: result['index'])
+
+    async def _insert_perevals_bulk(self, items: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        await self.require_pool()
+
+        started = time.monotonic()
+        async with self.pool.connection() as conn, conn.transaction():
+            results = await self._insert_items(conn, items)
+
+        log_bulk_throughput(results, time.monotonic() - started)
+        return results
+
+    async def _insert_items(self, conn, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Пачка перевалов внутри открытой транзакции; по каждому — ID или текст ошибки"""
+        async with conn.cursor(row_factory=dict_row) as cursor:
+            try:
+                async with conn.transaction():
+                    await cursor.execute(BULK_INSERT_QUERY, bulk_insert_params(items))
+                    return [{'index': row['ord'] - 1, 'id': row['pereval_id'], 'error': None}
+                            for row in await cursor.fetchall()]
+            except psycopg.Error as e:
+                if is_connection_error(e):
+                    raise
+                # Общий запрос упал — повторяем по одному, изолируя ошибки точками сохранения
+                logger.warning(f"Bulk insert of {len(items)} perevals failed ({e}), retrying item by item")
+
+            results = []
+            for index, item in enumerate(items):
+                try:
+                    async with conn.transaction():
+                        await cursor.execute(BULK_INSERT_QUERY, bulk_insert_params([item]))
+                        pereval_id = (await cursor.fetchone())['pereval_id']
+                    results.append({'index': index, 'id': pereval_id, 'error': None})
+                except psycopg.Error as item_error:
+                    if is_connection_error(item_error):
+                        raise
+                    results.append({'index': index, 'id': None, 'error': str(item_error).strip()})
+            return results
+
+    @handle_async_db_errors
+    async def enqueue_submission(self, item: Dict[str, Any], idempotency_key: Optional[str] = None) -> str:
+        """
+        Сохраняет запрос POST /submitData/ в очередь отложенной записи и возвращает номер (ticket).
+        С idempotency_key повтор того же запроса возвращает уже выданный номер.
+        """
+        await self.require_pool()
+        self.activity_types.check(item['activities'])
+
+        request_hash = submit_request_hash(item) if idempotency_key else None
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(ENQUEUE_SUBMISSION_QUERY,
+                                 (uuid.uuid4(), Jsonb(item), idempotency_key, request_hash))
+            row = await cursor.fetchone()
+            if row is None:
+                # Ключ уже использован: отдаём выданный номер, если запрос тот же
+                await cursor.execute(GET_SUBMISSION_BY_KEY_QUERY, (idempotency_key,))
+                row = await cursor.fetchone()
+                if row['request_hash'] != request_hash:
+                    raise IdempotencyKeyMismatch(f"Ключ идемпотентности {idempotency_key} "
+                                                 f"уже использован для другого запроса")
+                logger.info(f"Replayed queued submission for idempotency key {idempotency_key}: "
+                            f"ticket {row['ticket']}")
+            await conn.commit()
+            return str(row['ticket'])
+
+    @handle_async_db_errors
+    async def drain_submissions(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Переносит до limit самых старых строк очереди в основные таблицы одной транзакцией
+        и отмечает их 'done' с ID перевала или 'failed' с ошибкой. Строки захватываются
+        FOR UPDATE SKIP LOCKED: обработчики разных процессов берут разные строки, а если
+        транзакция не завершилась, строки остаются в очереди.
+        """
+        await self.require_pool()
+
+        started = time.monotonic()
+        async with self.pool.connection() as conn, conn.transaction():
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(CLAIM_SUBMISSIONS_QUERY, (limit,))
+                rows = await cursor.fetchall()
+            if not rows:
+                return []
+            results = await self._insert_items(conn, [row['payload'] for row in rows])
+            async with conn.cursor() as cursor:
+                await cursor.execute(COMPLETE_SUBMISSIONS_QUERY, (
+                    [row['id'] for row in rows],
+                    [result['id'] for result in results],
+                    [result['error'] for result in results]
+                ))
+
+        log_bulk_throughput(results, time.monotonic() - started)
+        return [{'ticket': str(row['ticket']), 'id': result['id'], 'error': result['error'], 'age': row['age']}
+                for row, result in zip(rows, results)]
+
+    @handle_async_db_errors
+    async def get_submission(self, ticket: str) -> Optional[Dict[str, Any]]:
+        """Состояние номера очереди: queued, done (с ID перевала) или failed (с ошибкой)"""
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(SUBMISSION_STATUS_QUERY, (ticket,))
+            row = await cursor.fetchone()
+            return submission_from_row(row) if row else None
+
+    @handle_async_db_errors
+    async def purge_submissions(self) -> int:
+        """Удаляет обработанные номера очереди старше FSTR_SUBMIT_TICKET_TTL_HOURS"""
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(PURGE_SUBMISSIONS_QUERY, (self.submission_ttl_hours,))
+            await conn.commit()
+            return cursor.rowcount
+
+    @handle_async_db_errors
+    async def get_pereval_by_id(self, pereval_id: int) -> Optional[Dict[str, Any]]:
+        """Получает полные данные о перевале по ID одним запросом"""
+        # Клиент, только что изменивший данные, читает мимо кэша (см. replicas.py)
+        cached = await self.cache_call(self.cache.get, pereval_id) if READ_AFTER_LSN.get() is None else None
+        if cached is not None:
+            return cached
+
+        async def read(conn):
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(PEREVAL_DETAIL_QUERY, (pereval_id,))
+                return await cursor.fetchone()
+
+        row = await self.run_read(read)
+        if not row:
+            return None
+        pereval = pereval_from_row(row)
+        await self.cache_call(self.cache.put, pereval)
+        return pereval
+
+    @handle_async_db_errors
+    async def get_pereval_version(self, pereval_id: int) -> Optional[int]:
+        """Текущая версия перевала (для ETag) без чтения всей карточки"""
+        cached = await self.cache_call(self.cache.get, pereval_id) if READ_AFTER_LSN.get() is None else None
+        if cached is not None and 'version' in cached:
+            return cached['version']
+
+        async def read(conn):
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(PEREVAL_VERSION_QUERY, (pereval_id,))
+                return await cursor.fetchone()
+
+        row = await self.run_read(read)
+        return row['version'] if row else None
+
+    @handle_async_db_errors
+    async def update_pereval(self, pereval_id: int, pereval_data: Dict[str, Any],
+                             images_data: Optional[List[Dict[str, Any]]] = None,
+                             activities: Optional[List[int]] = None,
+                             expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        Частично обновляет перевал, если статус 'new'. Возвращает новую версию записи.
+        Пишутся только изменившиеся строки; совпадающие изображения и виды деятельности
+        остаются как есть. С expected_version (If-Match) изменение отклоняется,
+        если запись уже изменили.
+        """
+        if activities is not None:
+            self.activity_types.check(activities)
+        await self.require_pool()
+
+        try:
+            async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(PEREVAL_LOCK_QUERY, (pereval_id,))
+                row = await cursor.fetchone()
+                if not row:
+                    return None
+
+                if expected_version is not None and row['version'] != expected_version:
+                    raise PerevalVersionMismatch(f"Перевал {pereval_id} изменён: версия {row['version']}, "
+                                                 f"ожидалась {expected_version}")
+
+                if row['status'] != 'new':
+                    raise ValueError("Редактирование возможно только для записей со статусом 'new'")
+
+                plan = pereval_update_plan(row, pereval_data, images_data, activities)
+                if not plan['changed']:
+                    return row['version']
+
+                coords_id, level_id = row['coords_id'], row['level_id']
+                if plan['coords']:
+                    await cursor.execute(INTERN_COORDS_QUERY, plan['coords'])
+                    coords_id = (await cursor.fetchone())['id']
+                if plan['level']:
+                    await cursor.execute(INTERN_LEVEL_QUERY, plan['level'])
+                    level_id = (await cursor.fetchone())['id']
+                if plan['delete_images']:
+                    await cursor.execute(DELETE_IMAGES_QUERY, (pereval_id, plan['delete_images']))
+                if plan['insert_images']:
+                    await cursor.execute(INSERT_IMAGES_QUERY, (
+                        pereval_id,
+                        [image['title'] for image in plan['insert_images']],
+                        [image['img_url'] for image in plan['insert_images']]
+                    ))
+                if plan['delete_activities']:
+                    await cursor.execute(DELETE_ACTIVITIES_QUERY, (pereval_id, plan['delete_activities']))
+                if plan['insert_activities']:
+                    await cursor.execute(INSERT_ACTIVITIES_QUERY, (pereval_id, plan['insert_activities']))
+
+                # Основная строка обновляется всегда: триггер увеличивает версию
+                await cursor.execute(UPDATE_PEREVAL_QUERY, {**plan['pereval'], 'coords_id': coords_id,
+                                                            'level_id': level_id, 'id': pereval_id})
+                new_version = (await cursor.fetchone())['version']
+
+                await conn.commit()
+                await self.invalidate_cache(pereval_id)
+                return new_version
+
+        except CLIENT_ERRORS:
+            raise
+        except Exception as e:
+            logger.error(f"Error updating pereval {pereval_id}: {e}")
+            raise
+
+    @handle_async_db_errors
+    async def get_perevals_by_email(self, email: str, limit: int = USER_PEREVALS_DEFAULT_LIMIT,
+                                    status: Optional[str] = None,
+                                    cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Страница перевалов пользователя по email, от новых к старым"""
+        query, params = build_user_perevals_query(email, limit, status, cursor)
+
+        async def read(conn):
+            async with conn.cursor(row_factory=dict_row) as db_cursor:
+                await db_cursor.execute(query, params)
+                return await db_cursor.fetchall()
+
+        return user_perevals_page(await self.run_read(read), limit)
+
+    @handle_async_db_errors
+    async def search_perevals(self, query: str, limit: int = SEARCH_DEFAULT_LIMIT,
+                              status: Optional[str] = None,
+                              cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Поиск по названиям с учётом опечаток и транслитерации, от лучших совпадений"""
+        sql, params = build_search_query(query, limit, status, cursor)
+
+        async def read(conn):
+            async with conn.cursor(row_factory=dict_row) as db_cursor:
+                await db_cursor.execute(SET_SIMILARITY_THRESHOLD_QUERY, (str(SEARCH_SIMILARITY_THRESHOLD),))
+                await db_cursor.execute(sql, params)
+                return await db_cursor.fetchall()
+
+        return search_page(await self.run_read(read), limit)
+
+    @handle_async_db_errors
+    async def get_stats(self, status: Optional[str] = None) -> Dict[str, Any]:
+        """Число перевалов по статусам, категориям трудности и видам деятельности (из счётчиков)"""
+        async def read(conn):
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(STATS_QUERY)
+                return await cursor.fetchall()
+
+        titles = {item['id']: item['title'] for item in self.activity_types.items()}
+        return stats_from_rows(await self.run_read(read), titles, status)
+
+    @handle_async_db_errors
+    async def get_user_stats(self, email: str) -> Dict[str, Any]:
+        """Число перевалов пользователя по статусам (из счётчиков)"""
+        async def read(conn):
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(USER_STATS_QUERY, (email,))
+                return await cursor.fetchall()
+
+        return user_stats_from_rows(email, await self.run_read(read))
+
+    @handle_async_db_errors
+    async def add_pending_image(self, pereval_id: int, title: str, img_url: str = '') -> Optional[int]:
+        """
+        Создаёт строку изображения со статусом обработки 'pending' и возвращает её ID.
+        Как и редактирование, доступно только для перевалов со статусом 'new'.
+        """
+        await self.require_pool()
+
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(PEREVAL_STATUS_LOCK_QUERY, (pereval_id,))
+            row = await cursor.fetchone()
+            if not row:
+                return None
+            if row['status'] != 'new':
+                raise ValueError("Добавлять изображения можно только к записям со статусом 'new'")
+            await cursor.execute(INSERT_PENDING_IMAGE_QUERY, (pereval_id, title, img_url))
+            image_id = (await cursor.fetchone())['id']
+            await cursor.execute(BUMP_PEREVAL_VERSION_QUERY, (pereval_id,))
+            await conn.commit()
+
+        await self.invalidate_cache(pereval_id)
+        return image_id
+
+    @handle_async_db_errors
+    async def get_pending_images(self, claim_timeout: float) -> List[Dict[str, Any]]:
+        """
+        Закрепляет за процессом изображения, обработка которых не завершилась (например,
+        из-за перезапуска) и которые не обрабатывает другой процесс
+        """
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(PENDING_IMAGES_QUERY, (claim_timeout,))
+            return sorted(await cursor.fetchall(), key=lambda row: row['id'])
+
+    @handle_async_db_errors
+    async def refresh_image_claims(self, image_ids: List[int]):
+        """Продлевает закрепление изображений за процессом, чтобы их не забрал другой процесс"""
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor() as cursor:
+            await cursor.execute(REFRESH_IMAGE_CLAIMS_QUERY, (image_ids,))
+            await conn.commit()
+
+    @handle_async_db_errors
+    async def set_image_processed(self, image_id: int, result: Dict[str, Any]):
+        """Записывает хеш, размеры и превью обработанного изображения"""
+        await self._finish_image(SET_IMAGE_PROCESSED_QUERY, {**result, 'id': image_id})
+
+    @handle_async_db_errors
+    async def set_image_failed(self, image_id: int, error: str):
+        await self._finish_image(SET_IMAGE_FAILED_QUERY, {'id': image_id, 'error': error})
+
+    async def _finish_image(self, query: Statement, params: Dict[str, Any]):
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(query, params)
+            row = await cursor.fetchone()
+            await conn.commit()
+        if row:
+            await self.invalidate_cache(row['id'])
+
+    @handle_async_db_errors
+    async def load_activity_types(self) -> int:
+        """Перечитывает справочник видов деятельности в память"""
+        await self.require_pool()
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(ACTIVITY_TYPES_QUERY)
+            rows = await cursor.fetchall()
+        self.activity_types.replace((row['id'], row['title']) for row in rows)
+        return len(rows)
+
+    async def watch_reference_data(self):
+        """
+        Фоновая задача: перечитывает справочники по NOTIFY reference_changed, а если уведомлений нет —
+        раз в reference_refresh_seconds. Для LISTEN держит отдельное соединение вне пула.
+        """
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.conninfo(), autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {REFERENCE_CHANNEL}")
+                    while True:
+                        async for notify in conn.notifies(timeout=self.reference_refresh_seconds, stop_after=1):
+                            logger.info(f"Reference data changed: {notify.payload}")
+                        count = await self.load_activity_types()
+                        logger.debug(f"Reloaded {count} activity types")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Reference data listener failed: {e}, retrying in "
+                               f"{self.reference_refresh_seconds} s")
+                await asyncio.sleep(self.reference_refresh_seconds)
+
+    @handle_async_db_errors
+    async def get_moderation_queue(self, status: str = 'new', limit: int = USER_PEREVALS_DEFAULT_LIMIT,
+                                   cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Страница очереди модерации, от старых записей к новым"""
+        query, params = build_moderation_queue_query(status, limit, cursor)
+        await self.require_pool()
+
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as db_cursor:
+            await db_cursor.execute(query, params)
+            return user_perevals_page(await db_cursor.fetchall(), limit)
+
+    @handle_async_db_errors
+    async def claim_for_moderation(self, moderator: str, limit: int) -> List[Dict[str, Any]]:
+        """
+        Переводит до limit самых старых записей 'new' в 'pending' за модератором.
+        Параллельные вызовы не ждут друг друга и получают разные записи.
+        """
+        await self.require_pool()
+
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(CLAIM_MODERATION_QUERY, {'moderator': moderator, 'limit': limit})
+            rows = await cursor.fetchall()
+            await conn.commit()
+
+        await self.invalidate_cache(*(row['id'] for row in rows))
+        rows.sort(key=lambda row: (row['date_added'], row['id']))
+        return [short_info_from_row(row) for row in rows]
+
+    @handle_async_db_errors
+    async def set_perevals_status(self, pereval_ids: List[int], status: str,
+                                  moderator: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Меняет статус пачки перевалов одним запросом. Запрещённые переходы не применяются,
+        для них возвращается ошибка; остальные ID обновляются.
+        """
+        await self.require_pool()
+
+        async with self.pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(SET_PEREVALS_STATUS_QUERY,
+                                 {'ids': pereval_ids, 'status': status, 'moderator': moderator})
+            rows = await cursor.fetchall()
+            await conn.commit()
+
+        results = moderation_results(rows, status)
+        await self.invalidate_cache(*(result['id'] for result in results if result['updated']))
+        logger.info(f"Status {status} set for {sum(r['updated'] for r in results)}/{len(results)} perevals")
+        return results
+
+    async def iter_perevals_in_bbox(self, south: float, west: float, north: float, east: float,
+                                    limit: int) -> AsyncIterator[Dict[str, Any]]:
+        """Потоково отдаёт краткие карточки перевалов внутри прямоугольника"""
+        pool = await self.read_pool()
+
+        query, params = build_bbox_query(south, west, north, east, limit)
+        try:
+            async with pool.connection() as conn, conn.cursor(row_factory=dict_row) as cursor:
+                async for row in cursor.stream(query, params):
+                    yield geo_summary_from_row(row)
+        except psycopg.Error as e:
+            logger.error(f"Database error in iter_perevals_in_bbox: {e}")
+            raise
+
+    @handle_async_db_errors
+    async def get_nearest_perevals(self, latitude: float, longitude: float,
+                                   limit: int) -> List[Dict[str, Any]]:
+        """Ближайшие к точке перевалы с расстоянием в километрах"""
+        async def read(conn):
+            async with conn.cursor(row_factory=dict_row) as cursor:
+                await cursor.execute(PEREVALS_NEAREST_QUERY, nearest_query_params(latitude, longitude, limit))
+                return await cursor.fetchall()
+
+        return rank_nearest(await self.run_read(read), latitude, longitude, limit)
+
+    async def iter_export_records(self, status: Optional[str] = None, date_from: Optional[date] = None,
+                                  date_to: Optional[date] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Построчно выгружает перевалы через серверный курсор (по export_fetch_size строк)"""
+        pool = await self.read_pool()
+
+        query, params = build_export_query(status, date_from, date_to)
+        async with pool.connection() as conn, \
+                conn.cursor(name='pereval_export', row_factory=dict_row) as cursor:
+            cursor.itersize = self.export_fetch_size
+            await cursor.execute(query, params)
+            async for row in cursor:
+                yield export_record_from_row(row)
@@ -0,0 +1,111 @@
+"""
+Автомат защиты (circuit breaker) для базы данных. После нескольких подряд ошибок соединения
+цепь размыкается: запросы сразу получают DatabaseUnavailable (503 с Retry-After), а не ждут
+таймаута подключения. Восстановление проверяет фоновая задача с экспоненциальной паузой
+(AsyncDatabaseManager.maintain_connection), запросы сами не переподключаются.
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict
+
+CLOSED = 'closed'
+OPEN = 'open'
+
+
+class DatabaseUnavailable(Exception):
+    """База недоступна или цепь разомкнута; retry_after — через сколько секунд повторить"""
+
+    def __init__(self, retry_after: float, message: str = "База данных временно недоступна"):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class CircuitBreaker:
+    """
+    Два состояния: closed — запросы идут в базу; open — запросы отклоняются до успешной
+    проверки фоновой задачей. Пауза между проверками растёт вдвое от reset_timeout
+    до max_reset_timeout.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 1.0,
+                 max_reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self._clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = reset_timeout
+        self.next_attempt_at = 0.0
+        self.opened_at = None
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN
+
+    def retry_after(self) -> float:
+        """Секунд до следующей проверки базы (для заголовка Retry-After)"""
+        return max(0.0, self.next_attempt_at - self._clock())
+
+    def check(self):
+        """Вызывается перед обращением к базе; в разомкнутом состоянии — DatabaseUnavailable"""
+        if self.state == OPEN:
+            self.rejected += 1
+            raise DatabaseUnavailable(self.retry_after())
+
+    def record_success(self):
+        """Успешный запрос сбрасывает счётчик ошибок; разомкнутую цепь замыкает только reset"""
+        if self.state == CLOSED:
+            self.failures = 0
+
+    def reset(self):
+        """База снова отвечает: цепь замыкается"""
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = self.reset_timeout
+        self.opened_at = None
+
+    def record_failure(self):
+        """Ошибка соединения: после failure_threshold подряд цепь размыкается"""
+        self.failures += 1
+        if self.state == CLOSED and self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        """Размыкает цепь сразу (например, пул не удалось открыть)"""
+        if self.state == OPEN:
+            return
+        self.state = OPEN
+        self.opened_at = self._clock()
+        self.times_opened += 1
+        self.backoff = self.reset_timeout
+        self.next_attempt_at = self.opened_at + self.backoff
+
+    def attempt_due(self) -> bool:
+        return self.state == OPEN and self._clock() >= self.next_attempt_at
+
+    def record_probe_failure(self):
+        """Неудачная проверка фоновой задачей: следующая — через вдвое большую паузу"""
+        self.backoff = min(self.backoff * 2, self.max_reset_timeout)
+        self.next_attempt_at = self._clock() + self.backoff
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected,
+            'retry_after': round(self.retry_after(), 3) if self.state == OPEN else 0,
+        }
+
+
+def create_breaker() -> CircuitBreaker:
+    """Создаёт автомат защиты по переменным окружения FSTR_DB_BREAKER_*"""
+    return CircuitBreaker(
+        failure_threshold=int(os.getenv('FSTR_DB_BREAKER_THRESHOLD', '3')),
+        reset_timeout=float(os.getenv('FSTR_DB_BREAKER_RESET', '1')),
+        max_reset_timeout=float(os.getenv('FSTR_DB_BREAKER_MAX_RESET', '30')),
+    )
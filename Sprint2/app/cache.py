@@ -0,0 +1,334 @@
+"""
+Кэш карточек перевалов перед DatabaseManager.get_pereval_by_id.
+Бэкенды: LRU в памяти процесса или общий Redis (необязательная зависимость).
+При нескольких рабочих процессах (app/server.py) нужен Redis: сброс карточки после
+изменения виден всем процессам, а не только тому, который обработал запрос.
+"""
+
+import os
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Принятые и отклонённые перевалы больше не меняются, их можно держать дольше
+FINAL_STATUSES = ('accepted', 'rejected')
+
+
+class LRUCache:
+    """Потокобезопасный LRU с ограничением размера и TTL на каждую запись"""
+
+    # Обращения не ждут сети: их можно выполнять прямо в цикле событий
+    blocking = False
+
+    def __init__(self, max_size: int = 1024, ttl: float = 30.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expired = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                # Запись не удаляем: её можно отдать через get_stale, пока база недоступна;
+                # без обращений она сама уйдёт в конец LRU и будет вытеснена
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        """Значение без проверки TTL (устаревшее тоже), счётчики не меняются"""
+        with self._lock:
+            item = self._data.get(key)
+            return item[1] if item is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'size': len(self._data),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expired': self._expired,
+            }
+
+
+class InMemoryRedis:
+    """Локальная замена клиента Redis для тестов: get/set(ex=)/delete"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._data[key] = (expires_at, value)
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class RedisCache:
+    """
+    Общий для процессов кэш поверх Redis. Без запасного кэша ошибки Redis считаются промахами;
+    с запасным (fallback) после ошибки процесс retry_interval секунд работает с ним, записи в нём
+    живут не дольше fallback_ttl. Ключи, сброшенные за это время, удаляются из Redis, когда он
+    снова отвечает, — иначе процесс прочитал бы карточку, устаревшую за время сбоя.
+    Клиент синхронный: AsyncDatabaseManager вызывает get/set/delete в потоке (blocking).
+    """
+
+    blocking = True
+
+    def __init__(self, client, prefix: str = 'fstr:', ttl: float = 30.0, fallback: Optional[LRUCache] = None,
+                 fallback_ttl: float = 5.0, retry_interval: float = 5.0):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.fallback = fallback
+        self.fallback_ttl = fallback_ttl
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+        self._fallbacks = 0
+        # Пока время меньше _down_until, запросы идут в запасной кэш
+        self._down_until = 0.0
+        self._missed_deletes = set()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _use_fallback(self) -> bool:
+        if self.fallback is None or not self._down_until:
+            return False
+        if time.monotonic() < self._down_until:
+            return True
+        return not self._recover()
+
+    def _recover(self) -> bool:
+        """Пробует Redis после паузы: удаляет ключи, сброшенные за время сбоя"""
+        with self._lock:
+            keys = list(self._missed_deletes)
+        try:
+            if keys:
+                self.client.delete(*(self.prefix + key for key in keys))
+            else:
+                self.client.get(self.prefix + 'ping')
+        except Exception:
+            self._down_until = time.monotonic() + self.retry_interval
+            return False
+        with self._lock:
+            self._missed_deletes.difference_update(keys)
+        self._down_until = 0.0
+        logger.info("Redis cache is available again")
+        return True
+
+    def _failed(self, operation: str, key: str, error: Exception):
+        self._count('_errors')
+        if self.fallback is None:
+            logger.warning(f"Cache {operation} failed for {key}: {error}")
+            return
+        if not self._down_until:
+            logger.warning(f"Cache {operation} failed for {key}: {error}; "
+                           f"using in-process cache for {self.retry_interval:g} s")
+        self._down_until = time.monotonic() + self.retry_interval
+
+    def get(self, key: str) -> Optional[Any]:
+        if self._use_fallback():
+            self._count('_fallbacks')
+            return self.fallback.get(key)
+        try:
+            raw = self.client.get(self.prefix + key)
+        except Exception as e:
+            self._failed('get', key, e)
+            raw = None
+        if raw is None:
+            self._count('_misses')
+            return None
+        self._count('_hits')
+        return json.loads(raw)
+
+    def get_stale(self, key: str) -> Optional[Any]:
+        # Redis удаляет записи по TTL сам, устаревших значений в нём нет
+        return self.fallback.get_stale(key) if self.fallback is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if self._use_fallback():
+            self.fallback.set(key, value, min(ttl, self.fallback_ttl))
+            return
+        try:
+            self.client.set(self.prefix + key, json.dumps(value, default=_json_default), ex=max(1, int(ttl)))
+        except Exception as e:
+            self._failed('set', key, e)
+
+    def delete(self, key: str):
+        if self.fallback is not None:
+            self.fallback.delete(key)
+        if self._use_fallback():
+            with self._lock:
+                self._missed_deletes.add(key)
+            return
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            self._failed('delete', key, e)
+            if self.fallback is not None:
+                with self._lock:
+                    self._missed_deletes.add(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            # Вытеснение выполняет сам Redis (maxmemory-policy), здесь его не видно
+            stats = {
+                'backend': 'redis',
+                'hits': self._hits,
+                'misses': self._misses,
+                'errors': self._errors,
+            }
+            if self.fallback is not None:
+                stats.update(fallback_active=int(self._down_until > 0), fallback_reads=self._fallbacks)
+            return stats
+
+
+class PerevalCache:
+    """Read-through кэш карточек перевалов с TTL в зависимости от статуса"""
+
+    def __init__(self, backend, ttl: float = 30.0, final_ttl: float = 3600.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.final_ttl = final_ttl
+
+    @staticmethod
+    def _key(pereval_id: int) -> str:
+        return f"pereval:{pereval_id}"
+
+    @property
+    def blocking(self) -> bool:
+        """get, put и invalidate ждут ответа по сети (Redis)"""
+        return self.backend.blocking
+
+    def get(self, pereval_id: int) -> Optional[Dict[str, Any]]:
+        return self.backend.get(self._key(pereval_id))
+
+    def get_stale(self, pereval_id: int) -> Optional[Dict[str, Any]]:
+        """Карточка с истёкшим TTL; сброшенные после изменения записи сюда не попадают"""
+        return self.backend.get_stale(self._key(pereval_id))
+
+    def put(self, pereval: Dict[str, Any]):
+        ttl = self.final_ttl if pereval.get('status') in FINAL_STATUSES else self.ttl
+        self.backend.set(self._key(pereval['id']), pereval, ttl)
+
+    def invalidate(self, *pereval_ids: int):
+        for pereval_id in pereval_ids:
+            self.backend.delete(self._key(pereval_id))
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
+
+
+class NullCache:
+    """Кэш отключён (FSTR_CACHE_BACKEND=none)"""
+
+    blocking = False
+
+    def get(self, pereval_id):
+        return None
+
+    def get_stale(self, pereval_id):
+        return None
+
+    def put(self, pereval):
+        pass
+
+    def invalidate(self, *pereval_ids):
+        pass
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+def create_cache():
+    """Создаёт кэш по переменным окружения FSTR_CACHE_*"""
+    backend_name = os.getenv('FSTR_CACHE_BACKEND', 'memory').lower()
+    ttl = float(os.getenv('FSTR_CACHE_TTL', '30'))
+    final_ttl = float(os.getenv('FSTR_CACHE_TTL_FINAL', '3600'))
+    size = int(os.getenv('FSTR_CACHE_SIZE', '1024'))
+
+    if backend_name == 'none':
+        return NullCache()
+    if backend_name == 'redis':
+        try:
+            import redis
+        except ImportError:
+            logger.error("FSTR_CACHE_BACKEND=redis requires the 'redis' package, falling back to memory")
+        else:
+            # Клиент подключается при первой команде и сам переоткрывает соединения
+            # в дочернем процессе, поэтому его можно создать до fork рабочих процессов
+            client = redis.Redis.from_url(os.getenv('FSTR_CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+                                          socket_timeout=0.1, socket_connect_timeout=0.1)
+            fallback = None
+            if os.getenv('FSTR_CACHE_FALLBACK', 'true').lower() in ('1', 'true', 'yes'):
+                fallback = LRUCache(size, ttl)
+            return PerevalCache(RedisCache(client, ttl=ttl, fallback=fallback,
+                                           fallback_ttl=float(os.getenv('FSTR_CACHE_FALLBACK_TTL', '5')),
+                                           retry_interval=float(os.getenv('FSTR_CACHE_RETRY_INTERVAL', '5'))),
+                                ttl, final_ttl)
+
+    return PerevalCache(LRUCache(size, ttl), ttl, final_ttl)
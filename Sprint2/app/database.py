@@ -1,9 +1,21 @@
 import os
+import json
+import time
+import base64
+import hashlib
 import logging
 import psycopg2
-from psycopg2 import sql, extras
-from typing import Dict, Any, List, Optional
-from functools import wraps
+from psycopg2 import extras
+from datetime import date, datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from functools import partial, wraps
+from pool import ConnectionPool
+from cache import create_cache
+from geo import split_bbox, haversine_km, NEAREST_CANDIDATES_FACTOR
+from search import query_variants, build_tsquery, encode_search_cursor, decode_search_cursor
+from metrics import track_db_method, record_query, record_pool_wait
+from reference import ActivityTypes
+from queries import statement, check_columns
 
 # Настройка логирования (как в задании)
 logger = logging.getLogger(__name__)
@@ -18,18 +30,883 @@ def handle_db_errors(func):
     @wraps(func)
     def wrapper(self, *args, **kwargs):
         try:
-            return func(self, *args, **kwargs)
+            with track_db_method(func.__name__):
+                return func(self, *args, **kwargs)
         except psycopg2.Error as e:
+            # Откат выполняет пул при возврате соединения,
+            # поэтому ошибка затрагивает только текущий запрос
             logger.error(f"Database error in {func.__name__}: {e}")
-            if self.conn:
-                self.conn.rollback()
+            raise
+        except CLIENT_ERRORS as e:
+            logger.debug(f"{func.__name__} rejected the request: {e}")
             raise
         except Exception as e:
             logger.error(f"Unexpected error in {func.__name__}: {e}")
             raise
     return wrapper
 
-class DatabaseManager:
+
+class QueryTimingMixin:
+    """Замеряет каждый execute курсора для метрик и журнала медленных запросов"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        finally:
+            record_query(query, time.perf_counter() - started)
+        check_columns(query, self.description)
+        return result
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            record_query(query, time.perf_counter() - started)
+
+
+class InstrumentedCursor(QueryTimingMixin, psycopg2.extensions.cursor):
+    pass
+
+
+class InstrumentedRealDictCursor(QueryTimingMixin, extras.RealDictCursor):
+    pass
+
+# Полная карточка перевала за один запрос: изображения и виды деятельности
+# собираются в JSON-массивы коррелированными подзапросами, чтобы не размножать строки
+PEREVAL_RECORD_SELECT = """
+    SELECT pa.id, pa.date_added, pa.status, pa.version, pa.beauty_title, pa.title, pa.other_titles,
+           pa.connection, u.email, u.phone, u.last_name, u.first_name, u.middle_name,
+           c.latitude, c.longitude, c.height,
+           l.winter, l.summer, l.autumn, l.spring,
+           COALESCE((SELECT json_agg(json_build_object(
+                                         'title', i.title, 'img_url', i.img_url,
+                                         'width', i.width, 'height', i.height,
+                                         'thumb_url', i.thumb_url, 'thumb_width', i.thumb_width,
+                                         'thumb_height', i.thumb_height,
+                                         'processing_status', i.processing_status)
+                                     ORDER BY i.id)
+                     FROM pereval_images i
+                     WHERE i.pereval_id = pa.id), '[]'::json) AS images,
+           COALESCE((SELECT json_agg(a.activity_id ORDER BY a.activity_id)
+                     FROM pereval_activities a
+                     WHERE a.pereval_id = pa.id), '[]'::json) AS activities
+    FROM pereval_added pa
+    JOIN users u ON pa.user_id = u.id
+    JOIN coords c ON pa.coords_id = c.id
+    JOIN levels l ON pa.level_id = l.id
+"""
+
+PEREVAL_RECORD_COLUMNS = (
+    'id', 'date_added', 'status', 'version', 'beauty_title', 'title', 'other_titles', 'connection',
+    'email', 'phone', 'last_name', 'first_name', 'middle_name', 'latitude', 'longitude', 'height',
+    'winter', 'summer', 'autumn', 'spring', 'images', 'activities',
+)
+
+PEREVAL_DETAIL_QUERY = statement('pereval_detail', PEREVAL_RECORD_SELECT + """
+    WHERE pa.id = %s
+""", columns=PEREVAL_RECORD_COLUMNS)
+
+
+def pereval_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Собирает ответ API из строки PEREVAL_DETAIL_QUERY (доступ к колонкам по имени)"""
+    return {
+        'id': row['id'],
+        'status': row['status'],
+        'beautyTitle': row['beauty_title'],
+        'title': row['title'],
+        'other_titles': row['other_titles'],
+        'connect': row['connection'],
+        'user': {
+            'email': row['email'],
+            'phone': row['phone'],
+            'fam': row['last_name'],
+            'name': row['first_name'],
+            'otc': row['middle_name']
+        },
+        'coords': {
+            'latitude': row['latitude'],
+            'longitude': row['longitude'],
+            'height': row['height']
+        },
+        'level': {
+            'winter': row['winter'],
+            'summer': row['summer'],
+            'autumn': row['autumn'],
+            'spring': row['spring']
+        },
+        'images': row['images'],
+        'activities': row['activities'],
+        'version': row['version']
+    }
+
+
+# Версия записи (pereval_added.version) увеличивается триггером при каждом UPDATE,
+# поэтому для If-None-Match достаточно прочитать одну колонку по первичному ключу
+PEREVAL_VERSION_QUERY = statement('pereval_version', """
+    SELECT version FROM pereval_added WHERE id = %s
+""", columns=('version',))
+
+# Перед редактированием строка блокируется одним запросом, который заодно читает
+# текущие значения: статус, версия и разница с PATCH проверяются в той же транзакции
+PEREVAL_LOCK_QUERY = statement('pereval_lock', """
+    SELECT pa.status, pa.version, pa.coords_id, pa.level_id,
+           pa.beauty_title, pa.title, pa.other_titles, pa.connection,
+           c.latitude, c.longitude, c.height,
+           l.winter, l.summer, l.autumn, l.spring,
+           COALESCE((SELECT json_agg(json_build_object('id', i.id, 'title', i.title, 'img_url', i.img_url)
+                                     ORDER BY i.id)
+                     FROM pereval_images i
+                     WHERE i.pereval_id = pa.id), '[]'::json) AS images,
+           COALESCE((SELECT json_agg(a.activity_id ORDER BY a.activity_id)
+                     FROM pereval_activities a
+                     WHERE a.pereval_id = pa.id), '[]'::json) AS activities
+    FROM pereval_added pa
+    JOIN coords c ON pa.coords_id = c.id
+    JOIN levels l ON pa.level_id = l.id
+    WHERE pa.id = %s
+    FOR UPDATE OF pa
+""", columns=('status', 'version', 'coords_id', 'level_id', 'beauty_title', 'title',
+              'other_titles', 'connection', 'latitude', 'longitude', 'height',
+              'winter', 'summer', 'autumn', 'spring', 'images', 'activities'))
+
+# Одинаковые координаты и уровни сложности хранятся одной строкой (intern_coords, intern_level,
+# sql/migrations/0002): при правке перевал переключается на строку с новыми значениями,
+# а строку, на которую могут ссылаться другие перевалы, не меняет
+INTERN_COORDS_QUERY = statement('intern_coords', """
+    SELECT intern_coords(%(latitude)s::numeric, %(longitude)s::numeric, %(height)s::int) AS id
+""", columns=('id',))
+
+INTERN_LEVEL_QUERY = statement('intern_level', """
+    SELECT intern_level(%(winter)s::text, %(summer)s::text, %(autumn)s::text, %(spring)s::text) AS id
+""", columns=('id',))
+
+# Выполняется при любом изменении, в том числе только дочерних строк, чтобы триггер увеличил версию
+UPDATE_PEREVAL_QUERY = statement('update_pereval', """
+    UPDATE pereval_added
+    SET beauty_title = %(beauty_title)s, title = %(title)s,
+        other_titles = %(other_titles)s, connection = %(connection)s,
+        coords_id = %(coords_id)s, level_id = %(level_id)s
+    WHERE id = %(id)s
+    RETURNING version
+""", columns=('version',))
+
+DELETE_IMAGES_QUERY = statement('delete_images', """
+    DELETE FROM pereval_images WHERE pereval_id = %s AND id = ANY(%s)
+""")
+
+# Ссылки http(s) получают статус 'pending' без закрепления: их подбирает ImageIngestor
+# любого рабочего процесса (app/images.py), остальные значения хранятся как есть ('none')
+INSERT_IMAGES_QUERY = statement('insert_images', """
+    INSERT INTO pereval_images (pereval_id, title, img_url, processing_status)
+    SELECT %s, t.title, t.img_url, CASE WHEN t.img_url ~ '^https?://' THEN 'pending' ELSE 'none' END
+    FROM unnest(%s::text[], %s::text[]) WITH ORDINALITY AS t(title, img_url, ord)
+    ORDER BY t.ord
+""")
+
+DELETE_ACTIVITIES_QUERY = statement('delete_activities', """
+    DELETE FROM pereval_activities WHERE pereval_id = %s AND activity_id = ANY(%s)
+""")
+
+INSERT_ACTIVITIES_QUERY = statement('insert_activities', """
+    INSERT INTO pereval_activities (pereval_id, activity_id)
+    SELECT %s, unnest(%s::int[])
+""")
+
+# Поля PATCH -> колонки pereval_added
+PEREVAL_UPDATE_COLUMNS = {
+    'beautyTitle': 'beauty_title',
+    'title': 'title',
+    'other_titles': 'other_titles',
+    'connect': 'connection',
+}
+
+
+def pereval_update_plan(row: Dict[str, Any], pereval_data: Dict[str, Any],
+                        images_data: Optional[List[Dict[str, Any]]] = None,
+                        activities: Optional[List[int]] = None) -> Dict[str, Any]:
+    """
+    Сравнивает заблокированную строку PEREVAL_LOCK_QUERY с PATCH.
+    В pereval_data только переданные поля; images_data/activities равны None, если не переданы.
+    Возвращает новые значения строк (None, если строка не меняется) и какие дочерние строки
+    удалить и добавить: совпадающие изображения и виды деятельности не трогаются.
+    """
+    pereval = {column: row[column] for column in PEREVAL_UPDATE_COLUMNS.values()}
+    for field, column in PEREVAL_UPDATE_COLUMNS.items():
+        if field in pereval_data:
+            pereval[column] = pereval_data[field]
+    pereval_changed = any(pereval[column] != row[column] for column in pereval)
+
+    coords = None
+    new_coords = pereval_data.get('coords')
+    if new_coords:
+        # NUMERIC(9,6) в базе: сравниваем с тем, что в неё будет записано
+        if (round(float(new_coords['latitude']), 6) != float(row['latitude'])
+                or round(float(new_coords['longitude']), 6) != float(row['longitude'])
+                or new_coords['height'] != row['height']):
+            coords = {'latitude': new_coords['latitude'], 'longitude': new_coords['longitude'],
+                      'height': new_coords['height']}
+
+    level = None
+    new_level = pereval_data.get('level')
+    if new_level:
+        merged = {season: new_level.get(season, row[season])
+                  for season in ('winter', 'summer', 'autumn', 'spring')}
+        if any(merged[season] != row[season] for season in merged):
+            level = merged
+
+    delete_images, insert_images = [], []
+    if images_data is not None:
+        # Изображения сравниваются как мультимножество пар (title, img_url)
+        existing = {}
+        for image in row['images']:
+            existing.setdefault((image['title'], image['img_url']), []).append(image['id'])
+        for image in images_data:
+            ids = existing.get((image['title'], image['img_url']))
+            if ids:
+                ids.pop(0)
+            else:
+                insert_images.append(image)
+        delete_images = sorted(image_id for ids in existing.values() for image_id in ids)
+
+    delete_activities, insert_activities = [], []
+    if activities is not None:
+        current, requested = set(row['activities']), set(activities)
+        delete_activities = sorted(current - requested)
+        insert_activities = sorted(requested - current)
+
+    return {
+        'changed': bool(pereval_changed or coords or level or delete_images or insert_images
+                        or delete_activities or insert_activities),
+        'pereval': pereval,
+        'coords': coords,
+        'level': level,
+        'delete_images': delete_images,
+        'insert_images': insert_images,
+        'delete_activities': delete_activities,
+        'insert_activities': insert_activities,
+    }
+
+
+class PerevalVersionMismatch(Exception):
+    """Запись изменилась с тех пор, как клиент её прочитал (If-Match)"""
+
+
+def pereval_etag(pereval_id: int, version: int) -> str:
+    return f'"{pereval_id}-{version}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Сравнение для If-None-Match: список ETag через запятую или '*', префикс W/ не учитывается"""
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or candidate.removeprefix('W/') == etag:
+            return True
+    return False
+
+
+def etag_version(header: str, pereval_id: int) -> Optional[int]:
+    """Версия из If-Match: None для '*', PerevalVersionMismatch для чужого или неразборчивого ETag"""
+    header = header.strip()
+    if header == '*':
+        return None
+    try:
+        etag_id, version = header.strip('"').split('-')
+        if int(etag_id) != pereval_id:
+            raise ValueError
+        return int(version)
+    except ValueError:
+        raise PerevalVersionMismatch(f"ETag {header} не относится к перевалу {pereval_id}")
+
+
+# Постраничный список перевалов пользователя: keyset по (date_added, id),
+# курсор — непрозрачная строка base64 с последней выданной парой
+USER_PEREVALS_DEFAULT_LIMIT = 50
+USER_PEREVALS_MAX_LIMIT = 500
+
+
+def encode_cursor(date_added: datetime, pereval_id: int) -> str:
+    raw = f"{date_added.isoformat()}|{pereval_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Разбирает курсор; при ошибке ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date_part, id_part = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Некорректный курсор") from e
+
+
+def build_user_perevals_query(email: str, limit: int, status: Optional[str] = None,
+                              cursor: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Собирает запрос страницы; берём limit + 1 строку, чтобы понять, есть ли следующая"""
+    conditions = ["u.email = %(email)s"]
+    params = {'email': email, 'limit': limit + 1}
+    if status:
+        conditions.append("pa.status = %(status)s")
+        params['status'] = status
+    if cursor:
+        params['cursor_date'], params['cursor_id'] = decode_cursor(cursor)
+        conditions.append("(pa.date_added, pa.id) < (%(cursor_date)s, %(cursor_id)s)")
+    query = f"""
+        SELECT pa.id, pa.title, pa.status, pa.date_added
+        FROM pereval_added pa
+        JOIN users u ON pa.user_id = u.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY pa.date_added DESC, pa.id DESC
+        LIMIT %(limit)s
+    """
+    return query, params
+
+
+def short_info_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'status': row['status'],
+        'date_added': row['date_added'].isoformat() if row['date_added'] else None
+    }
+
+
+def user_perevals_page(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """Превращает строки запроса в страницу ответа с next_cursor"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last['date_added'], last['id'])
+    return {
+        'perevals': [short_info_from_row(row) for row in rows],
+        'next_cursor': next_cursor
+    }
+
+
+# Очередь модерации: от старых к новым, keyset по (date_added, id).
+# Частичный индекс idx_pereval_moderation_queue покрывает только статусы new и pending
+MODERATION_QUEUE_STATUSES = ('new', 'pending')
+MODERATION_MAX_BATCH = 500
+
+
+def build_moderation_queue_query(status: str, limit: int,
+                                 cursor: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Страница очереди модерации; как и список пользователя, берём limit + 1 строку"""
+    if status not in MODERATION_QUEUE_STATUSES:
+        raise ValueError(f"Очередь модерации есть только для статусов {', '.join(MODERATION_QUEUE_STATUSES)}")
+    conditions = ["pa.status = %(status)s"]
+    params = {'status': status, 'limit': limit + 1}
+    if cursor:
+        params['cursor_date'], params['cursor_id'] = decode_cursor(cursor)
+        conditions.append("(pa.date_added, pa.id) > (%(cursor_date)s, %(cursor_id)s)")
+    query = f"""
+        SELECT pa.id, pa.title, pa.status, pa.date_added
+        FROM pereval_added pa
+        WHERE {' AND '.join(conditions)}
+        ORDER BY pa.date_added, pa.id
+        LIMIT %(limit)s
+    """
+    return query, params
+
+
+# Модератор забирает самые старые новые записи: занятые другим модератором строки
+# пропускаются (SKIP LOCKED), поэтому параллельные вызовы получают непересекающиеся пачки
+CLAIM_MODERATION_QUERY = statement('claim_moderation', """
+    WITH claimed AS (
+        SELECT id
+        FROM pereval_added
+        WHERE status = 'new'
+        ORDER BY date_added, id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE pereval_added pa
+    SET status = 'pending', moderated_by = %(moderator)s, status_changed_at = now()
+    FROM claimed
+    WHERE pa.id = claimed.id
+    RETURNING pa.id, pa.title, pa.status, pa.date_added
+""", columns=('id', 'title', 'status', 'date_added'))
+
+# Смена статуса пачки одним запросом. Разрешённые переходы — таблица pereval_status_transitions
+# (её же проверяет триггер на pereval_added), строки с запрещённым переходом не обновляются.
+# cur видит статусы до обновления, по ним объясняется отказ
+SET_PEREVALS_STATUS_QUERY = statement('set_perevals_status', """
+    WITH requested AS (
+        SELECT DISTINCT unnest(%(ids)s::int[]) AS id
+    ),
+    updated AS (
+        UPDATE pereval_added pa
+        SET status = %(status)s,
+            moderated_by = COALESCE(%(moderator)s, pa.moderated_by),
+            status_changed_at = now()
+        FROM pereval_status_transitions t
+        WHERE pa.id IN (SELECT id FROM requested)
+          AND t.from_status = pa.status
+          AND t.to_status = %(status)s
+        RETURNING pa.id, pa.version
+    )
+    SELECT r.id, u.version, cur.status AS previous_status
+    FROM requested r
+    LEFT JOIN updated u ON u.id = r.id
+    LEFT JOIN pereval_added cur ON cur.id = r.id
+    ORDER BY r.id
+""", columns=('id', 'version', 'previous_status'))
+
+
+def moderation_results(rows: List[Dict[str, Any]], status: str) -> List[Dict[str, Any]]:
+    """Результат по каждому ID из SET_PEREVALS_STATUS_QUERY: обновлён или почему нет"""
+    results = []
+    for row in rows:
+        if row['version'] is not None:
+            results.append({'id': row['id'], 'status': status, 'updated': True, 'error': None})
+        elif row['previous_status'] is None:
+            results.append({'id': row['id'], 'status': None, 'updated': False,
+                            'error': "Перевал не найден"})
+        else:
+            results.append({'id': row['id'], 'status': row['previous_status'], 'updated': False,
+                            'error': f"Переход {row['previous_status']} -> {status} запрещён"})
+    return results
+
+
+# Пакетная вставка перевалов одним запросом: данные передаются массивами (unnest),
+# ID перевалов берутся из последовательности заранее, координаты и уровни сложности
+# находятся или добавляются intern_coords/intern_level, поэтому все таблицы заполняются
+# цепочкой CTE без промежуточных обращений к базе
+BULK_MAX_ITEMS = 500
+
+BULK_INSERT_QUERY = statement('bulk_insert', """
+    WITH input AS (
+        SELECT *
+        FROM unnest(%(email)s::text[], %(phone)s::text[], %(last_name)s::text[],
+                    %(first_name)s::text[], %(middle_name)s::text[],
+                    %(latitude)s::numeric[], %(longitude)s::numeric[], %(height)s::int[],
+                    %(winter)s::text[], %(summer)s::text[], %(autumn)s::text[], %(spring)s::text[],
+                    %(beauty_title)s::text[], %(title)s::text[], %(other_titles)s::text[],
+                    %(connection)s::text[])
+             WITH ORDINALITY AS t(email, phone, last_name, first_name, middle_name,
+                                  latitude, longitude, height, winter, summer, autumn, spring,
+                                  beauty_title, title, other_titles, connection, ord)
+    ),
+    user_ids AS (
+        INSERT INTO users (email, phone, last_name, first_name, middle_name)
+        SELECT DISTINCT ON (email) email, phone, last_name, first_name, middle_name
+        FROM input
+        ORDER BY email, ord DESC
+        -- Известный пользователь получает контакты и ФИО из последней отправки
+        ON CONFLICT (email) DO UPDATE SET phone = EXCLUDED.phone, last_name = EXCLUDED.last_name,
+                                          first_name = EXCLUDED.first_name, middle_name = EXCLUDED.middle_name
+        RETURNING id, email
+    ),
+    ids AS (
+        SELECT ord,
+               intern_coords(latitude, longitude, height) AS coords_id,
+               intern_level(winter, summer, autumn, spring) AS level_id,
+               nextval(pg_get_serial_sequence('pereval_added', 'id')) AS pereval_id
+        FROM input
+    ),
+    new_perevals AS (
+        INSERT INTO pereval_added (id, beauty_title, title, other_titles, connection,
+                                   user_id, coords_id, level_id, status)
+        SELECT ids.pereval_id, input.beauty_title, input.title, input.other_titles, input.connection,
+               user_ids.id, ids.coords_id, ids.level_id, 'new'
+        FROM input
+        JOIN ids USING (ord)
+        JOIN user_ids USING (email)
+    ),
+    new_images AS (
+        INSERT INTO pereval_images (pereval_id, title, img_url, processing_status)
+        SELECT ids.pereval_id, img.title, img.img_url,
+               CASE WHEN img.img_url ~ '^https?://' THEN 'pending' ELSE 'none' END
+        FROM unnest(%(img_ord)s::bigint[], %(img_title)s::text[], %(img_url)s::text[])
+             AS img(ord, title, img_url)
+        JOIN ids USING (ord)
+    ),
+    new_activities AS (
+        INSERT INTO pereval_activities (pereval_id, activity_id)
+        SELECT ids.pereval_id, act.activity_id
+        FROM unnest(%(act_ord)s::bigint[], %(act_id)s::int[]) AS act(ord, activity_id)
+        JOIN ids USING (ord)
+    )
+    SELECT ord, pereval_id FROM ids ORDER BY ord
+""", columns=('ord', 'pereval_id'))
+
+
+def bulk_insert_params(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Раскладывает список запросов PerevalSubmitRequest (в виде dict) по массивам колонок"""
+    columns = ('email', 'phone', 'last_name', 'first_name', 'middle_name',
+               'latitude', 'longitude', 'height', 'winter', 'summer', 'autumn', 'spring',
+               'beauty_title', 'title', 'other_titles', 'connection',
+               'img_ord', 'img_title', 'img_url', 'act_ord', 'act_id')
+    params = {column: [] for column in columns}
+    for ord_, item in enumerate(items, start=1):
+        data = item['data']
+        user, coords, level = data['user'], data['coords'], data['level']
+        params['email'].append(user['email'])
+        params['phone'].append(user['phone'])
+        params['last_name'].append(user['fam'])
+        params['first_name'].append(user['name'])
+        params['middle_name'].append(user.get('otc'))
+        params['latitude'].append(coords['latitude'])
+        params['longitude'].append(coords['longitude'])
+        params['height'].append(coords['height'])
+        for season in ('winter', 'summer', 'autumn', 'spring'):
+            params[season].append(level.get(season, ''))
+        params['beauty_title'].append(data['beautyTitle'])
+        params['title'].append(data['title'])
+        params['other_titles'].append(data['other_titles'])
+        params['connection'].append(data['connect'])
+        for image in item['images']:
+            params['img_ord'].append(ord_)
+            params['img_title'].append(image['title'])
+            params['img_url'].append(image['img_url'])
+        # Повторы в списке нарушили бы первичный ключ pereval_activities
+        for act_id in sorted(set(item['activities'])):
+            params['act_ord'].append(ord_)
+            params['act_id'].append(act_id)
+    return params
+
+
+# Ключи идемпотентности POST /submitData/: ключ занимается в той же транзакции,
+# что и вставка перевала, поэтому повтор либо ждёт первую попытку, либо видит её результат
+CLAIM_IDEMPOTENCY_KEY_QUERY = statement('claim_idempotency_key', """
+    INSERT INTO idempotency_keys (key, request_hash)
+    VALUES (%s, %s)
+    ON CONFLICT (key) DO NOTHING
+    RETURNING key
+""", columns=('key',))
+
+GET_IDEMPOTENCY_KEY_QUERY = statement('get_idempotency_key', """
+    SELECT request_hash, pereval_id FROM idempotency_keys WHERE key = %s
+""", columns=('request_hash', 'pereval_id'))
+
+SET_IDEMPOTENCY_RESULT_QUERY = statement('set_idempotency_result', """
+    UPDATE idempotency_keys SET pereval_id = %s WHERE key = %s
+""")
+
+PURGE_IDEMPOTENCY_KEYS_QUERY = statement('purge_idempotency_keys', """
+    DELETE FROM idempotency_keys WHERE created_at < now() - make_interval(hours => %s::int)
+""")
+
+
+class IdempotencyKeyMismatch(Exception):
+    """Ключ идемпотентности уже использован для другого запроса"""
+
+
+# Ошибки в запросе клиента (ответы 400, 409, 412), а не сбои базы: декораторы
+# handle_db_errors не пишут их в журнал как ошибки и не учитывают в автомате защиты.
+# UnknownActivityTypes — подкласс ValueError
+CLIENT_ERRORS = (ValueError, PerevalVersionMismatch, IdempotencyKeyMismatch)
+
+
+def submit_request_hash(item: Dict[str, Any]) -> str:
+    payload = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def resolve_idempotency_replay(key: str, request_hash: str, stored_hash: str,
+                               pereval_id: Optional[int]) -> Optional[int]:
+    if stored_hash != request_hash:
+        raise IdempotencyKeyMismatch(f"Ключ идемпотентности {key} уже использован для другого запроса")
+    logger.info(f"Replayed submission for idempotency key {key}: pereval {pereval_id}")
+    return pereval_id
+
+
+# Геопоиск по индексу GiST на point(longitude, latitude) (см. idx_coords_point)
+PEREVALS_IN_BBOX_QUERY = """
+    SELECT pa.id, pa.title, pa.status, c.latitude, c.longitude, c.height
+    FROM coords c
+    JOIN pereval_added pa ON pa.coords_id = c.id
+    WHERE {boxes}
+    LIMIT %(limit)s
+"""
+
+PEREVALS_NEAREST_QUERY = statement('perevals_nearest', """
+    SELECT pa.id, pa.title, pa.status, c.latitude, c.longitude, c.height
+    FROM (
+        -- Координаты без перевалов (оставшиеся после редактирования) не занимают места кандидатов
+        SELECT id, latitude, longitude, height
+        FROM coords
+        WHERE EXISTS (SELECT 1 FROM pereval_added WHERE pereval_added.coords_id = coords.id)
+        ORDER BY point(longitude, latitude) <-> point(%(longitude)s, %(latitude)s)
+        LIMIT %(candidates)s
+    ) c
+    JOIN pereval_added pa ON pa.coords_id = c.id
+""", columns=('id', 'title', 'status', 'latitude', 'longitude', 'height'))
+
+
+def build_bbox_query(south: float, west: float, north: float, east: float,
+                     limit: int) -> Tuple[str, Dict[str, Any]]:
+    boxes = []
+    params = {'limit': limit}
+    for n, (box_south, box_west, box_north, box_east) in enumerate(split_bbox(south, west, north, east)):
+        boxes.append(f"point(c.longitude, c.latitude) <@ "
+                     f"box(point(%(west{n})s, %(south{n})s), point(%(east{n})s, %(north{n})s))")
+        params.update({f'south{n}': box_south, f'west{n}': box_west,
+                       f'north{n}': box_north, f'east{n}': box_east})
+    return PEREVALS_IN_BBOX_QUERY.format(boxes=' OR '.join(boxes)), params
+
+
+def nearest_query_params(latitude: float, longitude: float, limit: int) -> Dict[str, Any]:
+    return {'latitude': latitude, 'longitude': longitude,
+            'candidates': limit * NEAREST_CANDIDATES_FACTOR}
+
+
+def geo_summary_from_row(row: Dict[str, Any], distance_km: Optional[float] = None) -> Dict[str, Any]:
+    """Краткая карточка перевала для карты (формат PerevalGeoSummary)"""
+    return {
+        'id': row['id'],
+        'title': row['title'],
+        'status': row['status'],
+        'coords': {
+            'latitude': float(row['latitude']),
+            'longitude': float(row['longitude']),
+            'height': row['height']
+        },
+        'distance_km': distance_km
+    }
+
+
+def rank_nearest(rows: List[Dict[str, Any]], latitude: float, longitude: float,
+                 limit: int) -> List[Dict[str, Any]]:
+    """Пересортировывает кандидатов по расстоянию на сфере и оставляет limit ближайших"""
+    ranked = sorted(
+        ((haversine_km(latitude, longitude, float(row['latitude']), float(row['longitude'])), row)
+         for row in rows),
+        key=lambda item: item[0]
+    )
+    return [geo_summary_from_row(row, round(distance, 3)) for distance, row in ranked[:limit]]
+
+
+def build_export_query(status: Optional[str] = None, date_from: Optional[date] = None,
+                       date_to: Optional[date] = None) -> Tuple[str, Dict[str, Any]]:
+    """Выгрузка всех перевалов с фильтрами; date_from включительно, date_to не включительно"""
+    conditions = []
+    params = {}
+    if status:
+        conditions.append("pa.status = %(status)s")
+        params['status'] = status
+    if date_from:
+        conditions.append("pa.date_added >= %(date_from)s")
+        params['date_from'] = date_from
+    if date_to:
+        conditions.append("pa.date_added < %(date_to)s")
+        params['date_to'] = date_to
+    where = f"    WHERE {' AND '.join(conditions)}\n" if conditions else ""
+    return PEREVAL_RECORD_SELECT + where + "    ORDER BY pa.id\n", params
+
+
+def export_record_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Карточка перевала для выгрузки: как в API, плюс дата добавления"""
+    record = pereval_from_row(row)
+    record['date_added'] = row['date_added'].isoformat() if row['date_added'] else None
+    return record
+
+
+# Поиск по названию (app/search.py): совпадения по tsvector (idx_pereval_search_vector) или
+# по триграммам (idx_pereval_search_trgm), ранг — ts_rank плюс лучшая word_similarity по вариантам запроса.
+# Порог триграмм задаётся на транзакцию, чтобы не зависеть от настроек сервера
+SET_SIMILARITY_THRESHOLD_QUERY = statement('set_similarity_threshold', """
+    SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)
+""", columns=('set_config',))
+
+PEREVALS_SEARCH_QUERY = """
+    SELECT found.id, found.title, found.beauty_title, found.other_titles, found.status,
+           c.latitude, c.longitude, c.height, found.rank
+    FROM (
+        SELECT pa.id, pa.title, pa.beauty_title, pa.other_titles, pa.status, pa.coords_id,
+               (ts_rank(pa.search_vector, q.tsquery) + greatest({similarity}))::float8 AS rank
+        FROM pereval_added pa, to_tsquery('simple', %(tsquery)s) AS q(tsquery)
+        WHERE (pa.search_vector @@ q.tsquery OR {trigram}){status}
+    ) found
+    JOIN coords c ON c.id = found.coords_id
+    {cursor}
+    ORDER BY found.rank DESC, found.id DESC
+    LIMIT %(limit)s
+"""
+
+
+def build_search_query(query: str, limit: int, status: Optional[str] = None,
+                       cursor: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Собирает запрос страницы поиска; keyset по (rank, id), берём limit + 1 строку"""
+    variants = query_variants(query)
+    params = {'tsquery': build_tsquery(variants), 'limit': limit + 1}
+    similarity, trigram = [], []
+    for n, variant in enumerate(variants):
+        params[f'variant{n}'] = variant
+        similarity.append(f"word_similarity(%(variant{n})s, pa.search_text)")
+        trigram.append(f"pa.search_text %%> %(variant{n})s")
+    status_condition = cursor_condition = ""
+    if status:
+        params['status'] = status
+        status_condition = " AND pa.status = %(status)s"
+    if cursor:
+        params['cursor_rank'], params['cursor_id'] = decode_search_cursor(cursor)
+        cursor_condition = "WHERE (found.rank, found.id) < (%(cursor_rank)s, %(cursor_id)s)"
+    return PEREVALS_SEARCH_QUERY.format(similarity=', '.join(similarity), trigram=' OR '.join(trigram),
+                                        status=status_condition, cursor=cursor_condition), params
+
+
+def search_page(rows: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """Страница результатов поиска (формат PerevalSearchResponse) с next_cursor"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'perevals': [{
+            'id': row['id'],
+            'title': row['title'],
+            'beautyTitle': row['beauty_title'] or '',
+            'other_titles': row['other_titles'] or '',
+            'status': row['status'],
+            'coords': {
+                'latitude': float(row['latitude']),
+                'longitude': float(row['longitude']),
+                'height': row['height']
+            },
+            'rank': round(row['rank'], 4)
+        } for row in rows],
+        'next_cursor': encode_search_cursor(rows[-1]['rank'], rows[-1]['id']) if has_more else None
+    }
+
+
+# Изображения, которые обрабатываются в фоне (app/images.py): строка создаётся сразу
+# со статусом 'pending', размеры и превью дописываются после обработки
+PEREVAL_STATUS_LOCK_QUERY = statement('pereval_status_lock', """
+    SELECT status FROM pereval_added WHERE id = %s FOR UPDATE
+""", columns=('status',))
+
+INSERT_PENDING_IMAGE_QUERY = statement('insert_pending_image', """
+    INSERT INTO pereval_images (pereval_id, title, img_url, processing_status, claimed_at)
+    VALUES (%s, %s, %s, 'pending', CURRENT_TIMESTAMP)
+    RETURNING id
+""", columns=('id',))
+
+# SET version = version: значение выставит триггер, запрос только меняет ETag карточки
+BUMP_PEREVAL_VERSION_QUERY = statement('bump_pereval_version', """
+    UPDATE pereval_added SET version = version WHERE id = %s
+""")
+
+# Строка 'pending' закреплена за процессом, который её принял (claimed_at, sql/migrations/0010):
+# при нескольких рабочих процессах каждый забирает только брошенные строки — те, что
+# не закреплены или закреплены дольше claim_timeout секунд назад (процесс перезапущен)
+PENDING_IMAGES_QUERY = statement('pending_images', """
+    UPDATE pereval_images
+    SET claimed_at = CURRENT_TIMESTAMP
+    WHERE processing_status = 'pending'
+      AND (claimed_at IS NULL OR claimed_at < CURRENT_TIMESTAMP - make_interval(secs => %s))
+    RETURNING id, img_url
+""", columns=('id', 'img_url'))
+
+# Продление закрепления строк, которые процесс ещё держит в очереди или обрабатывает
+REFRESH_IMAGE_CLAIMS_QUERY = statement('refresh_image_claims', """
+    UPDATE pereval_images
+    SET claimed_at = CURRENT_TIMESTAMP
+    WHERE id = ANY(%s) AND processing_status = 'pending'
+""")
+
+SET_IMAGE_PROCESSED_QUERY = statement('set_image_processed', """
+    WITH image AS (
+        UPDATE pereval_images
+        SET img_url = COALESCE(%(img_url)s, img_url),
+            content_hash = %(content_hash)s,
+            width = %(width)s,
+            height = %(height)s,
+            thumb_url = %(thumb_url)s,
+            thumb_width = %(thumb_width)s,
+            thumb_height = %(thumb_height)s,
+            processing_status = 'ready',
+            processing_error = NULL
+        WHERE id = %(id)s
+        RETURNING pereval_id
+    )
+    UPDATE pereval_added pa SET version = pa.version
+    FROM image
+    WHERE pa.id = image.pereval_id
+    RETURNING pa.id
+""", columns=('id',))
+
+SET_IMAGE_FAILED_QUERY = statement('set_image_failed', """
+    WITH image AS (
+        UPDATE pereval_images
+        SET processing_status = 'failed', processing_error = %(error)s
+        WHERE id = %(id)s AND processing_status = 'pending'
+        RETURNING pereval_id
+    )
+    UPDATE pereval_added pa SET version = pa.version
+    FROM image
+    WHERE pa.id = image.pereval_id
+    RETURNING pa.id
+""", columns=('id',))
+
+
+# Очередь отложенной записи (FSTR_SUBMIT_MODE=queue, sql/migrations/0009): запрос сохраняется
+# одной строкой, обработчики забирают пачку FOR UPDATE SKIP LOCKED и в той же транзакции
+# добавляют перевалы и записывают результат, поэтому строка обрабатывается ровно один раз
+ENQUEUE_SUBMISSION_QUERY = statement('enqueue_submission', """
+    INSERT INTO submission_queue (ticket, payload, idempotency_key, request_hash)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+    RETURNING ticket
+""", columns=('ticket',))
+
+GET_SUBMISSION_BY_KEY_QUERY = statement('get_submission_by_key', """
+    SELECT ticket, request_hash FROM submission_queue WHERE idempotency_key = %s
+""", columns=('ticket', 'request_hash'))
+
+CLAIM_SUBMISSIONS_QUERY = statement('claim_submissions', """
+    SELECT id, ticket, payload, EXTRACT(EPOCH FROM LOCALTIMESTAMP - created_at)::float AS age
+    FROM submission_queue
+    WHERE status = 'queued'
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+""", columns=('id', 'ticket', 'payload', 'age'))
+
+COMPLETE_SUBMISSIONS_QUERY = statement('complete_submissions', """
+    UPDATE submission_queue q
+    SET status = CASE WHEN r.pereval_id IS NULL THEN 'failed' ELSE 'done' END,
+        pereval_id = r.pereval_id,
+        error = r.error,
+        processed_at = CURRENT_TIMESTAMP
+    FROM unnest(%s::bigint[], %s::int[], %s::text[]) AS r(id, pereval_id, error)
+    WHERE q.id = r.id
+""")
+
+SUBMISSION_STATUS_QUERY = statement('submission_status', """
+    SELECT ticket, status, pereval_id, error, created_at, processed_at
+    FROM submission_queue
+    WHERE ticket = %s::uuid
+""", columns=('ticket', 'status', 'pereval_id', 'error', 'created_at', 'processed_at'))
+
+PURGE_SUBMISSIONS_QUERY = statement('purge_submissions', """
+    DELETE FROM submission_queue
+    WHERE status <> 'queued' AND processed_at < now() - make_interval(hours => %s::int)
+""")
+
+
+def submission_from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Состояние номера очереди для GET /submitData/tickets/{ticket}/"""
+    return {
+        'ticket': str(row['ticket']),
+        'status': row['status'],
+        'id': row['pereval_id'],
+        'error': row['error'],
+        'created_at': row['created_at'],
+        'processed_at': row['processed_at'],
+    }
+
+
+def log_bulk_throughput(results: List[Dict[str, Any]], elapsed: float):
+    added = sum(1 for result in results if result['id'] is not None)
+    rate = added / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Bulk inserted {added}/{len(results)} perevals in {elapsed:.3f}s ({rate:.0f} passes/s)")
+
+
+class DatabaseSettings:
+    """Параметры подключения и пула, общие для синхронного и асинхронного менеджеров"""
+
     def __init__(self):
         # Получаем параметры подключения из переменных окружения (как требовалось)
         self.db_host = os.getenv('FSTR_DB_HOST', 'localhost')
@@ -37,288 +914,320 @@ class DatabaseManager:
         self.db_login = os.getenv('FSTR_DB_LOGIN', 'postgres')
         self.db_pass = os.getenv('FSTR_DB_PASS', 'password')
         self.db_name = os.getenv('FSTR_DB_NAME', 'pereval')
-        self.conn = None
 
-    # Остальные методы (connect, close) оставляем без изменений
+        # Параметры пула соединений
+        self.pool_min = int(os.getenv('FSTR_DB_POOL_MIN', '1'))
+        self.pool_max = int(os.getenv('FSTR_DB_POOL_MAX', '10'))
+        self.pool_timeout = float(os.getenv('FSTR_DB_POOL_TIMEOUT', '5'))
+        self.pool_max_lifetime = float(os.getenv('FSTR_DB_POOL_MAX_LIFETIME', '1800'))
+        self.pool_pre_ping = os.getenv('FSTR_DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+        self._pool = None
+        self._pool_pid = None
+        self._inherited_pools = []
+
+        # Подготовленные запросы (psycopg 3): запросы из реестра queries.py готовятся сразу,
+        # остальные — после prepare_threshold выполнений; FSTR_DB_PREPARE=false отключает
+        # (например, за PgBouncer в режиме transaction)
+        prepare = os.getenv('FSTR_DB_PREPARE', 'true').lower() in ('1', 'true', 'yes')
+        self.prepare_threshold = int(os.getenv('FSTR_DB_PREPARE_THRESHOLD', '5')) if prepare else None
+
+        # Сколько часов хранить ключи идемпотентности POST /submitData/
+        self.idempotency_ttl_hours = int(os.getenv('FSTR_IDEMPOTENCY_TTL_HOURS', '24'))
+
+        # Сколько часов хранить обработанные номера очереди отложенной записи
+        self.submission_ttl_hours = int(os.getenv('FSTR_SUBMIT_TICKET_TTL_HOURS', '24'))
+
+        # Сколько строк выгрузки забирать с сервера за раз (именованный курсор)
+        self.export_fetch_size = int(os.getenv('FSTR_EXPORT_FETCH_SIZE', '1000'))
+
+        # Кэш карточек перевалов (FSTR_CACHE_*)
+        self.cache = create_cache()
+
+        # Справочник видов деятельности в памяти и период его перечитывания, если NOTIFY не пришёл
+        self.activity_types = ActivityTypes()
+        self.reference_refresh_seconds = float(os.getenv('FSTR_REFERENCE_REFRESH_SECONDS', '300'))
+
+    @property
+    def pool(self):
+        """
+        Пул текущего процесса. Пул создаётся лениво при первом подключении; если процесс
+        получил его от родителя через fork (например, gunicorn --preload), пул считается
+        отсутствующим и следующий запрос откроет свой.
+        """
+        if self._pool is not None and self._pool_pid != os.getpid():
+            logger.warning(f"Connection pool was opened in process {self._pool_pid}, "
+                           f"process {os.getpid()} opens its own")
+            # Соединения родителя не закрываем (закрытие оборвало бы их и у родителя),
+            # ссылка не даёт сборщику мусора закрыть их неявно
+            self._inherited_pools.append(self._pool)
+            self._pool = None
+        return self._pool
+
+    @pool.setter
+    def pool(self, value):
+        self._pool = value
+        self._pool_pid = os.getpid() if value is not None else None
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Счётчики кэша: попадания, промахи, вытеснения"""
+        return self.cache.stats()
+
+
+class DatabaseManager(DatabaseSettings):
+    """Синхронный менеджер на psycopg2, используется скриптами и утилитами"""
+
+    def connect(self) -> bool:
+        """Создаёт пул соединений, если он ещё не создан"""
+        if self.pool:
+            return True
+        try:
+            self.pool = ConnectionPool(
+                partial(psycopg2.connect,
+                        host=self.db_host, port=self.db_port, user=self.db_login,
+                        password=self.db_pass, dbname=self.db_name,
+                        cursor_factory=InstrumentedCursor),
+                minconn=self.pool_min,
+                maxconn=self.pool_max,
+                timeout=self.pool_timeout,
+                max_lifetime=self.pool_max_lifetime,
+                pre_ping=self.pool_pre_ping,
+                on_wait=record_pool_wait
+            )
+            logger.info(f"Connection pool to {self.db_host}:{self.db_port}/{self.db_name} created "
+                        f"(min={self.pool_min}, max={self.pool_max})")
+            return True
+        except psycopg2.Error as e:
+            logger.error(f"Failed to create connection pool: {e}")
+            return False
+
+    def close(self):
+        """Закрывает все соединения пула"""
+        if self.pool:
+            self.pool.closeall()
+            self.pool = None
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Счётчики пула: занятые/свободные соединения и время ожидания"""
+        return self.pool.stats() if self.pool else {}
 
     @handle_db_errors
     def add_pereval(self, pereval_data: Dict[str, Any], images_data: List[Dict[str, Any]],
-                    activities: List[int]) -> Optional[int]:
-        if not self.conn and not self.connect():
+                    activities: List[int], idempotency_key: Optional[str] = None) -> Optional[int]:
+        """
+        Добавляет перевал одним запросом, пользователь с тем же email переиспользуется.
+        С idempotency_key повтор того же запроса возвращает ID уже созданного перевала.
+        """
+        if not self.pool and not self.connect():
             logger.error("Cannot add pereval - no database connection")
             return None
 
-        try:
-            with self.conn.cursor() as cursor:
-                # Сохраняем пользователя
-                user = pereval_data['user']
-                cursor.execute(
-                    sql.SQL("""
-                        INSERT INTO users (email, phone, last_name, first_name, middle_name)
-                        VALUES (%s, %s, %s, %s, %s)
-                        RETURNING id
-                    """),
-                    (user['email'], user['phone'], user['fam'], user['name'], user.get('otc'))
-                )
-                user_id = cursor.fetchone()[0]
-
-                # Сохраняем координаты
-                coords = pereval_data['coords']
-                cursor.execute(
-                    sql.SQL("""
-                        INSERT INTO coords (latitude, longitude, height)
-                        VALUES (%s, %s, %s)
-                        RETURNING id
-                    """),
-                    (coords['latitude'], coords['longitude'], coords['height'])
-                )
-                coords_id = cursor.fetchone()[0]
-
-                # Сохраняем уровень сложности
-                level = pereval_data['level']
-                cursor.execute(
-                    sql.SQL("""
-                        INSERT INTO levels (winter, summer, autumn, spring)
-                        VALUES (%s, %s, %s, %s)
-                        RETURNING id
-                    """),
-                    (level.get('winter', ''), level.get('summer', ''),
-                     level.get('autumn', ''), level.get('spring', ''))
-                )
-                level_id = cursor.fetchone()[0]
-
-                # Сохраняем перевал
-                cursor.execute(
-                    sql.SQL("""
-                        INSERT INTO pereval_added (
-                            beauty_title, title, other_titles, connection,
-                            user_id, coords_id, level_id, status
-                        ) VALUES (
-                            %s, %s, %s, %s, %s, %s, %s, %s
-                        ) RETURNING id
-                    """),
-                    (pereval_data['beautyTitle'], pereval_data['title'],
-                     pereval_data['other_titles'], pereval_data['connect'],
-                     user_id, coords_id, level_id, 'new')  # Устанавливаем статус 'new'
-                )
-                pereval_id = cursor.fetchone()[0]
-
-                # Сохраняем изображения
-                for image in images_data:
-                    cursor.execute(
-                        sql.SQL("""
-                            INSERT INTO pereval_images (pereval_id, title, img_url)
-                            VALUES (%s, %s, %s)
-                        """),
-                        (pereval_id, image['title'], image['img_url'])
-                    )
-
-                # Сохраняем виды деятельности
-                if activities:
-                    act_values = [(pereval_id, act_id) for act_id in activities]
-                    extras.execute_values(
-                        cursor,
-                        "INSERT INTO pereval_activities (pereval_id, activity_id) VALUES %s",
-                        act_values
-                    )
-
-                self.conn.commit()
-                logger.info(f"Successfully added pereval with ID {pereval_id}")
-                return pereval_id
+        item = {'data': pereval_data, 'images': images_data, 'activities': activities}
+        with self.pool.connection() as conn, \
+                conn.cursor(cursor_factory=InstrumentedRealDictCursor) as cursor:
+            if idempotency_key:
+                request_hash = submit_request_hash(item)
+                cursor.execute(CLAIM_IDEMPOTENCY_KEY_QUERY, (idempotency_key, request_hash))
+                if not cursor.fetchone():
+                    # Ключ уже использован: отдаём сохранённый результат
+                    cursor.execute(GET_IDEMPOTENCY_KEY_QUERY, (idempotency_key,))
+                    stored = cursor.fetchone()
+                    return resolve_idempotency_replay(idempotency_key, request_hash,
+                                                      stored['request_hash'], stored['pereval_id'])
 
-        except Exception as e:
-            self.conn.rollback()
-            logger.error(f"Failed to add pereval: {e}")
+            cursor.execute(BULK_INSERT_QUERY, bulk_insert_params([item]))
+            pereval_id = cursor.fetchone()['pereval_id']
+
+            if idempotency_key:
+                cursor.execute(SET_IDEMPOTENCY_RESULT_QUERY, (pereval_id, idempotency_key))
+
+            conn.commit()
+            logger.info(f"Successfully added pereval with ID {pereval_id}")
+            return pereval_id
+
+    @handle_db_errors
+    def purge_idempotency_keys(self) -> int:
+        """Удаляет ключи идемпотентности старше FSTR_IDEMPOTENCY_TTL_HOURS"""
+        if not self.pool and not self.connect():
+            return 0
+        with self.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute(PURGE_IDEMPOTENCY_KEYS_QUERY, (self.idempotency_ttl_hours,))
+            conn.commit()
+            return cursor.rowcount
+
+    @handle_db_errors
+    def add_perevals_bulk(self, items: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Добавляет пачку перевалов в одной транзакции, по каждому возвращает ID или ошибку"""
+        if not self.pool and not self.connect():
+            logger.error("Cannot add perevals - no database connection")
             return None
 
+        started = time.monotonic()
+        with self.pool.connection() as conn, \
+                conn.cursor(cursor_factory=InstrumentedRealDictCursor) as cursor:
+            try:
+                cursor.execute(BULK_INSERT_QUERY, bulk_insert_params(items))
+                results = [{'index': row['ord'] - 1, 'id': row['pereval_id'], 'error': None}
+                           for row in cursor.fetchall()]
+            except psycopg2.Error as e:
+                # Общий запрос упал — повторяем по одному, изолируя ошибки точками сохранения
+                conn.rollback()
+                logger.warning(f"Bulk insert of {len(items)} perevals failed ({e}), retrying item by item")
+                results = []
+                for index, item in enumerate(items):
+                    cursor.execute("SAVEPOINT bulk_item")
+                    try:
+                        cursor.execute(BULK_INSERT_QUERY, bulk_insert_params([item]))
+                        results.append({'index': index, 'id': cursor.fetchone()['pereval_id'], 'error': None})
+                        cursor.execute("RELEASE SAVEPOINT bulk_item")
+                    except psycopg2.Error as item_error:
+                        cursor.execute("ROLLBACK TO SAVEPOINT bulk_item")
+                        results.append({'index': index, 'id': None, 'error': str(item_error).strip()})
+            conn.commit()
+
+        log_bulk_throughput(results, time.monotonic() - started)
+        return results
+
     @handle_db_errors
     def get_pereval_by_id(self, pereval_id: int) -> Optional [Dict [str, Any]]:
-        """Получает полные данные о перевале по ID"""
-        if not self.conn and not self.connect():
+        """Получает полные данные о перевале по ID одним запросом"""
+        cached = self.cache.get(pereval_id)
+        if cached is not None:
+            return cached
+
+        if not self.pool and not self.connect():
             return None
 
         try:
-            with self.conn.cursor() as cursor:
-                # Основные данные перевала
-                cursor.execute("""
-                       SELECT pa.*, u.email, u.phone, u.last_name, u.first_name, u.middle_name,
-                              c.latitude, c.longitude, c.height,
-                              l.winter, l.summer, l.autumn, l.spring
-                       FROM pereval_added pa
-                       JOIN users u ON pa.user_id = u.id
-                       JOIN coords c ON pa.coords_id = c.id
-                       JOIN levels l ON pa.level_id = l.id
-                       WHERE pa.id = %s
-                   """, (pereval_id,))
-                pereval = cursor.fetchone()
-
-                if not pereval:
+            with self.pool.connection() as conn, \
+                    conn.cursor(cursor_factory=InstrumentedRealDictCursor) as cursor:
+                cursor.execute(PEREVAL_DETAIL_QUERY, (pereval_id,))
+                row = cursor.fetchone()
+                if not row:
                     return None
-
-                # Изображения перевала
-                cursor.execute("""
-                       SELECT title, img_url FROM pereval_images
-                       WHERE pereval_id = %s
-                   """, (pereval_id,))
-                images = [{'title': row [0], 'img_url': row [1]} for row in cursor.fetchall()]
-
-                # Виды деятельности
-                cursor.execute("""
-                       SELECT activity_id FROM pereval_activities
-                       WHERE pereval_id = %s
-                   """, (pereval_id,))
-                activities = [row [0] for row in cursor.fetchall()]
-
-                # Формируем ответ
-                return {
-                    'id': pereval [0],
-                    'status': pereval [9],  # поле status
-                    'beautyTitle': pereval [2],
-                    'title': pereval [3],
-                    'other_titles': pereval [4],
-                    'connect': pereval [5],
-                    'user': {
-                        'email': pereval [10],
-                        'phone': pereval [11],
-                        'fam': pereval [12],
-                        'name': pereval [13],
-                        'otc': pereval [14]
-                    },
-                    'coords': {
-                        'latitude': pereval [15],
-                        'longitude': pereval [16],
-                        'height': pereval [17]
-                    },
-                    'level': {
-                        'winter': pereval [18],
-                        'summer': pereval [19],
-                        'autumn': pereval [20],
-                        'spring': pereval [21]
-                    },
-                    'images': images,
-                    'activities': activities
-                }
+                pereval = pereval_from_row(row)
+                self.cache.put(pereval)
+                return pereval
 
         except Exception as e:
             logger.error(f"Error getting pereval {pereval_id}: {e}")
             return None
 
     @handle_db_errors
-    def update_pereval(self, pereval_id: int, pereval_data: Dict [str, Any],
-                       images_data: List [Dict [str, Any]], activities: List [int]) -> bool:
-        """Обновляет данные перевала, если статус 'new'"""
-        if not self.conn and not self.connect():
-            return False
+    def get_pereval_version(self, pereval_id: int) -> Optional[int]:
+        """Текущая версия перевала (для ETag) без чтения всей карточки"""
+        cached = self.cache.get(pereval_id)
+        if cached is not None and 'version' in cached:
+            return cached['version']
+
+        if not self.pool and not self.connect():
+            return None
+
+        with self.pool.connection() as conn, \
+                conn.cursor(cursor_factory=InstrumentedRealDictCursor) as cursor:
+            cursor.execute(PEREVAL_VERSION_QUERY, (pereval_id,))
+            row = cursor.fetchone()
+            return row['version'] if row else None
+
+    @handle_db_errors
+    def update_pereval(self, pereval_id: int, pereval_data: Dict[str, Any],
+                       images_data: Optional[List[Dict[str, Any]]] = None,
+                       activities: Optional[List[int]] = None,
+                       expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        Частично обновляет перевал, если статус 'new'. Возвращает новую версию записи.
+        Пишутся только изменившиеся строки; совпадающие изображения и виды деятельности
+        остаются как есть. С expected_version (If-Match) изменение отклоняется,
+        если запись уже изменили.
+        """
+        if not self.pool and not self.connect():
+            return None
 
         try:
-            with self.conn.cursor() as cursor:
-                # Проверяем статус перевала
-                cursor.execute("""
-                       SELECT status FROM pereval_added WHERE id = %s
-                   """, (pereval_id,))
-                status = cursor.fetchone() [0]
-
-                if status != 'new':
+            with self.pool.connection() as conn, \
+                    conn.cursor(cursor_factory=InstrumentedRealDictCursor) as cursor:
+                cursor.execute(PEREVAL_LOCK_QUERY, (pereval_id,))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+
+                if expected_version is not None and row['version'] != expected_version:
+                    raise PerevalVersionMismatch(f"Перевал {pereval_id} изменён: версия {row['version']}, "
+                                                 f"ожидалась {expected_version}")
+
+                if row['status'] != 'new':
                     raise ValueError("Редактирование возможно только для записей со статусом 'new'")
 
-                # Получаем ID связанных записей
-                cursor.execute("""
-                       SELECT coords_id, level_id FROM pereval_added WHERE id = %s
-                   """, (pereval_id,))
-                coords_id, level_id = cursor.fetchone()
-
-                # Обновляем координаты
-                cursor.execute("""
-                       UPDATE coords SET latitude = %s, longitude = %s, height = %s
-                       WHERE id = %s
-                   """, (
-                    pereval_data ['coords'] ['latitude'],
-                    pereval_data ['coords'] ['longitude'],
-                    pereval_data ['coords'] ['height'],
-                    coords_id
-                ))
-
-                # Обновляем уровень сложности
-                cursor.execute("""
-                       UPDATE levels SET winter = %s, summer = %s, autumn = %s, spring = %s
-                       WHERE id = %s
-                   """, (
-                    pereval_data ['level'].get('winter', ''),
-                    pereval_data ['level'].get('summer', ''),
-                    pereval_data ['level'].get('autumn', ''),
-                    pereval_data ['level'].get('spring', ''),
-                    level_id
-                ))
-
-                # Обновляем основные данные перевала
-                cursor.execute("""
-                       UPDATE pereval_added 
-                       SET beauty_title = %s, title = %s, other_titles = %s, connection = %s
-                       WHERE id = %s
-                   """, (
-                    pereval_data ['beautyTitle'],
-                    pereval_data ['title'],
-                    pereval_data ['other_titles'],
-                    pereval_data ['connect'],
-                    pereval_id
-                ))
-
-                # Удаляем старые изображения и добавляем новые
-                cursor.execute("""
-                       DELETE FROM pereval_images WHERE pereval_id = %s
-                   """, (pereval_id,))
-
-                for image in images_data:
-                    cursor.execute("""
-                           INSERT INTO pereval_images (pereval_id, title, img_url)
-                           VALUES (%s, %s, %s)
-                       """, (pereval_id, image ['title'], image ['img_url']))
-
-                # Обновляем виды деятельности
-                cursor.execute("""
-                       DELETE FROM pereval_activities WHERE pereval_id = %s
-                   """, (pereval_id,))
-
-                if activities:
-                    act_values = [(pereval_id, act_id) for act_id in activities]
-                    extras.execute_values(
-                        cursor,
-                        "INSERT INTO pereval_activities (pereval_id, activity_id) VALUES %s",
-                        act_values
-                    )
-
-                self.conn.commit()
-                return True
+                plan = pereval_update_plan(row, pereval_data, images_data, activities)
+                if not plan['changed']:
+                    return row['version']
+
+                coords_id, level_id = row['coords_id'], row['level_id']
+                if plan['coords']:
+                    cursor.execute(INTERN_COORDS_QUERY, plan['coords'])
+                    coords_id = cursor.fetchone()['id']
+                if plan['level']:
+                    cursor.execute(INTERN_LEVEL_QUERY, plan['level'])
+                    level_id = cursor.fetchone()['id']
+                if plan['delete_images']:
+                    cursor.execute(DELETE_IMAGES_QUERY, (pereval_id, plan['delete_images']))
+                if plan['insert_images']:
+                    cursor.execute(INSERT_IMAGES_QUERY, (
+                        pereval_id,
+                        [image['title'] for image in plan['insert_images']],
+                        [image['img_url'] for image in plan['insert_images']]
+                    ))
+                if plan['delete_activities']:
+                    cursor.execute(DELETE_ACTIVITIES_QUERY, (pereval_id, plan['delete_activities']))
+                if plan['insert_activities']:
+                    cursor.execute(INSERT_ACTIVITIES_QUERY, (pereval_id, plan['insert_activities']))
 
+                # Основная строка обновляется всегда: триггер увеличивает версию
+                cursor.execute(UPDATE_PEREVAL_QUERY, {**plan['pereval'], 'coords_id': coords_id,
+                                                      'level_id': level_id, 'id': pereval_id})
+                new_version = cursor.fetchone()['version']
+
+                conn.commit()
+                self.cache.invalidate(pereval_id)
+                return new_version
+
+        except CLIENT_ERRORS:
+            raise
         except Exception as e:
-            self.conn.rollback()
             logger.error(f"Error updating pereval {pereval_id}: {e}")
             raise
 
     @handle_db_errors
-    def get_perevals_by_email(self, email: str) -> List [Dict [str, Any]]:
-        """Получает все перевалы пользователя по email"""
-        if not self.conn and not self.connect():
-            return []
+    def get_perevals_by_email(self, email: str, limit: int = USER_PEREVALS_DEFAULT_LIMIT,
+                              status: Optional[str] = None,
+                              cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Страница перевалов пользователя по email, от новых к старым"""
+        query, params = build_user_perevals_query(email, limit, status, cursor)
+        if not self.pool and not self.connect():
+            return {'perevals': [], 'next_cursor': None}
 
         try:
-            with self.conn.cursor() as cursor:
-                # Находим все перевалы пользователя
-                cursor.execute("""
-                       SELECT pa.id, pa.title, pa.status, pa.date_added
-                       FROM pereval_added pa
-                       JOIN users u ON pa.user_id = u.id
-                       WHERE u.email = %s
-                       ORDER BY pa.date_added DESC
-                   """, (email,))
-
-                return [{
-                    'id': row [0],
-                    'title': row [1],
-                    'status': row [2],
-                    'date_added': row [3].isoformat() if row [3] else None
-                } for row in cursor.fetchall()]
+            with self.pool.connection() as conn, \
+                    conn.cursor(cursor_factory=InstrumentedRealDictCursor) as db_cursor:
+                db_cursor.execute(query, params)
+                return user_perevals_page(db_cursor.fetchall(), limit)
 
         except Exception as e:
             logger.error(f"Error getting perevals for email {email}: {e}")
-            return []
\ No newline at end of file
+            return {'perevals': [], 'next_cursor': None}
+
+    def iter_export_records(self, status: Optional[str] = None, date_from: Optional[date] = None,
+                            date_to: Optional[date] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Построчно выгружает перевалы через серверный (именованный) курсор:
+        в памяти держится не больше export_fetch_size строк.
+        """
+        if not self.pool and not self.connect():
+            raise psycopg2.OperationalError("No database connection")
+
+        query, params = build_export_query(status, date_from, date_to)
+        with self.pool.connection() as conn, \
+                conn.cursor(name='pereval_export', cursor_factory=InstrumentedRealDictCursor) as cursor:
+            cursor.itersize = self.export_fetch_size
+            cursor.execute(query, params)
+            for row in cursor:
+                yield export_record_from_row(row)
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""
+Выгрузка всех перевалов в NDJSON или CSV для аналитики.
+Форматирование общее для эндпоинта GET /perevals/export/ и командной строки:
+
+    python export.py --format csv --status accepted --date-from 2024-01-01 -o perevals.csv
+"""
+
+import io
+import csv
+import sys
+import json
+import argparse
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator
+from database import DatabaseManager
+from serialization import dumps
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+CSV_COLUMNS = (
+    'id', 'date_added', 'status', 'beautyTitle', 'title', 'other_titles', 'connect',
+    'email', 'phone', 'fam', 'name', 'otc',
+    'latitude', 'longitude', 'height',
+    'winter', 'summer', 'autumn', 'spring',
+    'images', 'activities',
+)
+
+
+def ndjson_line(record: Dict[str, Any]) -> str:
+    return dumps(record).decode('utf-8') + "\n"
+
+
+def csv_row(record: Dict[str, Any]) -> list:
+    """Плоская строка CSV; изображения и виды деятельности — JSON в ячейке"""
+    return [
+        record['id'], record['date_added'], record['status'], record['beautyTitle'], record['title'],
+        record['other_titles'], record['connect'],
+        record['user']['email'], record['user']['phone'], record['user']['fam'],
+        record['user']['name'], record['user']['otc'],
+        record['coords']['latitude'], record['coords']['longitude'], record['coords']['height'],
+        record['level']['winter'], record['level']['summer'],
+        record['level']['autumn'], record['level']['spring'],
+        json.dumps(record['images'], ensure_ascii=False),
+        json.dumps(record['activities']),
+    ]
+
+
+class CsvFormatter:
+    """Превращает записи в строки CSV по одной, без накопления в памяти"""
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _flush(self) -> str:
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+    def header(self) -> str:
+        self._writer.writerow(CSV_COLUMNS)
+        return self._flush()
+
+    def line(self, record: Dict[str, Any]) -> str:
+        self._writer.writerow(csv_row(record))
+        return self._flush()
+
+
+def format_records(records: Iterable[Dict[str, Any]], export_format: str) -> Iterator[str]:
+    """Синхронный вариант: строки выгрузки в выбранном формате"""
+    if export_format == 'csv':
+        formatter = CsvFormatter()
+        yield formatter.header()
+        for record in records:
+            yield formatter.line(record)
+    else:
+        for record in records:
+            yield ndjson_line(record)
+
+
+async def aformat_records(records, export_format: str):
+    """Асинхронный вариант format_records для StreamingResponse"""
+    if export_format == 'csv':
+        formatter = CsvFormatter()
+        yield formatter.header()
+        async for record in records:
+            yield formatter.line(record)
+    else:
+        async for record in records:
+            yield ndjson_line(record)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка перевалов в NDJSON или CSV")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+    parser.add_argument('--status', choices=('new', 'pending', 'accepted', 'rejected'))
+    parser.add_argument('--date-from', type=date.fromisoformat, help="Дата добавления с (включительно)")
+    parser.add_argument('--date-to', type=date.fromisoformat, help="Дата добавления по (не включительно)")
+    parser.add_argument('-o', '--output', help="Файл результата, по умолчанию stdout")
+    args = parser.parse_args(argv)
+
+    db_manager = DatabaseManager()
+    output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        records = db_manager.iter_export_records(args.status, args.date_from, args.date_to)
+        for chunk in format_records(records, args.format):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
+        db_manager.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Геопоиск перевалов: разбиение прямоугольника через антимеридиан
+и расстояние по поверхности Земли для уточнения порядка ближайших.
+"""
+
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+GEO_DEFAULT_LIMIT = 100
+GEO_MAX_LIMIT = 1000
+
+# Индекс GiST упорядочивает по плоскому расстоянию в градусах,
+# поэтому берём кандидатов с запасом и пересортировываем по реальному
+NEAREST_CANDIDATES_FACTOR = 4
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние между двумя точками по большому кругу, км"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def split_bbox(south: float, west: float, north: float,
+               east: float) -> List[Tuple[float, float, float, float]]:
+    """
+    Возвращает прямоугольники (south, west, north, east) без пересечения антимеридиана.
+    Если west > east, область проходит через 180° и делится на две.
+    """
+    if west <= east:
+        return [(south, west, north, east)]
+    return [(south, west, north, 180.0), (south, -180.0, north, east)]
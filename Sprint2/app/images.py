@@ -0,0 +1,345 @@
+"""
+Приём изображений перевалов вне пути запроса: файл или URL ставится в очередь,
+пул обработчиков декодирует его, делает превью и складывает файлы на диск
+по хешу содержимого (одинаковые изображения хранятся один раз).
+
+    media/ab/<sha256>.jpg       — оригинал загруженного файла
+    media/ab/<sha256>_320.jpg   — превью, длинная сторона не больше FSTR_THUMB_SIZE
+"""
+
+import os
+import io
+import asyncio
+import socket
+import hashlib
+import logging
+import ipaddress
+import http.client
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional, Set
+from PIL import Image, ImageOps
+
+from breaker import DatabaseUnavailable
+
+logger = logging.getLogger(__name__)
+
+MEDIA_DIR = Path(os.getenv('FSTR_MEDIA_DIR', 'media'))
+MEDIA_URL = os.getenv('FSTR_MEDIA_URL', '/media').rstrip('/')
+IMAGE_WORKERS = int(os.getenv('FSTR_IMAGE_WORKERS', '2'))
+IMAGE_MAX_BYTES = int(os.getenv('FSTR_IMAGE_MAX_BYTES', str(20 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = float(os.getenv('FSTR_IMAGE_FETCH_TIMEOUT', '10'))
+THUMB_SIZE = int(os.getenv('FSTR_THUMB_SIZE', '320'))
+# Через сколько секунд незавершённое изображение другого процесса считается брошенным
+IMAGE_CLAIM_TIMEOUT = float(os.getenv('FSTR_IMAGE_CLAIM_TIMEOUT', '600'))
+
+# Защита от «бомб» — маленьких файлов с огромным разрешением
+Image.MAX_IMAGE_PIXELS = int(os.getenv('FSTR_IMAGE_MAX_PIXELS', str(80_000_000)))
+
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+# Тег EXIF Orientation: значения 5-8 означают поворот на 90°, ширина и высота меняются местами
+EXIF_ORIENTATION = 0x0112
+
+
+class ImageProcessingError(Exception):
+    """Файл не удалось получить или это не поддерживаемое изображение"""
+
+
+def media_path(media_dir: Path, name: str) -> Path:
+    return media_dir / name[:2] / name
+
+
+def _write_once(path: Path, write) -> bool:
+    """Пишет файл через временный и rename; существующий файл с тем же хешем не перезаписывается"""
+    if path.exists():
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'wb') as f:
+        write(f)
+    os.replace(tmp, path)
+    return True
+
+
+def process_image(data: bytes, media_dir: Path = MEDIA_DIR, thumb_size: int = THUMB_SIZE,
+                  store_original: bool = True) -> Dict[str, Any]:
+    """
+    Декодирует изображение, сохраняет оригинал (для загруженных файлов) и превью.
+    Возвращает хеш, размеры и URL файлов. Выполняется в потоке пула обработчиков.
+    """
+    content_hash = hashlib.sha256(data).hexdigest()
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+            if image_format not in IMAGE_EXTENSIONS:
+                raise ImageProcessingError(f"Неподдерживаемый формат изображения: {image_format}")
+            width, height = image.size
+            if image.getexif().get(EXIF_ORIENTATION) in (5, 6, 7, 8):
+                width, height = height, width
+            thumb_name = f"{content_hash}_{thumb_size}.jpg"
+            thumb_path = media_path(media_dir, thumb_name)
+            if thumb_path.exists():
+                with Image.open(thumb_path) as thumb:
+                    thumb_width, thumb_height = thumb.size
+            else:
+                # draft уменьшает JPEG уже при декодировании, не распаковывая полный размер
+                image.draft('RGB', (thumb_size, thumb_size))
+                thumb = ImageOps.exif_transpose(image).convert('RGB')
+                thumb.thumbnail((thumb_size, thumb_size), Image.LANCZOS)
+                thumb_width, thumb_height = thumb.size
+                _write_once(thumb_path, lambda f: thumb.save(f, 'JPEG', quality=85, optimize=True))
+    except (OSError, Image.DecompressionBombError, ValueError) as e:
+        raise ImageProcessingError(f"Не удалось декодировать изображение: {e}")
+
+    result = {
+        'content_hash': content_hash,
+        'width': width,
+        'height': height,
+        'thumb_url': f"{MEDIA_URL}/{thumb_name[:2]}/{thumb_name}",
+        'thumb_width': thumb_width,
+        'thumb_height': thumb_height,
+        'img_url': None,
+    }
+    if store_original:
+        original_name = f"{content_hash}.{IMAGE_EXTENSIONS[image_format]}"
+        _write_once(media_path(media_dir, original_name), lambda f: f.write(data))
+        result['img_url'] = f"{MEDIA_URL}/{original_name[:2]}/{original_name}"
+    return result
+
+
+def is_public_address(address) -> bool:
+    """Адрес в интернете: не loopback, не частная сеть, не link-local (метаданные облака), не зарезервированный"""
+    return address.is_global and not address.is_multicast
+
+
+def public_address(host: str, port: int) -> str:
+    """Адрес для подключения к хосту ссылки; ImageProcessingError, если хоть один его адрес не публичный"""
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError) as e:
+        raise ImageProcessingError(f"Не удалось найти хост {host}: {e}")
+    addresses = [ipaddress.ip_address(info[4][0].split('%', 1)[0]) for info in infos]
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise ImageProcessingError(f"Ссылка ведёт во внутреннюю сеть: {host}")
+    return str(addresses[0])
+
+
+# Защита от SSRF: адрес проверяется при каждом подключении — и к хосту ссылки, и после
+# каждого перенаправления, — а подключение идёт к проверенному адресу, а не к повторно
+# разрешённому имени (DNS rebinding)
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def connect(self):
+        self.sock = socket.create_connection((public_address(self.host, self.port), self.port),
+                                             self.timeout, self.source_address)
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection, _PublicHTTPConnection):
+    # HTTPSConnection.connect оборачивает в TLS сокет, открытый _PublicHTTPConnection.connect
+    pass
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(_PublicHTTPConnection, req)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(_PublicHTTPSConnection, req, context=self._context)
+
+
+class _HTTPRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urllib.parse.urlsplit(newurl).scheme not in ('http', 'https'):
+            raise ImageProcessingError("Поддерживаются только ссылки http и https")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+# Без прокси из окружения: иначе проверялся бы адрес прокси, а не хоста ссылки
+_opener = urllib.request.build_opener(urllib.request.ProxyHandler({}), _PublicHTTPHandler,
+                                      _PublicHTTPSHandler, _HTTPRedirectHandler)
+
+
+def fetch_url(url: str, max_bytes: int = IMAGE_MAX_BYTES, timeout: float = IMAGE_FETCH_TIMEOUT) -> bytes:
+    """Скачивает изображение по http(s), не больше max_bytes; адреса внутренних сетей запрещены"""
+    if not url.startswith(('http://', 'https://')):
+        raise ImageProcessingError("Поддерживаются только ссылки http и https")
+    try:
+        with _opener.open(url, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+    except (OSError, ValueError) as e:
+        raise ImageProcessingError(f"Не удалось скачать {url}: {e}")
+    if len(data) > max_bytes:
+        raise ImageProcessingError(f"Изображение больше {max_bytes} байт")
+    return data
+
+
+def save_upload(source: BinaryIO, path: Path, max_bytes: int = IMAGE_MAX_BYTES,
+                chunk_size: int = 1024 * 1024) -> int:
+    """
+    Копирует загруженный файл во входящие частями; ImageProcessingError, как только
+    записано больше max_bytes — остаток загрузки не читается, частичный файл удаляется
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    size = 0
+    with open(path, 'wb') as f:
+        while size <= max_bytes:
+            chunk = source.read(min(chunk_size, max_bytes + 1 - size))
+            if not chunk:
+                break
+            f.write(chunk)
+            size += len(chunk)
+    if size > max_bytes:
+        path.unlink()
+        raise ImageProcessingError(f"Изображение больше {max_bytes} байт")
+    return size
+
+
+class ImageIngestor:
+    """
+    Очередь обработки изображений. Загруженные файлы до обработки лежат в media/incoming/<id>,
+    поэтому после перезапуска незавершённые задачи восстанавливаются по строкам 'pending'.
+    """
+
+    def __init__(self, db_manager, media_dir: Path = MEDIA_DIR, workers: int = IMAGE_WORKERS,
+                 claim_timeout: float = IMAGE_CLAIM_TIMEOUT):
+        self.db_manager = db_manager
+        self.media_dir = media_dir
+        self.incoming_dir = media_dir / 'incoming'
+        self.workers = workers
+        self.claim_timeout = claim_timeout
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks = []
+        self._wakeup = asyncio.Event()
+        # Изображения в очереди или в обработке у этого процесса: resume не ставит их повторно
+        self._active: Set[int] = set()
+        self.processed = 0
+        self.failed = 0
+
+    def incoming_path(self, image_id: int) -> Path:
+        return self.incoming_dir / str(image_id)
+
+    def start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='image')
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reclaimer()))
+        logger.info(f"Image ingestor started with {self.workers} workers")
+
+    async def resume(self) -> int:
+        """
+        Ставит в очередь изображения, оставшиеся 'pending' после прошлого запуска; строки,
+        которые обрабатывает другой рабочий процесс, не трогает
+        """
+        rows = await self.db_manager.get_pending_images(self.claim_timeout)
+        queued = 0
+        for row in rows:
+            if row['id'] in self._active:
+                continue
+            upload = self.incoming_path(row['id'])
+            self._active.add(row['id'])
+            await self.queue.put((row['id'], upload if upload.exists() else None, row['img_url'] or None))
+            queued += 1
+        return queued
+
+    def wake(self):
+        """Подобрать новые незакреплённые строки 'pending' (ссылки, добавленные вместе с перевалом) сейчас"""
+        self._wakeup.set()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def save_upload(self, source: BinaryIO) -> Path:
+        """Сохраняет загрузку во временный файл входящих (в потоке, не блокируя цикл событий)"""
+        path = self.incoming_dir / f".upload-{os.urandom(8).hex()}"
+        await asyncio.get_running_loop().run_in_executor(self._executor, save_upload, source, path)
+        return path
+
+    async def submit(self, image_id: int, upload: Optional[Path] = None, url: Optional[str] = None):
+        """Ставит в очередь загруженный файл или ссылку для строки pereval_images"""
+        if upload is not None:
+            target = self.incoming_path(image_id)
+            upload.replace(target)
+            upload = target
+        self._active.add(image_id)
+        await self.queue.put((image_id, upload, url))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'queued': self.queue.qsize(), 'processed': self.processed, 'failed': self.failed,
+                'workers': self.workers}
+
+    async def _reclaimer(self):
+        # Закрепление своих строк продлевается чаще, чем истекает, поэтому очередь, которая
+        # не успевает за claim_timeout, не забирает другой процесс. Строки процесса,
+        # завершившегося до их обработки, подбираются по истечении claim_timeout, а изображения
+        # из POST /submitData/, пакетного добавления и PATCH — сразу, по wake()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.claim_timeout / 2)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                if self._active:
+                    await self.db_manager.refresh_image_claims(sorted(self._active))
+                resumed = await self.resume()
+                if resumed:
+                    logger.info(f"Reclaimed {resumed} abandoned pending images")
+            except asyncio.CancelledError:
+                raise
+            except DatabaseUnavailable:
+                pass
+            except Exception as e:
+                logger.error(f"Reclaiming pending images failed: {e}")
+
+    def _process(self, upload: Optional[Path], url: Optional[str]) -> Dict[str, Any]:
+        if upload is not None:
+            return process_image(upload.read_bytes(), self.media_dir)
+        if not url:
+            raise ImageProcessingError("Загруженный файл не найден во входящих")
+        return process_image(fetch_url(url), self.media_dir, store_original=False)
+
+    async def _handle(self, image_id: int, upload: Optional[Path], url: Optional[str]) -> bool:
+        """Обрабатывает изображение и записывает результат в базу; False — результат не записан"""
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, self._process, upload, url)
+        except Exception as e:
+            logger.warning(f"Image {image_id} processing failed: {e}")
+            try:
+                await self.db_manager.set_image_failed(image_id, str(e))
+            except Exception as db_error:
+                logger.error(f"Cannot mark image {image_id} as failed: {db_error}")
+                return False
+            self.failed += 1
+            return True
+
+        try:
+            await self.db_manager.set_image_processed(image_id, result)
+        except Exception as e:
+            # Строка остаётся 'pending' и будет подобрана снова по истечении claim_timeout
+            logger.error(f"Cannot record processed image {image_id}: {e}")
+            return False
+        self.processed += 1
+        return True
+
+    async def _worker(self):
+        while True:
+            image_id, upload, url = await self.queue.get()
+            try:
+                # При отмене файл остаётся во входящих, задача восстановится при следующем запуске
+                recorded = await self._handle(image_id, upload, url)
+            finally:
+                self._active.discard(image_id)
+                self.queue.task_done()
+            # Входящий файл нужен для повтора, пока результат не записан в базу
+            if recorded and upload is not None:
+                upload.unlink(missing_ok=True)
@@ -3,14 +3,33 @@ FastAPI приложение для работы с данными о перев
 Предоставляет API для добавления и получения информации.
 """
 
+import math
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, status, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, status, Depends, Query, Body, Header, Response, File, Form, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from models import *
-from database import DatabaseManager
+from async_database import AsyncDatabaseManager, INVALID_DATA_ERRORS
+from database import (USER_PEREVALS_DEFAULT_LIMIT, USER_PEREVALS_MAX_LIMIT, BULK_MAX_ITEMS,
+                      IdempotencyKeyMismatch, PerevalVersionMismatch, pereval_etag, etag_matches,
+                      etag_version, MODERATION_MAX_BATCH)
+from pydantic import conlist
+from geo import GEO_DEFAULT_LIMIT, GEO_MAX_LIMIT
+from search import SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+from export import EXPORT_MEDIA_TYPES, aformat_records
+from metrics import MetricsMiddleware, render_prometheus
+from serialization import FastJSONResponse, dumps
+from reference import UnknownActivityTypes, DIFFICULTY_LEVELS
+from images import ImageIngestor, ImageProcessingError, MEDIA_DIR, MEDIA_URL
+from breaker import DatabaseUnavailable
+from submissions import SubmissionQueue
+from replicas import ReadYourWritesMiddleware
 import uvicorn
-from typing import Dict, Any
+from uuid import UUID
+from datetime import date
+from typing import Dict, Any, AsyncIterator, Iterable, Optional
 
 # Настройка логирования
 logging.basicConfig(
@@ -37,88 +56,639 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Инициализация менеджера базы данных
-db_manager = DatabaseManager()
+# Время ответа по эндпоинтам и заголовок Server-Timing (FSTR_SERVER_TIMING)
+app.add_middleware(MetricsMiddleware)
+
+# Инициализация менеджера базы данных (асинхронный, чтобы не блокировать цикл событий;
+# синхронный DatabaseManager остаётся для скриптов)
+db_manager = AsyncDatabaseManager()
+
+# Чтение своих записей при чтении с реплик (FSTR_DB_REPLICAS)
+app.add_middleware(ReadYourWritesMiddleware, replicas=db_manager.replicas, current_lsn=db_manager.current_wal_lsn)
+
+# Фоновая обработка загруженных изображений; оригиналы и превью раздаются из MEDIA_DIR
+image_ingestor = ImageIngestor(db_manager)
+app.mount(MEDIA_URL, StaticFiles(directory=MEDIA_DIR, check_dir=False), name="media")
+
+# Отложенная запись новых перевалов (FSTR_SUBMIT_MODE=queue): POST /submitData/ отвечает 202
+submission_queue = SubmissionQueue(db_manager, on_drained=image_ingestor.wake)
+
+
+def retry_after_headers(e: DatabaseUnavailable) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+
+
+def server_error(e: Exception) -> HTTPException:
+    """500 для ошибок сервера; 503 с Retry-After, если база недоступна (цепь разомкнута)"""
+    if isinstance(e, DatabaseUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers=retry_after_headers(e)
+        )
+    return HTTPException(
+        status_code=500,
+        detail=f"Ошибка сервера: {str(e)}"
+    )
+
+
+async def on_database_ready():
+    """Обслуживание после первого подключения к базе (при старте или когда база появилась)"""
+    purged = await db_manager.purge_idempotency_keys()
+    logger.info(f"Purged {purged} expired idempotency keys")
+    loaded = await db_manager.load_activity_types()
+    logger.info(f"Loaded {loaded} activity types")
+    resumed = await image_ingestor.resume()
+    logger.info(f"Resumed processing of {resumed} pending images")
+    if submission_queue.enabled:
+        purged = await db_manager.purge_submissions()
+        logger.info(f"Purged {purged} processed submission tickets")
 
 
 @app.on_event("startup")
 async def startup_event():
     """Инициализация при запуске приложения"""
     logger.info("Starting Pereval API application")
-    if not db_manager.connect():
-        logger.error("Failed to connect to database on startup")
+    # Справочники перечитываются в фоне, в том числе если база станет доступна позже
+    app.state.reference_task = asyncio.create_task(db_manager.watch_reference_data())
+    app.state.replica_task = asyncio.create_task(db_manager.maintain_replicas())
+    image_ingestor.start()
+    submission_queue.start()
+    # Подключение и переподключение к базе — в фоне, старт приложения не ждёт базу
+    app.state.db_task = asyncio.create_task(db_manager.maintain_connection(on_database_ready))
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Очистка ресурсов при завершении работы"""
     logger.info("Shutting down Pereval API application")
-    db_manager.close()
+    for task_name in ('reference_task', 'replica_task', 'db_task'):
+        task = getattr(app.state, task_name, None)
+        if task:
+            task.cancel()
+    await image_ingestor.stop()
+    await submission_queue.stop()
+    await db_manager.close()
 
 
 @app.get("/submitData/{pereval_id}/",
          response_model=PerevalResponse,
          summary="Получить данные перевала по ID",
          tags=["Perevals"])
-async def get_pereval(pereval_id: int):
-    """Получает полную информацию о перевале по его ID"""
+async def get_pereval(pereval_id: int,
+                      if_none_match: Optional[str] = Header(
+                          None, alias="If-None-Match",
+                          description="ETag из предыдущего ответа: если запись не менялась, вернётся 304")):
+    """
+    Получает полную информацию о перевале по его ID.
+    Ответ содержит ETag; с If-None-Match неизменившаяся запись отдаётся как 304 без тела.
+    """
     try:
-        pereval = db_manager.get_pereval_by_id(pereval_id)
+        if if_none_match:
+            version = await db_manager.get_pereval_version(pereval_id)
+            if version is not None and etag_matches(if_none_match, pereval_etag(pereval_id, version)):
+                return Response(status_code=304, headers={"ETag": pereval_etag(pereval_id, version),
+                                                          "Cache-Control": "no-cache"})
+
+        pereval = await db_manager.get_pereval_by_id(pereval_id)
         if not pereval:
             raise HTTPException(
                 status_code=404,
                 detail=f"Перевал с ID {pereval_id} не найден"
             )
-        return pereval
+        headers = {}
+        if pereval.get('version') is not None:
+            headers = {"ETag": pereval_etag(pereval_id, pereval['version']), "Cache-Control": "no-cache"}
+        # Карточка собрана из нашей базы: отдаём без повторной валидации PerevalResponse
+        return FastJSONResponse(pereval, headers=headers)
+    except HTTPException:
+        raise
+    except DatabaseUnavailable as e:
+        stale = db_manager.get_stale_pereval(pereval_id)
+        if stale is None:
+            raise server_error(e)
+        # Пока база недоступна, отдаём последнюю известную карточку с предупреждением
+        return FastJSONResponse(stale, headers={"Warning": '110 - "Response is Stale"',
+                                                "Cache-Control": "no-cache"})
     except Exception as e:
-        raise HTTPException(
+        raise server_error(e)
+
+@app.post("/submitData/",
+          response_model=SubmitResponse,
+          responses={202: {"model": SubmitTicketResponse,
+                           "description": "Режим отложенной записи: запрос принят в очередь"}},
+          summary="Добавить перевал",
+          tags=["Perevals"])
+async def submit_pereval(request: PerevalSubmitRequest,
+                         idempotency_key: Optional[str] = Header(
+                             None, alias="Idempotency-Key", max_length=255,
+                             description="Повтор запроса с тем же ключом вернёт уже созданный перевал")):
+    """
+    Добавляет новый перевал со статусом 'new'.
+    Пользователь с уже известным email не создаётся повторно.
+    В режиме отложенной записи отвечает 202 с номером запроса (ticket): перевал добавляется
+    в фоне, его ID возвращает GET /submitData/tickets/{ticket}/.
+    """
+    try:
+        if submission_queue.enabled:
+            ticket = await submission_queue.enqueue(request.dict(), idempotency_key)
+            return JSONResponse(
+                status_code=202,
+                content={"status": 202, "message": "Запись принята в обработку", "id": None, "ticket": ticket},
+                headers={"Location": f"/submitData/tickets/{ticket}/"}
+            )
+        pereval_id = await db_manager.add_pereval(
+            request.data.dict(),
+            [img.dict() for img in request.images],
+            request.activities,
+            idempotency_key
+        )
+    except IdempotencyKeyMismatch as e:
+        return JSONResponse(
+            status_code=409,
+            content={"status": 409, "message": str(e), "id": None}
+        )
+    except UnknownActivityTypes as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": 400, "message": str(e), "id": None}
+        )
+    except INVALID_DATA_ERRORS as e:
+        return JSONResponse(
+            status_code=400,
+            content={"status": 400, "message": f"Некорректные данные: {e}", "id": None}
+        )
+    except DatabaseUnavailable as e:
+        return JSONResponse(
+            status_code=503,
+            content={"status": 503, "message": str(e), "id": None},
+            headers=retry_after_headers(e)
+        )
+    except Exception as e:
+        return JSONResponse(
             status_code=500,
-            detail=f"Ошибка сервера: {str(e)}"
+            content={"status": 500, "message": f"Ошибка сервера: {str(e)}", "id": None}
         )
+    if request.images:
+        image_ingestor.wake()
+    return {"status": 200, "message": "Запись успешно добавлена", "id": pereval_id}
+
+@app.get("/submitData/tickets/{ticket}/",
+         response_model=SubmissionStatusResponse,
+         summary="Состояние запроса в очереди отложенной записи",
+         tags=["Perevals"])
+async def get_submission(ticket: UUID):
+    """queued — ещё в очереди, done — перевал добавлен (id), failed — не добавлен (error)"""
+    try:
+        submission = await db_manager.get_submission(str(ticket))
+    except Exception as e:
+        raise server_error(e)
+    if submission is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Запрос {ticket} не найден"
+        )
+    return FastJSONResponse(submission)
 
 @app.patch("/submitData/{pereval_id}/",
            response_model=PerevalUpdateResponse,
            summary="Редактировать перевал",
            tags=["Perevals"])
-async def update_pereval(pereval_id: int, request: PerevalSubmitRequest):
+async def update_pereval(pereval_id: int, request: PerevalUpdateRequest, response: Response,
+                         if_match: Optional[str] = Header(
+                             None, alias="If-Match",
+                             description="ETag прочитанной записи: если её уже изменили, вернётся 412")):
     """
-    Редактирует существующий перевал.
+    Редактирует существующий перевал: меняются только переданные поля.
     Доступно только для записей со статусом 'new'.
     Нельзя изменять данные пользователя (email, телефон, ФИО).
     """
     try:
-        success = db_manager.update_pereval(
+        version = await db_manager.update_pereval(
             pereval_id,
-            request.data.dict(),
-            [img.dict() for img in request.images],
-            request.activities
+            request.data.dict(exclude_unset=True, exclude_none=True),
+            [img.dict() for img in request.images] if request.images is not None else None,
+            request.activities,
+            etag_version(if_match, pereval_id) if if_match else None
         )
+        if version is not None:
+            response.headers["ETag"] = pereval_etag(pereval_id, version)
+            if request.images:
+                image_ingestor.wake()
         return {
-            "state": 1 if success else 0,
-            "message": "Запись успешно обновлена" if success else "Не удалось обновить запись"
+            "state": 1 if version is not None else 0,
+            "message": "Запись успешно обновлена" if version is not None else "Не удалось обновить запись"
         }
+    except PerevalVersionMismatch as e:
+        raise HTTPException(
+            status_code=412,
+            detail=str(e)
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise server_error(e)
+
+@app.post("/submitData/{pereval_id}/images/",
+          response_model=ImageUploadResponse,
+          status_code=202,
+          summary="Добавить изображение к перевалу",
+          tags=["Perevals"])
+async def upload_pereval_image(pereval_id: int,
+                               title: str = Form(..., max_length=255),
+                               file: Optional[UploadFile] = File(None, description="Файл изображения"),
+                               url: Optional[str] = Form(None, description="Или ссылка на изображение")):
+    """
+    Принимает файл или ссылку и сразу отвечает 202: декодирование, превью и сохранение
+    выполняются в фоне, пока у изображения processing_status = 'pending'.
+    Доступно только для записей со статусом 'new'.
+    """
+    if (file is None) == (not url):
+        raise HTTPException(
+            status_code=400,
+            detail="Нужно передать либо файл, либо ссылку на изображение"
+        )
+    upload = None
+    try:
+        if file is not None:
+            upload = await image_ingestor.save_upload(file.file)
+        image_id = await db_manager.add_pending_image(pereval_id, title, url or '')
+        if image_id is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Перевал с ID {pereval_id} не найден"
+            )
+        await image_ingestor.submit(image_id, upload, url)
+        upload = None
+        return JSONResponse(status_code=202, content={
+            "status": 202,
+            "message": "Изображение принято в обработку",
+            "id": image_id
+        })
+    except ImageProcessingError as e:
+        raise HTTPException(
+            status_code=413,
+            detail=str(e)
+        )
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(
             status_code=400,
             detail=str(e)
         )
     except Exception as e:
+        raise server_error(e)
+    finally:
+        if upload is not None:
+            upload.unlink(missing_ok=True)
+
+@app.post("/submitData/bulk/",
+          response_model=BulkSubmitResponse,
+          summary="Пакетное добавление перевалов",
+          tags=["Perevals"])
+async def submit_perevals_bulk(
+        requests: conlist(PerevalSubmitRequest, min_items=1, max_items=BULK_MAX_ITEMS) = Body(...)):
+    """
+    Добавляет несколько перевалов одной транзакцией (синхронизация офлайн-записей).
+    Ошибка в одном перевале не отменяет остальные: результат возвращается по каждому.
+    """
+    try:
+        results = await db_manager.add_perevals_bulk([request.dict() for request in requests])
+    except Exception as e:
+        raise server_error(e)
+    if results is None:
         raise HTTPException(
             status_code=500,
-            detail=f"Ошибка сервера: {str(e)}"
+            detail="Ошибка подключения к базе данных"
         )
+    added = sum(1 for result in results if result['id'] is not None)
+    if added and any(request.images for request in requests):
+        image_ingestor.wake()
+    return {
+        "status": 200,
+        "message": f"Добавлено {added} из {len(results)}",
+        "results": results
+    }
 
 @app.get("/submitData/",
          response_model=UserPerevalsResponse,
          summary="Список перевалов пользователя",
          tags=["Perevals"])
-async def get_user_perevals(user__email: str = Query(..., alias="user__email")):
-    """Получает список всех перевалов, добавленных пользователем"""
+async def get_user_perevals(user__email: str = Query(..., alias="user__email"),
+                            limit: int = Query(USER_PEREVALS_DEFAULT_LIMIT, ge=1, le=USER_PEREVALS_MAX_LIMIT,
+                                               description="Размер страницы"),
+                            status: Optional[str] = Query(None, regex="^(new|pending|accepted|rejected)$",
+                                                          description="Фильтр по статусу"),
+                            cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы")):
+    """Получает страницу перевалов пользователя, от новых к старым"""
     try:
-        perevals = db_manager.get_perevals_by_email(user__email)
-        return {"perevals": perevals}
+        page = await db_manager.get_perevals_by_email(user__email, limit, status, cursor)
+        return FastJSONResponse(page)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
     except Exception as e:
+        raise server_error(e)
+
+@app.get("/perevals/search/",
+         response_model=PerevalSearchResponse,
+         summary="Поиск перевалов по названию",
+         tags=["Perevals"])
+async def search_perevals(q: str = Query(..., min_length=2, max_length=255,
+                                         description="Название или его часть, кириллицей или латиницей"),
+                          limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT,
+                                             description="Размер страницы"),
+                          status: Optional[str] = Query(None, regex="^(new|pending|accepted|rejected)$",
+                                                        description="Фильтр по статусу"),
+                          cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы")):
+    """
+    Ищет перевалы по названию и другим названиям: полнотекстово по началу слов и нечётко по триграммам,
+    так что находятся и названия с опечатками или в другой раскладке. Результаты — от лучших совпадений.
+    """
+    try:
+        page = await db_manager.search_perevals(q, limit, status, cursor)
+        return FastJSONResponse(page)
+    except ValueError as e:
         raise HTTPException(
-            status_code=500,
-            detail=f"Ошибка сервера: {str(e)}"
-        )
\ No newline at end of file
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise server_error(e)
+
+@app.get("/stats/",
+         response_model=StatsResponse,
+         summary="Статистика перевалов",
+         tags=["Stats"])
+async def get_stats(status: Optional[str] = Query(None, regex="^(new|pending|accepted|rejected)$",
+                                                  description="Считать категории и виды деятельности только для статуса")):
+    """
+    Число перевалов по статусам, категориям трудности и видам деятельности. Значения берутся
+    из счётчиков, которые база обновляет при каждой записи, поэтому ответ не зависит от числа перевалов.
+    """
+    try:
+        return FastJSONResponse(await db_manager.get_stats(status))
+    except Exception as e:
+        raise server_error(e)
+
+@app.get("/stats/users/",
+         response_model=UserStatsResponse,
+         summary="Статистика перевалов пользователя",
+         tags=["Stats"])
+async def get_user_stats(user__email: str = Query(..., alias="user__email")):
+    """Число перевалов пользователя по статусам; нули, если пользователь ничего не добавлял"""
+    try:
+        return FastJSONResponse(await db_manager.get_user_stats(user__email))
+    except Exception as e:
+        raise server_error(e)
+
+async def ndjson_lines(rows) -> AsyncIterator[bytes]:
+    """Строки NDJSON из асинхронного итератора или списка словарей"""
+    if isinstance(rows, Iterable):
+        for row in rows:
+            yield dumps(row) + b"\n"
+    else:
+        async for row in rows:
+            yield dumps(row) + b"\n"
+
+
+NDJSON_GEO_RESPONSE = {
+    200: {
+        "model": PerevalGeoSummary,
+        "description": "Поток NDJSON: одна краткая карточка перевала на строку",
+        "content": {"application/x-ndjson": {}}
+    }
+}
+
+
+@app.get("/perevals/bbox/",
+         response_class=StreamingResponse,
+         responses=NDJSON_GEO_RESPONSE,
+         summary="Перевалы в прямоугольной области карты",
+         tags=["Geo"])
+async def get_perevals_in_bbox(south: float = Query(..., ge=-90, le=90, description="Южная граница"),
+                               west: float = Query(..., ge=-180, le=180, description="Западная граница"),
+                               north: float = Query(..., ge=-90, le=90, description="Северная граница"),
+                               east: float = Query(..., ge=-180, le=180, description="Восточная граница"),
+                               limit: int = Query(GEO_DEFAULT_LIMIT, ge=1, le=GEO_MAX_LIMIT)):
+    """
+    Перевалы, попадающие в видимую область карты.
+    Если west > east, область считается проходящей через антимеридиан.
+    """
+    if south > north:
+        raise HTTPException(
+            status_code=400,
+            detail="Южная граница должна быть не больше северной"
+        )
+    try:
+        await db_manager.require_pool()
+    except DatabaseUnavailable as e:
+        raise server_error(e)
+    rows = db_manager.iter_perevals_in_bbox(south, west, north, east, limit)
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
+
+
+@app.get("/perevals/nearest/",
+         response_class=StreamingResponse,
+         responses=NDJSON_GEO_RESPONSE,
+         summary="Ближайшие к точке перевалы",
+         tags=["Geo"])
+async def get_nearest_perevals(latitude: float = Query(..., ge=-90, le=90),
+                               longitude: float = Query(..., ge=-180, le=180),
+                               limit: int = Query(10, ge=1, le=GEO_MAX_LIMIT)):
+    """Перевалы, отсортированные по расстоянию до точки (distance_km)"""
+    try:
+        rows = await db_manager.get_nearest_perevals(latitude, longitude, limit)
+    except Exception as e:
+        raise server_error(e)
+    return StreamingResponse(ndjson_lines(rows), media_type="application/x-ndjson")
+
+
+@app.get("/perevals/export/",
+         response_class=StreamingResponse,
+         responses={200: {"description": "Поток NDJSON или CSV с полными карточками перевалов",
+                          "content": {"application/x-ndjson": {}, "text/csv": {}}}},
+         summary="Выгрузка всех перевалов",
+         tags=["Export"])
+async def export_perevals(format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+                          status: Optional[str] = Query(None, regex="^(new|pending|accepted|rejected)$"),
+                          date_from: Optional[date] = Query(None, description="Дата добавления с (включительно)"),
+                          date_to: Optional[date] = Query(None, description="Дата добавления по (не включительно)")):
+    """
+    Потоковая выгрузка перевалов с пользователем, координатами, уровнем, изображениями
+    и видами деятельности. Память не зависит от размера таблицы.
+    """
+    try:
+        await db_manager.require_pool()
+    except DatabaseUnavailable as e:
+        raise server_error(e)
+    records = db_manager.iter_export_records(status, date_from, date_to)
+    return StreamingResponse(
+        aformat_records(records, format),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="perevals.{format}"'}
+    )
+
+
+@app.get("/moderation/queue/",
+         response_model=ModerationQueueResponse,
+         summary="Очередь модерации",
+         tags=["Moderation"])
+async def get_moderation_queue(status: str = Query("new", regex="^(new|pending)$",
+                                                   description="new — ещё не взятые, pending — на проверке"),
+                               limit: int = Query(USER_PEREVALS_DEFAULT_LIMIT, ge=1, le=USER_PEREVALS_MAX_LIMIT,
+                                                  description="Размер страницы"),
+                               cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы")):
+    """Записи, ожидающие решения, от самых старых к новым"""
+    try:
+        page = await db_manager.get_moderation_queue(status, limit, cursor)
+        return FastJSONResponse(page)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise server_error(e)
+
+
+@app.post("/moderation/claim/",
+          response_model=ModerationClaimResponse,
+          summary="Взять записи на модерацию",
+          tags=["Moderation"])
+async def claim_for_moderation(moderator: str = Body(..., min_length=1, max_length=255),
+                               limit: int = Body(20, ge=1, le=MODERATION_MAX_BATCH)):
+    """
+    Переводит самые старые записи 'new' в 'pending' за модератором.
+    Несколько модераторов одновременно получают непересекающиеся пачки.
+    """
+    try:
+        perevals = await db_manager.claim_for_moderation(moderator, limit)
+    except Exception as e:
+        raise server_error(e)
+    return FastJSONResponse({"perevals": perevals})
+
+
+@app.post("/moderation/status/",
+          response_model=ModerationStatusResponse,
+          summary="Сменить статус нескольких перевалов",
+          tags=["Moderation"])
+async def set_perevals_status(
+        ids: conlist(int, min_items=1, max_items=MODERATION_MAX_BATCH) = Body(...),
+        status: str = Body(..., regex="^(new|pending|accepted|rejected)$"),
+        moderator: Optional[str] = Body(None, max_length=255)):
+    """
+    Меняет статус всех переданных перевалов одним запросом.
+    Допустимые переходы: new -> pending/accepted/rejected, pending -> new/accepted/rejected;
+    для остальных ID в ответе будет ошибка, статус не меняется.
+    """
+    try:
+        results = await db_manager.set_perevals_status(ids, status, moderator)
+    except Exception as e:
+        raise server_error(e)
+    return FastJSONResponse({"results": results})
+
+
+# Справочники меняются редко: клиенты могут кэшировать их надолго и перепроверять по ETag
+REFERENCE_MAX_AGE = 3600
+
+
+@app.get("/reference/activities/",
+         response_model=ActivitiesResponse,
+         summary="Справочник видов деятельности",
+         tags=["Reference"])
+async def get_activity_types(if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
+    """Виды деятельности из памяти процесса, без обращения к базе"""
+    activity_types = db_manager.activity_types
+    if not activity_types.loaded:
+        try:
+            await db_manager.load_activity_types()
+        except Exception as e:
+            raise server_error(e)
+        if not activity_types.loaded:
+            raise HTTPException(
+                status_code=503,
+                detail="Справочник видов деятельности ещё не загружен"
+            )
+
+    headers = {"ETag": activity_types.etag, "Cache-Control": f"public, max-age={REFERENCE_MAX_AGE}"}
+    if if_none_match and etag_matches(if_none_match, activity_types.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=activity_types.body, media_type="application/json", headers=headers)
+
+
+@app.get("/reference/levels/",
+         response_model=DifficultyLevelsResponse,
+         summary="Категории трудности",
+         tags=["Reference"])
+async def get_difficulty_levels():
+    """Категории трудности, которые используются в полях level"""
+    return FastJSONResponse({"levels": list(DIFFICULTY_LEVELS)},
+                            headers={"Cache-Control": f"public, max-age={REFERENCE_MAX_AGE}"})
+
+
+@app.get("/health/live",
+         summary="Процесс жив",
+         tags=["Service"])
+async def health_live():
+    """Для liveness-проверки: не обращается к базе"""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready",
+         summary="Готовность принимать запросы",
+         tags=["Service"])
+async def health_ready():
+    """
+    200, если пул открыт и цепь замкнута; иначе 503 с Retry-After.
+    В ответе состояние автомата защиты и пула; саму базу проверяет фоновая задача.
+    """
+    ready = db_manager.is_ready()
+    content = {
+        "status": "ready" if ready else "unavailable",
+        "breaker": db_manager.breaker.stats(),
+        "pool": db_manager.pool_stats(),
+    }
+    if ready:
+        return content
+    return JSONResponse(status_code=503, content=content,
+                        headers=retry_after_headers(DatabaseUnavailable(db_manager.breaker.retry_after())))
+
+
+@app.get("/pool/stats/",
+         summary="Состояние пула соединений",
+         tags=["Service"])
+async def get_pool_stats():
+    """Занятые и свободные соединения, время ожидания соединения"""
+    return db_manager.pool_stats()
+
+
+@app.get("/cache/stats/",
+         summary="Состояние кэша перевалов",
+         tags=["Service"])
+async def get_cache_stats():
+    """Попадания, промахи и вытеснения кэша карточек перевалов"""
+    return db_manager.cache_stats()
+
+
+@app.get("/metrics",
+         response_class=PlainTextResponse,
+         summary="Метрики в формате Prometheus",
+         tags=["Service"])
+async def get_metrics():
+    """Гистограммы времени ответа и SQL-запросов, счётчики пула и кэша"""
+    gauges = {
+        'fstr_db_pool': db_manager.pool_stats(),
+        'fstr_cache': db_manager.cache_stats(),
+        'fstr_images': image_ingestor.stats(),
+        'fstr_submission_queue': submission_queue.stats(),
+        'fstr_db_breaker': {**db_manager.breaker.stats(), 'open': int(db_manager.breaker.is_open)},
+        'fstr_db_replicas': db_manager.replicas.stats(),
+    }
+    return PlainTextResponse(render_prometheus(gauges), media_type="text/plain; version=0.0.4")
\ No newline at end of file
@@ -0,0 +1,221 @@
+"""
+Метрики и трассировка запросов: гистограммы времени ответа по эндпоинтам,
+число и длительность SQL-запросов по методам DatabaseManager, ожидание соединения,
+журнал медленных запросов. Отдаются в текстовом формате Prometheus на /metrics.
+"""
+
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv('FSTR_METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SERVER_TIMING_ENABLED = os.getenv('FSTR_SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_SECONDS = float(os.getenv('FSTR_SLOW_QUERY_MS', '200')) / 1000
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [счётчики по корзинам, сумма, количество]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{self.name}_bucket"
+                                 f"{_labels(self.labels + ('le',), label_values + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+HTTP_REQUEST_DURATION = Histogram(
+    'fstr_http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ('method', 'route', 'status'))
+DB_METHOD_DURATION = Histogram(
+    'fstr_db_method_duration_seconds', 'Время выполнения метода DatabaseManager', ('method',))
+DB_QUERY_DURATION = Histogram(
+    'fstr_db_query_duration_seconds', 'Время одного SQL-запроса по методам', ('method',))
+DB_QUERIES = Counter('fstr_db_queries_total', 'Число SQL-запросов по методам', ('method',))
+DB_SLOW_QUERIES = Counter('fstr_db_slow_queries_total', 'Число медленных SQL-запросов', ('method',))
+DB_POOL_WAIT = Histogram('fstr_db_pool_wait_seconds', 'Ожидание соединения из пула')
+
+ALL_METRICS = (HTTP_REQUEST_DURATION, DB_METHOD_DURATION, DB_QUERY_DURATION,
+               DB_QUERIES, DB_SLOW_QUERIES, DB_POOL_WAIT)
+
+
+class RequestStats:
+    """Накопленное время работы с базой в рамках одного HTTP-запроса (для Server-Timing)"""
+
+    __slots__ = ('db_time', 'db_queries', 'pool_wait')
+
+    def __init__(self):
+        self.db_time = 0.0
+        self.db_queries = 0
+        self.pool_wait = 0.0
+
+    def server_timing(self, total: float) -> str:
+        return (f'db;dur={self.db_time * 1000:.2f};desc="{self.db_queries} queries", '
+                f'pool;dur={self.pool_wait * 1000:.2f}, '
+                f'total;dur={total * 1000:.2f}')
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('fstr_request_stats', default=None)
+_current_method: ContextVar[str] = ContextVar('fstr_db_method', default='other')
+
+
+@contextmanager
+def track_db_method(name: str):
+    """Оборачивает вызов метода DatabaseManager: время метода и привязка запросов к нему"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    token = _current_method.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        DB_METHOD_DURATION.observe(time.perf_counter() - started, name)
+        _current_method.reset(token)
+
+
+def record_query(query: Any, duration: float):
+    """Вызывается курсором после каждого execute"""
+    if not METRICS_ENABLED:
+        return
+    method = _current_method.get()
+    DB_QUERIES.inc(method)
+    DB_QUERY_DURATION.observe(duration, method)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.db_time += duration
+        stats.db_queries += 1
+    if duration >= SLOW_QUERY_SECONDS:
+        DB_SLOW_QUERIES.inc(method)
+        # У запросов из реестра (queries.Statement) есть имя — по нему проще найти запрос
+        name = getattr(query, 'name', None)
+        text = name or ' '.join(str(query).split())[:300]
+        logger.warning(f"Slow query in {method}: {duration * 1000:.1f} ms: {text}")
+
+
+def record_pool_wait(duration: float):
+    if not METRICS_ENABLED:
+        return
+    DB_POOL_WAIT.observe(duration)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.pool_wait += duration
+
+
+def _gauges(prefix: str, values: Dict[str, Any]) -> List[str]:
+    lines = []
+    for key, value in sorted(values.items()):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        lines.append(f"# TYPE {prefix}_{key} gauge")
+        lines.append(f"{prefix}_{key} {value}")
+    return lines
+
+
+def render_prometheus(gauges: Optional[Dict[str, Dict[str, Any]]] = None) -> str:
+    """Все метрики в текстовом формате Prometheus; gauges — {префикс: {имя: значение}}"""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    for prefix, values in (gauges or {}).items():
+        lines.extend(_gauges(prefix, values))
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: гистограмма времени ответа по шаблону маршрута и заголовок Server-Timing"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                if self.server_timing:
+                    header = stats.server_timing(time.perf_counter() - started).encode()
+                    message = {**message, 'headers': list(message.get('headers', [])) +
+                               [(b'server-timing', header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Шаблон маршрута (/submitData/{pereval_id}/), а не сам путь, чтобы не плодить серии
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started,
+                                          scope['method'], route, str(status_code))
+            _request_stats.reset(token)
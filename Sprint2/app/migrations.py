@@ -0,0 +1,264 @@
+"""
+Версионные миграции схемы. sql/init_db.sql — исходная схема (версия 0), изменения после неё —
+файлы sql/migrations/NNNN_описание.sql. Они применяются по возрастанию номера и записываются
+в schema_migrations с контрольной суммой: файл, изменённый после применения, — ошибка.
+
+Первая строка файла задаёт режим:
+    -- migrate: transaction      весь файл в одной транзакции (по умолчанию); ожидание блокировок
+                                 ограничено lock_timeout, чтобы DDL не вставал в очередь
+                                 перед всеми запросами к таблице
+    -- migrate: no-transaction   каждый оператор отдельно вне транзакции (CREATE INDEX CONCURRENTLY);
+                                 операторы разделяются «;» в конце строки, функций в таких файлах нет
+    -- migrate: batch            один оператор обрабатывает пачку из %(batch_size)s строк с ключом
+                                 больше %(after)s и возвращает last_id — последний ключ пачки
+                                 (NULL, когда строк не осталось); каждая пачка — своя транзакция
+
+    python app/migrations.py             применить новые миграции
+    python app/migrations.py --status    показать применённые и ожидающие
+
+Одновременный запуск из нескольких процессов исключается рекомендательной блокировкой (advisory lock).
+"""
+
+import os
+import re
+import time
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent / 'sql' / 'migrations'
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+MIGRATION_MODE = re.compile(r'^--\s*migrate:\s*([\w-]+)\s*$')
+MIGRATION_MODES = ('transaction', 'no-transaction', 'batch')
+
+# Ключ pg_advisory_lock, под которым выполняются миграции
+MIGRATION_LOCK_KEY = 73012021
+
+CREATE_MIGRATIONS_TABLE_QUERY = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        duration_ms INTEGER NOT NULL
+    )
+"""
+
+APPLIED_MIGRATIONS_QUERY = """
+    SELECT version, checksum FROM schema_migrations ORDER BY version
+"""
+
+RECORD_MIGRATION_QUERY = """
+    INSERT INTO schema_migrations (version, name, checksum, duration_ms)
+    VALUES (%s, %s, %s, %s)
+"""
+
+# Прерванный CREATE INDEX CONCURRENTLY оставляет нерабочий (INVALID) индекс,
+# который IF NOT EXISTS уже не пересоздаст: перед повтором он удаляется
+INVALID_INDEX_QUERY = """
+    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+    WHERE c.relname = %s AND NOT i.indisvalid
+"""
+
+CONCURRENT_INDEX = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)',
+                              re.IGNORECASE)
+
+
+class Migration:
+    """Файл миграции: номер, имя, режим, текст и контрольная сумма"""
+
+    def __init__(self, version: int, name: str, sql: str):
+        self.version = version
+        self.name = name
+        # Контрольная сумма не должна зависеть от окончаний строк в рабочей копии
+        self.sql = sql.replace('\r\n', '\n')
+        match = MIGRATION_MODE.match(self.sql.lstrip().split('\n', 1)[0])
+        self.mode = match.group(1) if match else 'transaction'
+        if self.mode not in MIGRATION_MODES:
+            raise ValueError(f"Migration {version}_{name}: unknown mode {self.mode}")
+        self.checksum = hashlib.sha256(self.sql.encode('utf-8')).hexdigest()
+
+    def __repr__(self) -> str:
+        return f"Migration({self.version}, {self.name!r}, {self.mode!r})"
+
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """Миграции каталога по возрастанию номера; номера не повторяются"""
+    migrations = {}
+    for path in sorted(directory.glob('*.sql')):
+        match = MIGRATION_FILE.match(path.name)
+        if not match:
+            raise ValueError(f"Unexpected migration file name {path.name}")
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"Duplicate migration version {version}: {path.name}")
+        migrations[version] = Migration(version, match.group(2), path.read_text(encoding='utf-8'))
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def pending_migrations(migrations: List[Migration], applied: Dict[int, str]) -> List[Migration]:
+    """Ещё не применённые миграции; если файл применённой миграции изменился — ValueError"""
+    pending = []
+    for migration in migrations:
+        checksum = applied.get(migration.version)
+        if checksum is None:
+            pending.append(migration)
+        elif checksum.strip() != migration.checksum:
+            raise ValueError(f"Migration {migration.version}_{migration.name} was changed after it was applied")
+    return pending
+
+
+def split_statements(sql: str) -> List[str]:
+    """Операторы файла no-transaction без строк-комментариев"""
+    statements = []
+    for chunk in re.split(r';[ \t]*(?:\n|$)', sql):
+        lines = [line for line in chunk.split('\n')
+                 if line.strip() and not line.strip().startswith('--')]
+        if lines:
+            statements.append('\n'.join(lines))
+    return statements
+
+
+def apply_transaction(conn, migration: Migration, lock_timeout: str):
+    """Весь файл одним вызовом; фиксирует транзакцию вызывающий вместе с записью о миграции"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT set_config('lock_timeout', %s, true)", (lock_timeout,))
+        cursor.execute(migration.sql)
+
+
+def apply_statements(conn, migration: Migration):
+    """Каждый оператор в autocommit: CREATE INDEX CONCURRENTLY нельзя выполнить в транзакции"""
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            for sql in split_statements(migration.sql):
+                index = CONCURRENT_INDEX.search(sql)
+                if index:
+                    cursor.execute(INVALID_INDEX_QUERY, (index.group(1),))
+                    if cursor.fetchone():
+                        logger.warning(f"Dropping invalid index {index.group(1)} left by an interrupted migration")
+                        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index.group(1)}")
+                cursor.execute(sql)
+    finally:
+        conn.autocommit = False
+
+
+def apply_batches(conn, migration: Migration, batch_size: int, pause: float = 0.0) -> int:
+    """
+    Повторяет оператор пачками до пустой пачки, каждая пачка фиксируется отдельно:
+    блокировки строк держатся недолго, прерванную миграцию можно запустить заново.
+    Возвращает число обработанных пачек.
+    """
+    after, batches = 0, 0
+    with conn.cursor() as cursor:
+        while True:
+            # Триггеры отличают фоновое заполнение от правок (bump_pereval_version не меняет версию)
+            cursor.execute("SELECT set_config('fstr.backfill', 'on', true)")
+            cursor.execute(migration.sql, {'after': after, 'batch_size': batch_size})
+            last_id = cursor.fetchone()[0]
+            conn.commit()
+            if last_id is None:
+                return batches
+            after, batches = last_id, batches + 1
+            logger.info(f"Migration {migration.version}_{migration.name}: batch {batches} done (last id {after})")
+            if pause:
+                time.sleep(pause)
+
+
+def applied_migrations(conn) -> Dict[int, str]:
+    """
+    Номера применённых миграций и их контрольные суммы. Транзакция чтения завершается:
+    psycopg2 не даёт переключить autocommit (миграции no-transaction) внутри открытой транзакции
+    """
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('schema_migrations')")
+            if cursor.fetchone()[0] is None:
+                return {}
+            cursor.execute(APPLIED_MIGRATIONS_QUERY)
+            return {version: checksum for version, checksum in cursor.fetchall()}
+    finally:
+        conn.rollback()
+
+
+def migrate(conn, target: Optional[int] = None, batch_size: int = 5000, lock_timeout: str = '5s',
+            batch_pause: float = 0.0, directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    """Применяет новые миграции (до target включительно) и возвращает применённые"""
+    migrations = [migration for migration in load_migrations(directory)
+                  if target is None or migration.version <= target]
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(CREATE_MIGRATIONS_TABLE_QUERY)
+        conn.commit()
+
+        pending = pending_migrations(migrations, applied_migrations(conn))
+        for migration in pending:
+            logger.info(f"Applying migration {migration.version}_{migration.name} ({migration.mode})")
+            started = time.monotonic()
+            if migration.mode == 'no-transaction':
+                apply_statements(conn, migration)
+            elif migration.mode == 'batch':
+                apply_batches(conn, migration, batch_size, batch_pause)
+            else:
+                apply_transaction(conn, migration, lock_timeout)
+
+            duration_ms = int((time.monotonic() - started) * 1000)
+            with conn.cursor() as cursor:
+                cursor.execute(RECORD_MIGRATION_QUERY,
+                               (migration.version, migration.name, migration.checksum, duration_ms))
+            conn.commit()
+            logger.info(f"Migration {migration.version}_{migration.name} applied in {duration_ms} ms")
+        return pending
+
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Миграции схемы базы данных")
+    parser.add_argument('--status', action='store_true', help="Показать состояние миграций и выйти")
+    parser.add_argument('--target', type=int, help="Применить миграции до этого номера включительно")
+    parser.add_argument('--batch-size', type=int, default=int(os.getenv('FSTR_MIGRATE_BATCH_SIZE', '5000')),
+                        help="Строк в одной пачке миграций batch")
+    parser.add_argument('--batch-pause', type=float, default=float(os.getenv('FSTR_MIGRATE_BATCH_PAUSE', '0')),
+                        help="Пауза между пачками, секунд")
+    parser.add_argument('--lock-timeout', default=os.getenv('FSTR_MIGRATE_LOCK_TIMEOUT', '5s'),
+                        help="Сколько DDL ждёт блокировку таблицы")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    db_manager = DatabaseManager()
+    if not db_manager.connect():
+        raise SystemExit("Cannot connect to database")
+    try:
+        with db_manager.pool.connection() as conn:
+            if args.status:
+                applied = applied_migrations(conn)
+                for migration in load_migrations():
+                    state = 'applied' if migration.version in applied else 'pending'
+                    print(f"{migration.version:04d}_{migration.name} ({migration.mode}): {state}")
+                return
+            applied = migrate(conn, args.target, args.batch_size, args.lock_timeout, args.batch_pause)
+            print(f"Applied {len(applied)} migration(s)")
+    finally:
+        db_manager.close()
+
+
+if __name__ == '__main__':
+    main()
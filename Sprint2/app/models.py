@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, validator
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class User(BaseModel):
@@ -54,6 +54,17 @@ class Image(BaseModel):
     title: str = Field(..., example="Седловина", description="Название изображения")
     img_url: str = Field(..., example="https://example.com/image.jpg", description="URL изображения")
 
+class ImageInfo(Image):
+    """
+    Изображение в карточке перевала: для загруженных через /images/ и ссылок http(s) — размеры и превью.
+    """
+    width: Optional[int] = Field(None, description="Ширина оригинала, px")
+    height: Optional[int] = Field(None, description="Высота оригинала, px")
+    thumb_url: Optional[str] = Field(None, description="URL превью")
+    thumb_width: Optional[int] = None
+    thumb_height: Optional[int] = None
+    processing_status: str = Field("none", description="none, pending, ready или failed")
+
 class PerevalData(BaseModel):
     beautyTitle: str = Field(..., example="пер.", description="Краткое название перевала")
     title: str = Field(..., example="Пхия", description="Название перевала")
@@ -71,6 +82,27 @@ class PerevalSubmitRequest(BaseModel):
     images: List[Image]
     activities: List[int] = Field(..., example=[1, 2], description="ID видов деятельности")
 
+class PerevalUpdateData(BaseModel):
+    """
+    Изменяемые поля перевала для PATCH: переданные поля заменяются, остальные не меняются.
+    Данные пользователя изменить нельзя, поле user игнорируется.
+    """
+    beautyTitle: Optional[str] = Field(None, example="пер.", description="Краткое название перевала")
+    title: Optional[str] = Field(None, example="Пхия", description="Название перевала")
+    other_titles: Optional[str] = Field(None, example="Триев", description="Альтернативные названия")
+    connect: Optional[str] = Field(None, example="", description="Соединения с другими перевалами")
+    coords: Optional[Coords]
+    level: Optional[Level]
+
+class PerevalUpdateRequest(BaseModel):
+    """
+    Модель запроса на редактирование перевала. Списки images и activities, если переданы,
+    заменяют текущие целиком; неизменившиеся элементы в базе не перезаписываются.
+    """
+    data: PerevalUpdateData = Field(default_factory=PerevalUpdateData)
+    images: Optional[List[Image]] = None
+    activities: Optional[List[int]] = Field(None, example=[1, 2], description="ID видов деятельности")
+
 class SubmitResponse(BaseModel):
     """
     Модель ответа после добавления перевала.
@@ -79,6 +111,42 @@ class SubmitResponse(BaseModel):
     message: str = Field(..., example="Запись успешно добавлена", description="Сообщение о результате")
     id: Optional[int] = Field(None, example=1, description="ID добавленного перевала")
 
+class SubmitTicketResponse(BaseModel):
+    """
+    Ответ в режиме отложенной записи: перевал будет добавлен в фоне.
+    """
+    status: int = Field(..., example=202, description="HTTP статус код")
+    message: str = Field(..., example="Запись принята в обработку", description="Сообщение о результате")
+    id: Optional[int] = Field(None, description="ID перевала появится в состоянии номера")
+    ticket: str = Field(..., example="7f1c2a9e-5b1d-4c36-9a57-3c2e8d0f4b61", description="Номер запроса в очереди")
+
+class SubmissionStatusResponse(BaseModel):
+    """
+    Состояние запроса в очереди отложенной записи.
+    """
+    ticket: str
+    status: str = Field(..., example="done", description="queued, done или failed")
+    id: Optional[int] = Field(None, example=1, description="ID добавленного перевала (status = done)")
+    error: Optional[str] = Field(None, description="Ошибка, если перевал не добавлен (status = failed)")
+    created_at: datetime
+    processed_at: Optional[datetime] = None
+
+class BulkSubmitItemResult(BaseModel):
+    """
+    Результат добавления одного перевала из пакета.
+    """
+    index: int = Field(..., example=0, description="Позиция в запросе")
+    id: Optional[int] = Field(None, example=1, description="ID добавленного перевала")
+    error: Optional[str] = Field(None, description="Ошибка, если перевал не добавлен")
+
+class BulkSubmitResponse(BaseModel):
+    """
+    Модель ответа после пакетного добавления перевалов.
+    """
+    status: int = Field(..., example=200, description="HTTP статус код")
+    message: str = Field(..., example="Добавлено 2 из 2", description="Сообщение о результате")
+    results: List[BulkSubmitItemResult]
+
 class Activity(BaseModel):
     """
     Модель вида деятельности для перевала.
@@ -91,6 +159,12 @@ class ActivitiesResponse(BaseModel):
     Модель ответа со списком видов деятельности.
     """
     activities: List[Activity]
+
+class DifficultyLevelsResponse(BaseModel):
+    """
+    Модель ответа со списком категорий трудности.
+    """
+    levels: List[str] = Field(..., example=["", "1А", "1Б"], description="Категории трудности")
 class PerevalResponse(BaseModel):
     id: int
     status: str
@@ -101,18 +175,90 @@ class PerevalResponse(BaseModel):
     user: User
     coords: Coords
     level: Level
-    images: List[Image]
+    images: List[ImageInfo]
     activities: List[int]
+    version: int = Field(1, description="Версия записи, увеличивается при каждом изменении (ETag)")
+
+class ImageUploadResponse(BaseModel):
+    status: int = Field(..., example=202)
+    message: str
+    id: Optional[int] = Field(None, description="ID изображения, обработка идёт в фоне")
 
 class PerevalUpdateResponse(BaseModel):
     state: int = Field(..., description="1 - успешно, 0 - ошибка")
     message: str = Field(..., description="Описание результата")
 
+class PerevalGeoSummary(BaseModel):
+    """
+    Краткая карточка перевала для карты (строка NDJSON в геопоиске).
+    """
+    id: int
+    title: str
+    status: str
+    coords: Coords
+    distance_km: Optional[float] = Field(None, description="Расстояние до точки поиска, км")
+
+class PerevalSearchResult(BaseModel):
+    """
+    Найденный перевал: названия, статус и координаты без пользователя и изображений.
+    """
+    id: int
+    title: str
+    beautyTitle: str
+    other_titles: str
+    status: str
+    coords: Coords
+    rank: float = Field(..., description="Релевантность, больше — лучше")
+
+class PerevalSearchResponse(BaseModel):
+    perevals: List[PerevalSearchResult]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы, null на последней")
+
 class PerevalShortInfo(BaseModel):
     id: int
     title: str
     status: str
     date_added: Optional[str]
 
+class ModerationQueueResponse(BaseModel):
+    perevals: List[PerevalShortInfo]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы, null на последней")
+
+class ModerationClaimResponse(BaseModel):
+    perevals: List[PerevalShortInfo] = Field(..., description="Записи, переведённые в 'pending'")
+
+class ModerationStatusResult(BaseModel):
+    id: int
+    status: Optional[str] = Field(None, description="Статус после запроса, null — перевал не найден")
+    updated: bool
+    error: Optional[str] = None
+
+class ModerationStatusResponse(BaseModel):
+    results: List[ModerationStatusResult]
+
 class UserPerevalsResponse(BaseModel):
-    perevals: List[PerevalShortInfo]
\ No newline at end of file
+    perevals: List[PerevalShortInfo]
+    next_cursor: Optional[str] = Field(None, description="Курсор следующей страницы, null на последней")
+
+class ActivityCount(BaseModel):
+    id: int = Field(..., example=1)
+    title: str = Field(..., example="пешком")
+    count: int = Field(..., example=12)
+
+class StatsResponse(BaseModel):
+    """
+    Статистика перевалов. by_status — по всем статусам, остальные поля — по статусу из запроса.
+    """
+    total: int = Field(..., example=120)
+    by_status: Dict[str, int] = Field(..., example={"new": 30, "pending": 10, "accepted": 75, "rejected": 5})
+    by_level: Dict[str, Dict[str, int]] = Field(..., example={"winter": {"1А": 40}, "summer": {"1А": 52, "2Б": 8}},
+                                                description="Число перевалов по категориям трудности в каждом сезоне")
+    by_activity: List[ActivityCount]
+
+class UserStatsResponse(BaseModel):
+    """
+    Число перевалов пользователя по статусам.
+    """
+    email: str = Field(..., example="user@example.com")
+    total: int = Field(..., example=4)
+    by_status: Dict[str, int] = Field(..., example={"new": 1, "pending": 0, "accepted": 3, "rejected": 0})
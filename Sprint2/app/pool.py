@@ -0,0 +1,214 @@
+"""
+Пул соединений с PostgreSQL для DatabaseManager.
+Ограничивает число соединений, проверяет их перед выдачей
+и собирает счётчики для подбора размера пула.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolError(Exception):
+    """Ошибка работы с пулом соединений"""
+
+
+class PoolTimeoutError(PoolError):
+    """Не удалось получить соединение за отведённое время"""
+
+
+class ConnectionPool:
+    def __init__(self, connect: Callable[[], Any], minconn: int = 1, maxconn: int = 10,
+                 timeout: float = 5.0, max_lifetime: float = 1800.0, pre_ping: bool = True,
+                 on_wait: Optional[Callable[[float], None]] = None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Некорректные границы пула: нужно 0 <= min <= max, max >= 1")
+
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self.on_wait = on_wait    # вызывается с временем ожидания каждой выдачи (метрики)
+
+        self._cond = threading.Condition()
+        self._idle = deque()      # свободные соединения, выдаём последнее вернувшееся
+        self._born = {}           # id(conn) -> время создания
+        self._size = 0            # всего открытых (или открываемых) соединений
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        # Счётчики для мониторинга
+        self._acquired = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._broken = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        for _ in range(minconn):
+            self._idle.append(self._open())
+            self._size += 1
+
+    def _open(self):
+        conn = self._connect()
+        self._born[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._born.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled connection: {e}")
+
+    def _expired(self, conn) -> bool:
+        if not self.max_lifetime:
+            return False
+        born = self._born.get(id(conn), 0.0)
+        return time.monotonic() - born > self.max_lifetime
+
+    def _alive(self, conn) -> bool:
+        if getattr(conn, 'closed', False):
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Pooled connection failed pre-ping: {e}")
+            return False
+
+    def _checkout(self, conn):
+        """Проверяет соединение перед выдачей, при необходимости заменяет новым"""
+        if conn is None:
+            return self._open()
+        if self._expired(conn):
+            self._discard(conn)
+            with self._cond:
+                self._recycled += 1
+            return self._open()
+        if not self._alive(conn):
+            self._discard(conn)
+            with self._cond:
+                self._broken += 1
+            return self._open()
+        return conn
+
+    def getconn(self):
+        """Берёт соединение из пула, ожидая не дольше timeout секунд"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Пул соединений закрыт")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений за {self.timeout} с (max={self.maxconn})"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+
+        try:
+            conn = self._checkout(conn)
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        if self.on_wait:
+            self.on_wait(waited)
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Возвращает соединение в пул, незавершённая транзакция откатывается"""
+        if not discard and not getattr(conn, 'closed', False):
+            try:
+                conn.rollback()
+            except Exception:
+                discard = True
+        else:
+            discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append(conn)
+                conn = None
+            self._cond.notify()
+
+        if conn is not None:
+            self._discard(conn)
+
+    @contextmanager
+    def connection(self):
+        """Соединение на время блока with, после блока возвращается в пул"""
+        conn = self.getconn()
+        try:
+            yield conn
+        except Exception:
+            self.putconn(conn, discard=bool(getattr(conn, 'closed', False)))
+            raise
+        else:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Текущее состояние пула и накопленные счётчики"""
+        with self._cond:
+            return {
+                'min_size': self.minconn,
+                'max_size': self.maxconn,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'acquired_total': self._acquired,
+                'timeouts_total': self._timeouts,
+                'recycled_total': self._recycled,
+                'broken_total': self._broken,
+                'wait_time_total': round(self._wait_total, 6),
+                'wait_time_max': round(self._wait_max, 6),
+                'wait_time_avg': round(self._wait_total / self._acquired, 6) if self._acquired else 0.0,
+            }
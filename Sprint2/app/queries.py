@@ -0,0 +1,62 @@
+"""
+Реестр именованных SQL-запросов. Statement — это строка запроса (её по-прежнему можно
+передать в execute), у которой есть имя и список полей результата. Строки результата
+читаются по этим именам (dict_row / RealDictCursor), а не по позиции. Курсоры приложения
+сверяют объявленные поля с фактическими при первом выполнении запроса в процессе
+(check_columns), поэтому разошедшиеся с SQL поля — ошибка, а не отсутствующий ключ в строке.
+
+Асинхронный курсор выполняет запросы из реестра с prepare=True: psycopg подготавливает
+оператор на сервере при первом выполнении на соединении пула и дальше вызывает его по имени,
+без повторного разбора и планирования. Собранные динамически запросы (фильтры, курсоры страниц)
+готовятся после FSTR_DB_PREPARE_THRESHOLD выполнений одного и того же текста.
+"""
+
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+
+class StatementColumnsMismatch(RuntimeError):
+    """Поля результата запроса не совпадают с объявленными в statement(..., columns=...)"""
+
+
+class Statement(str):
+    """Текст запроса с именем и полями результата"""
+
+    name: str
+    columns: Tuple[str, ...]
+
+    def __new__(cls, name: str, text: str, columns: Iterable[str] = ()):
+        statement = super().__new__(cls, text)
+        statement.name = name
+        statement.columns = tuple(columns)
+        # Поля уже сверены с результатом (check_columns)
+        statement.checked = False
+        return statement
+
+    def __repr__(self) -> str:
+        return f"Statement({self.name!r})"
+
+
+STATEMENTS: Dict[str, Statement] = {}
+
+
+def statement(name: str, text: str, columns: Iterable[str] = ()) -> Statement:
+    """Регистрирует запрос; имя должно быть уникальным"""
+    if name in STATEMENTS:
+        raise ValueError(f"Statement {name} is already registered")
+    STATEMENTS[name] = Statement(name, text, columns)
+    return STATEMENTS[name]
+
+
+def check_columns(query, description: Optional[Sequence]):
+    """
+    Сверяет поля результата запроса из реестра с объявленными: один раз на запрос в процессе,
+    при первом выполнении. Без description (серверный курсор до первого fetch) проверка
+    откладывается до следующего выполнения. Для остальных запросов ничего не делает
+    """
+    if not isinstance(query, Statement) or query.checked or description is None:
+        return
+    actual = tuple(column.name for column in description)
+    if actual != query.columns:
+        raise StatementColumnsMismatch(f"Statement {query.name} returns columns {actual}, "
+                                       f"declared {query.columns}")
+    query.checked = True
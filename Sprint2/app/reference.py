@@ -0,0 +1,68 @@
+"""
+Справочники в памяти процесса: виды деятельности (spr_activities_types) и категории
+трудности. Загружаются при старте, обновляются по NOTIFY reference_changed или по таймеру
+и позволяют отклонить неизвестные ID видов деятельности до начала транзакции.
+"""
+
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from serialization import dumps
+from queries import statement
+
+# Канал NOTIFY, в который пишет триггер на spr_activities_types
+REFERENCE_CHANNEL = 'reference_changed'
+
+ACTIVITY_TYPES_QUERY = statement('activity_types', """
+    SELECT id, title FROM spr_activities_types ORDER BY id
+""", columns=('id', 'title'))
+
+# Категории трудности перевалов (ФСТР); пустая строка — категория не указана
+DIFFICULTY_LEVELS = ('', 'н/к', '1А', '1Б', '2А', '2Б', '3А', '3Б', '3Б*')
+
+
+class UnknownActivityTypes(ValueError):
+    """В запросе есть ID видов деятельности, которых нет в справочнике"""
+
+    def __init__(self, activity_ids: List[int]):
+        self.activity_ids = activity_ids
+        super().__init__(f"Неизвестные виды деятельности: {', '.join(map(str, activity_ids))}")
+
+
+class ActivityTypes:
+    """
+    Справочник видов деятельности. Таблица заменяется целиком при перезагрузке,
+    готовое тело ответа и ETag считаются один раз.
+    """
+
+    def __init__(self):
+        self._titles: Dict[int, str] = {}
+        self.body: Optional[bytes] = None
+        self.etag: Optional[str] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.body is not None
+
+    def replace(self, rows: Iterable[Tuple[int, str]]):
+        titles = {activity_id: title for activity_id, title in rows}
+        body = dumps({'activities': [{'id': activity_id, 'title': title}
+                                     for activity_id, title in sorted(titles.items())]})
+        # Одно присваивание на атрибут: читающие запросы видят либо старую, либо новую таблицу
+        self._titles = titles
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+
+    def items(self) -> List[Dict[str, Any]]:
+        return [{'id': activity_id, 'title': title} for activity_id, title in sorted(self._titles.items())]
+
+    def unknown(self, activity_ids: Iterable[int]) -> List[int]:
+        """ID, которых нет в справочнике; пока он не загружен, проверку оставляем внешнему ключу"""
+        if not self.loaded:
+            return []
+        titles = self._titles
+        return sorted({activity_id for activity_id in activity_ids if activity_id not in titles})
+
+    def check(self, activity_ids: Iterable[int]):
+        unknown = self.unknown(activity_ids)
+        if unknown:
+            raise UnknownActivityTypes(unknown)
@@ -0,0 +1,207 @@
+"""
+Чтение с реплик. FSTR_DB_REPLICAS — реплики через запятую: host[:port] (логин, пароль и база
+те же, что у основного сервера) или полная строка подключения (postgresql://... или key=value).
+
+Читающие методы AsyncDatabaseManager выполняются на репликах по кругу. Реплика не получает
+запросы, пока не отвечает, вышла из режима восстановления (её повысили до основного сервера)
+или отстаёт больше чем на FSTR_DB_REPLICA_MAX_LAG секунд. Без исправных реплик чтение идёт
+на основной сервер.
+
+Чтение своих записей: после успешного изменяющего запроса клиент получает cookie с позицией WAL
+основного сервера (LSN) на FSTR_DB_READ_YOUR_WRITES_SECONDS секунд. Пока cookie действует, чтения
+этого клиента идут только на реплики, применившие WAL до этой позиции, остальные — на основной сервер.
+"""
+
+import os
+import logging
+import itertools
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from psycopg.conninfo import conninfo_to_dict, make_conninfo
+
+from queries import statement
+
+logger = logging.getLogger(__name__)
+
+REPLICA_MAX_LAG = float(os.getenv('FSTR_DB_REPLICA_MAX_LAG', '5'))
+READ_YOUR_WRITES_SECONDS = int(os.getenv('FSTR_DB_READ_YOUR_WRITES_SECONDS', '10'))
+READ_AFTER_COOKIE = 'fstr_read_after'
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# LSN, который реплика должна применить, чтобы обслужить чтение текущего запроса (из cookie клиента)
+READ_AFTER_LSN: ContextVar[Optional[int]] = ContextVar('fstr_read_after_lsn', default=None)
+
+# Отставание считается по времени последней применённой транзакции, но только пока есть что
+# применять: на простаивающем основном сервере это время стоит на месте, а реплика не отстаёт
+REPLICA_STATUS_QUERY = statement('replica_status', """
+    SELECT pg_is_in_recovery() AS in_recovery,
+           pg_last_wal_replay_lsn()::text AS replay_lsn,
+           CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END::float AS lag
+""", columns=('in_recovery', 'replay_lsn', 'lag'))
+
+CURRENT_WAL_LSN_QUERY = statement('current_wal_lsn', """
+    SELECT pg_current_wal_lsn()::text AS lsn
+""", columns=('lsn',))
+
+
+def parse_lsn(text: Optional[str]) -> Optional[int]:
+    """'16/B374D848' -> число для сравнения позиций; None для пустого или неверного значения"""
+    if not text:
+        return None
+    high, separator, low = text.partition('/')
+    if not separator:
+        return None
+    try:
+        return (int(high, 16) << 32) | int(low, 16)
+    except ValueError:
+        return None
+
+
+class Replica:
+    """Реплика: строка подключения, свой пул и результат последней проверки"""
+
+    def __init__(self, name: str, conninfo: str):
+        self.name = name
+        self.conninfo = conninfo
+        self.pool = None
+        # До первой успешной проверки реплика запросов не получает
+        self.healthy = False
+        self.lag = 0.0
+        self.replay_lsn = 0
+        self.reads = 0
+        self.failures = 0
+
+    def mark_down(self, reason: str):
+        if self.healthy:
+            logger.warning(f"Replica {self.name} excluded from reads: {reason}")
+        self.healthy = False
+        self.failures += 1
+
+    def update(self, in_recovery: bool, replay_lsn: Optional[str], lag: float, max_lag: float):
+        """Результат проверки: исправна, если в восстановлении и отстаёт не больше max_lag"""
+        self.lag = lag
+        self.replay_lsn = parse_lsn(replay_lsn) or 0
+        if not in_recovery:
+            self.mark_down("server is not in recovery")
+        elif lag > max_lag:
+            self.mark_down(f"lag {lag:.1f} s exceeds {max_lag:g} s")
+        elif not self.healthy:
+            logger.info(f"Replica {self.name} is available for reads (lag {lag:.3f} s)")
+            self.healthy = True
+
+
+class ReplicaSet:
+    """Реплики основного сервера и выбор реплики для чтения по кругу"""
+
+    def __init__(self, replicas: List[Replica], max_lag: float = REPLICA_MAX_LAG):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self._turn = itertools.count()
+        # Чтений, ушедших на основной сервер, хотя реплики настроены
+        self.primary_reads = 0
+
+    def __bool__(self) -> bool:
+        return bool(self.replicas)
+
+    def __iter__(self):
+        return iter(self.replicas)
+
+    def choose(self, read_after: Optional[int] = None) -> Optional[Replica]:
+        """Следующая исправная реплика, применившая WAL до read_after; None — читать с основного"""
+        candidates = [replica for replica in self.replicas
+                      if replica.healthy and replica.pool is not None
+                      and (read_after is None or replica.replay_lsn >= read_after)]
+        if not candidates:
+            return None
+        return candidates[next(self._turn) % len(candidates)]
+
+    def stats(self) -> Dict[str, Any]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        return {
+            'configured': len(self.replicas),
+            'healthy': len(healthy),
+            'replica_reads': sum(replica.reads for replica in self.replicas),
+            'primary_reads': self.primary_reads,
+            'failures': sum(replica.failures for replica in self.replicas),
+            'max_lag_seconds': round(max((replica.lag for replica in healthy), default=0.0), 3),
+        }
+
+
+def request_cookie(scope, name: str) -> Optional[str]:
+    """Значение cookie запроса из заголовков ASGI"""
+    for header, value in scope.get('headers', ()):
+        if header == b'cookie':
+            for pair in value.decode('latin-1').split(';'):
+                key, _, cookie = pair.strip().partition('=')
+                if key == name:
+                    return cookie
+    return None
+
+
+class ReadYourWritesMiddleware:
+    """
+    ASGI-middleware чтения своих записей: LSN из cookie клиента передаёт менеджеру через
+    READ_AFTER_LSN, после успешного изменяющего запроса ставит cookie с позицией WAL
+    основного сервера. Без реплик ничего не делает.
+    """
+
+    def __init__(self, app, replicas: ReplicaSet, current_lsn: Callable[[], Awaitable[str]],
+                 window: int = READ_YOUR_WRITES_SECONDS):
+        self.app = app
+        self.replicas = replicas
+        self.current_lsn = current_lsn
+        self.window = window
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        token = READ_AFTER_LSN.set(parse_lsn(request_cookie(scope, READ_AFTER_COOKIE)))
+        write = scope['method'] in WRITE_METHODS
+
+        async def send_wrapper(message):
+            # Заголовки ответа уходят после того, как обработчик зафиксировал транзакцию
+            if write and message['type'] == 'http.response.start' and message['status'] < 400:
+                try:
+                    lsn = await self.current_lsn()
+                except Exception as e:
+                    logger.warning(f"Cannot read WAL position for read-your-writes: {e}")
+                else:
+                    cookie = f"{READ_AFTER_COOKIE}={lsn}; Max-Age={self.window}; Path=/; HttpOnly; SameSite=Lax"
+                    message = {**message, 'headers': list(message.get('headers', [])) +
+                               [(b'set-cookie', cookie.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            READ_AFTER_LSN.reset(token)
+
+
+def parse_replicas(value: str, defaults: Dict[str, Any]) -> List[Replica]:
+    """Реплики из FSTR_DB_REPLICAS; недостающие параметры подключения берутся из defaults"""
+    replicas = []
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        if '=' in entry or '://' in entry:
+            params = conninfo_to_dict(entry)
+            conninfo = make_conninfo(entry, **{key: default for key, default in defaults.items()
+                                               if key not in params})
+        else:
+            host, _, port = entry.partition(':')
+            conninfo = make_conninfo(**{**defaults, 'host': host, 'port': port or '5432'})
+        params = conninfo_to_dict(conninfo)
+        replicas.append(Replica(f"{params.get('host', '')}:{params.get('port', '5432')}", conninfo))
+    return replicas
+
+
+def create_replica_set(settings) -> ReplicaSet:
+    """Реплики по FSTR_DB_REPLICAS с логином, паролем и базой основного сервера по умолчанию"""
+    defaults = {'user': settings.db_login, 'password': settings.db_pass, 'dbname': settings.db_name}
+    return ReplicaSet(parse_replicas(os.getenv('FSTR_DB_REPLICAS', ''), defaults))
@@ -0,0 +1,95 @@
+"""
+Поиск перевалов по названию: полнотекстовый (tsvector search_vector, индекс GIN)
+и нечёткий по триграммам (pg_trgm, колонка search_text) для опечаток и неполных названий.
+Запрос дополняется транслитерацией, чтобы «Pkhiya» находил «Пхия» и наоборот.
+"""
+
+import base64
+import re
+from typing import List, Tuple
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+SEARCH_MIN_QUERY_LENGTH = 2
+SEARCH_MAX_WORDS = 8
+
+# Порог pg_trgm.word_similarity_threshold: чем ниже, тем больше опечаток прощается
+# и тем больше строк приходится ранжировать
+SEARCH_SIMILARITY_THRESHOLD = 0.45
+
+CYRILLIC_TO_LATIN = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'yo', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh',
+    'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+}
+
+# Сначала длинные сочетания: «shch» раньше «sh», «kh» раньше «k»;
+# «y» после гласной перед согласной или в конце слова — «й» (Dombay → Домбай)
+LATIN_TO_CYRILLIC = [
+    ('shch', 'щ'), ('sch', 'щ'), ('yo', 'ё'), ('zh', 'ж'), ('kh', 'х'), ('ts', 'ц'), ('ch', 'ч'),
+    ('sh', 'ш'), ('yu', 'ю'), ('ya', 'я'), ('ye', 'е'), ('ay', 'ай'), ('ey', 'ей'), ('iy', 'ий'),
+    ('oy', 'ой'), ('uy', 'уй'), ('a', 'а'), ('b', 'б'),
+    ('c', 'к'), ('d', 'д'), ('e', 'е'), ('f', 'ф'), ('g', 'г'), ('h', 'х'), ('i', 'и'), ('j', 'й'),
+    ('k', 'к'), ('l', 'л'), ('m', 'м'), ('n', 'н'), ('o', 'о'), ('p', 'п'), ('q', 'к'), ('r', 'р'),
+    ('s', 'с'), ('t', 'т'), ('u', 'у'), ('v', 'в'), ('w', 'в'), ('x', 'кс'), ('y', 'ы'), ('z', 'з'),
+]
+_LATIN_PATTERN = re.compile('|'.join(latin + '(?![aeiou])' if latin.endswith('y') and len(latin) == 2 else latin
+                                     for latin, _ in LATIN_TO_CYRILLIC))
+_LATIN_MAP = dict(LATIN_TO_CYRILLIC)
+
+_WORD = re.compile(r'[^\W_]+')
+_HAS_LATIN = re.compile(r'[a-z]')
+_HAS_CYRILLIC = re.compile(r'[а-яё]')
+
+
+def to_latin(text: str) -> str:
+    return ''.join(CYRILLIC_TO_LATIN.get(char, char) for char in text)
+
+
+def to_cyrillic(text: str) -> str:
+    return _LATIN_PATTERN.sub(lambda match: _LATIN_MAP[match.group()], text)
+
+
+def normalize_query(query: str) -> str:
+    """Слова запроса в нижнем регистре через пробел; ValueError, если искать нечего"""
+    words = _WORD.findall(query.lower())[:SEARCH_MAX_WORDS]
+    normalized = ' '.join(words)
+    if len(normalized) < SEARCH_MIN_QUERY_LENGTH:
+        raise ValueError(f"Поисковый запрос должен содержать не меньше {SEARCH_MIN_QUERY_LENGTH} символов")
+    return normalized
+
+
+def query_variants(query: str) -> List[str]:
+    """Запрос и его транслитерация в другую раскладку (без повторов)"""
+    normalized = normalize_query(query)
+    variants = [normalized]
+    if _HAS_LATIN.search(normalized):
+        variants.append(to_cyrillic(normalized))
+    if _HAS_CYRILLIC.search(normalized):
+        variants.append(to_latin(normalized))
+    return list(dict.fromkeys(variants))
+
+
+def build_tsquery(variants: List[str]) -> str:
+    """
+    Текст для to_tsquery('simple', ...): все слова варианта с поиском по префиксу,
+    варианты объединены через ИЛИ. Слова состоят только из букв и цифр, экранировать нечего.
+    """
+    return ' | '.join('(' + ' & '.join(f"{word}:*" for word in variant.split()) + ')'
+                      for variant in variants)
+
+
+def encode_search_cursor(rank: float, pereval_id: int) -> str:
+    raw = f"{rank!r}|{pereval_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    """Разбирает курсор поиска; при ошибке ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        rank_part, id_part = raw.rsplit('|', 1)
+        return float(rank_part), int(id_part)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Некорректный курсор") from e
@@ -0,0 +1,38 @@
+"""
+Быстрая сериализация ответов, собранных из строк базы: orjson, если он установлен,
+иначе стандартный json. Такие данные не проходят повторную валидацию pydantic,
+а схема OpenAPI по-прежнему берётся из response_model эндпоинта.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # необязательная зависимость, без неё работает стандартный json
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """JSON в UTF-8; Decimal (NUMERIC из базы) выводится числом, как после pydantic"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """Ответ для данных из собственной базы: без валидации response_model и jsonable_encoder"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,61 @@
+"""
+Запуск API в production: FSTR_WORKERS рабочих процессов uvicorn (по умолчанию — по числу ядер)
+принимают соединения с одного сокета, запросы распределяет ядро ОС.
+
+    python app/server.py
+    python app/server.py --workers 4 --port 8000
+
+Каждый процесс импортирует приложение заново и открывает свой пул соединений при старте,
+поэтому соединений с базой может быть до workers × FSTR_DB_POOL_MAX. Кэш карточек при
+нескольких процессах должен быть общим (FSTR_CACHE_BACKEND=redis), иначе карточка,
+изменённая в одном процессе, до истечения TTL отдаётся другими в старом виде.
+"""
+
+import os
+import logging
+import argparse
+from pathlib import Path
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = Path(__file__).resolve().parent
+
+
+def default_workers() -> int:
+    """FSTR_WORKERS или число ядер, доступных процессу"""
+    workers = int(os.getenv('FSTR_WORKERS', '0'))
+    if workers > 0:
+        return workers
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Запуск Pereval API в нескольких процессах")
+    parser.add_argument('--host', default=os.getenv('FSTR_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('FSTR_PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help="Число рабочих процессов (FSTR_WORKERS, по умолчанию — число ядер)")
+    parser.add_argument('--log-level', default=os.getenv('FSTR_LOG_LEVEL', 'info'))
+    parser.add_argument('--no-access-log', action='store_true', help="Не писать строку на каждый запрос")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.workers > 1 and os.getenv('FSTR_CACHE_BACKEND', 'memory').lower() == 'memory':
+        logger.warning(f"FSTR_CACHE_BACKEND=memory with {args.workers} workers: each process keeps "
+                       f"its own cache, use FSTR_CACHE_BACKEND=redis to share it")
+
+    logger.info(f"Starting {args.workers} worker(s) on {args.host}:{args.port}")
+    # Приложение передаётся строкой: каждый процесс импортирует его сам, ничего
+    # открытого до запуска процессов (пулы, задачи, сокеты Redis) не наследуется
+    uvicorn.run('main:app', host=args.host, port=args.port, workers=args.workers, app_dir=str(APP_DIR),
+                log_level=args.log_level, access_log=not args.no_access_log)
+
+
+if __name__ == '__main__':
+    main()
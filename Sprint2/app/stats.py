@@ -0,0 +1,76 @@
+"""
+Статистика перевалов для главной страницы: по статусам, категориям трудности, видам деятельности
+и по пользователю. Значения читаются из счётчиков stats_rollup и user_stats_rollup, которые
+триггеры обновляют при каждой записи (sql/migrations/0011), — без подсчёта по pereval_added.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from queries import statement
+from reference import DIFFICULTY_LEVELS
+
+PEREVAL_STATUSES = ('new', 'pending', 'accepted', 'rejected')
+SEASONS = ('winter', 'summer', 'autumn', 'spring')
+
+# Строк в результате не больше, чем сочетаний измерения, значения, статуса и shard:
+# размер не зависит от числа перевалов
+STATS_QUERY = statement('stats', """
+    SELECT dimension, key, status, sum(total)::bigint AS total
+    FROM stats_rollup
+    GROUP BY dimension, key, status
+    HAVING sum(total) <> 0
+""", columns=('dimension', 'key', 'status', 'total'))
+
+USER_STATS_QUERY = statement('user_stats', """
+    SELECT r.status, r.total
+    FROM users u
+    JOIN user_stats_rollup r ON r.user_id = u.id
+    WHERE u.email = %s AND r.total <> 0
+""", columns=('status', 'total'))
+
+
+def _level_order(level: str):
+    # Категории в порядке сложности, неизвестные значения — в конце по алфавиту
+    if level in DIFFICULTY_LEVELS:
+        return 0, DIFFICULTY_LEVELS.index(level), level
+    return 1, 0, level
+
+
+def stats_from_rows(rows: Iterable[Dict[str, Any]], activity_titles: Dict[int, str],
+                    status: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Ответ GET /stats/. by_status — всегда по всем статусам; total, by_level и by_activity —
+    по статусу status (или по всем перевалам, если он не задан)
+    """
+    by_status = dict.fromkeys(PEREVAL_STATUSES, 0)
+    levels: Dict[str, Dict[str, int]] = {season: {} for season in SEASONS}
+    activities: Dict[int, int] = {}
+    for row in rows:
+        if row['dimension'] == 'status':
+            by_status[row['key']] = by_status.get(row['key'], 0) + row['total']
+            continue
+        if status is not None and row['status'] != status:
+            continue
+        if row['dimension'] in levels:
+            season = levels[row['dimension']]
+            season[row['key']] = season.get(row['key'], 0) + row['total']
+        elif row['dimension'] == 'activity':
+            activity_id = int(row['key'])
+            activities[activity_id] = activities.get(activity_id, 0) + row['total']
+
+    return {
+        'total': by_status.get(status, 0) if status is not None else sum(by_status.values()),
+        'by_status': by_status,
+        'by_level': {season: {level: counts[level] for level in sorted(counts, key=_level_order)}
+                     for season, counts in levels.items()},
+        'by_activity': [{'id': activity_id, 'title': activity_titles.get(activity_id, ''), 'count': count}
+                        for activity_id, count in sorted(activities.items())],
+    }
+
+
+def user_stats_from_rows(email: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Ответ GET /stats/users/: перевалы пользователя по статусам (нули, если их нет)"""
+    by_status = dict.fromkeys(PEREVAL_STATUSES, 0)
+    for row in rows:
+        by_status[row['status']] = row['total']
+    return {'email': email, 'total': sum(by_status.values()), 'by_status': by_status}
@@ -0,0 +1,104 @@
+"""
+Отложенная запись перевалов (FSTR_SUBMIT_MODE=queue). POST /submitData/ после валидации
+сохраняет запрос одной строкой в submission_queue и сразу отвечает 202 с номером (ticket);
+время ответа не зависит от того, сколько перевалов база успевает записать.
+
+Фоновые обработчики забирают очередь пачками по FSTR_SUBMIT_BATCH_SIZE и добавляют перевалы
+одним запросом на пачку (как POST /submitData/bulk/). Новый запрос будит обработчики сразу,
+строки, поставленные другими процессами или до перезапуска, подбираются раз в
+FSTR_SUBMIT_POLL_INTERVAL секунд. Результат — GET /submitData/tickets/{ticket}/.
+"""
+
+import os
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from breaker import DatabaseUnavailable
+
+logger = logging.getLogger(__name__)
+
+SUBMIT_MODE = os.getenv('FSTR_SUBMIT_MODE', 'sync').lower()
+SUBMIT_DRAINERS = int(os.getenv('FSTR_SUBMIT_DRAINERS', '2'))
+SUBMIT_BATCH_SIZE = int(os.getenv('FSTR_SUBMIT_BATCH_SIZE', '200'))
+SUBMIT_POLL_INTERVAL = float(os.getenv('FSTR_SUBMIT_POLL_INTERVAL', '2'))
+
+
+class SubmissionQueue:
+    """Очередь отложенной записи и её обработчики"""
+
+    def __init__(self, db_manager, enabled: bool = SUBMIT_MODE == 'queue', drainers: int = SUBMIT_DRAINERS,
+                 batch_size: int = SUBMIT_BATCH_SIZE, poll_interval: float = SUBMIT_POLL_INTERVAL,
+                 on_drained: Optional[Callable[[], None]] = None):
+        self.db_manager = db_manager
+        # Вызывается после пачки с добавленными перевалами (обработка их изображений)
+        self.on_drained = on_drained
+        self.enabled = enabled
+        self.drainers = drainers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self.enqueued = 0
+        self.drained = 0
+        self.failed = 0
+        self.batches = 0
+        # Сколько секунд самая старая строка последней пачки ждала в очереди
+        self.lag = 0.0
+
+    def start(self):
+        if not self.enabled:
+            return
+        self._tasks = [asyncio.create_task(self._drainer()) for _ in range(self.drainers)]
+        logger.info(f"Submission queue started with {self.drainers} drainers (batch {self.batch_size})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def enqueue(self, item: Dict[str, Any], idempotency_key: Optional[str] = None) -> str:
+        """Сохраняет запрос в очередь и будит обработчики; возвращает номер"""
+        ticket = await self.db_manager.enqueue_submission(item, idempotency_key)
+        self.enqueued += 1
+        self._wakeup.set()
+        return ticket
+
+    async def drain(self) -> int:
+        """Обрабатывает пачки, пока очередь не опустеет; возвращает число обработанных строк"""
+        total = 0
+        while True:
+            results = await self.db_manager.drain_submissions(self.batch_size)
+            if results:
+                self.batches += 1
+                self.drained += len(results)
+                self.failed += sum(1 for result in results if result['id'] is None)
+                self.lag = max(result['age'] for result in results)
+                total += len(results)
+                if self.on_drained and any(result['id'] is not None for result in results):
+                    self.on_drained()
+            if len(results) < self.batch_size:
+                return total
+
+    def stats(self) -> Dict[str, Any]:
+        return {'enabled': int(self.enabled), 'drainers': len(self._tasks), 'enqueued': self.enqueued,
+                'drained': self.drained, 'failed': self.failed, 'batches': self.batches,
+                'lag_seconds': round(self.lag, 3)}
+
+    async def _drainer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                # Незавершённая транзакция откатывается, строки остаются в очереди
+                raise
+            except DatabaseUnavailable:
+                # Очередь дождётся базы: проверяет её фоновая задача менеджера
+                pass
+            except Exception as e:
+                logger.error(f"Submission queue drain failed: {e}")
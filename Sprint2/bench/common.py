@@ -0,0 +1,88 @@
+"""
+Общие функции бенчмарков: путь к модулям приложения, перцентили,
+запись отчёта в JSON, который удобно сравнивать между коммитами.
+"""
+
+import os
+import sys
+import json
+import math
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Модули приложения импортируются плоско (from database import ...), как в app/main.py
+sys.path.insert(0, str(ROOT / 'app'))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Перцентиль методом ближайшего ранга по отсортированному списку"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Сводка по одному сценарию: пропускная способность и p50/p95/p99 в миллисекундах"""
+    values = sorted(latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=ROOT, text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def report_meta(**extra) -> Dict[str, Any]:
+    meta = {
+        'commit': git_commit(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+    }
+    meta.update(extra)
+    return meta
+
+
+def write_report(path: str, meta: Dict[str, Any], results: Dict[str, Any]):
+    """Пишет отчёт с отсортированными ключами, чтобы diff между коммитами был читаемым"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'meta': meta, 'results': results}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f"Report written to {path}")
+
+
+def compare_reports(old_path: str, new_path: str):
+    """Печатает изменение throughput и перцентилей между двумя отчётами"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)['results']
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['results']
+
+    def walk(prefix, old_node, new_node):
+        for key in sorted(set(old_node) & set(new_node)):
+            a, b = old_node[key], new_node[key]
+            name = f"{prefix}.{key}" if prefix else key
+            if isinstance(a, dict) and isinstance(b, dict):
+                walk(name, a, b)
+            elif isinstance(a, (int, float)) and isinstance(b, (int, float)) and a:
+                print(f"{name:60} {a:>12} -> {b:>12} ({(b - a) / a * 100:+.1f}%)")
+
+    walk('', old, new)
+
@@ -0,0 +1,13 @@
+"""
+Сравнение двух отчётов бенчмарка (например, до и после коммита):
+
+    python bench/compare.py bench-old.json bench-new.json
+"""
+
+import sys
+from common import compare_reports
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.exit("usage: python bench/compare.py OLD.json NEW.json")
+    compare_reports(sys.argv[1], sys.argv[2])
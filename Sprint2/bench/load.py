@@ -0,0 +1,203 @@
+"""
+Нагрузочный тест API: каждый сценарий (карточка, список, PATCH, добавление)
+гоняется при фиксированных уровнях параллельности, результат пишется в JSON.
+
+    python bench/load.py --base-url http://localhost:8000 --concurrency 1,8,32 --duration 10 -o bench.json
+
+Соединения открываются потоками; против сервера с несколькими процессами клиенту самому
+нужно несколько процессов (--clients), иначе упор будет в GIL нагрузчика, а не в сервер.
+
+ID перевалов и email для запросов выбираются из базы (переменные FSTR_DB_*),
+поэтому сначала нужно заполнить её через bench/seed.py.
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+import multiprocessing
+from urllib.parse import urlsplit, quote
+from common import latency_summary, report_meta, write_report
+from database import DatabaseManager
+
+SCENARIOS = ('detail', 'listing', 'patch', 'submit')
+
+# На больших таблицах берём случайную выборку страниц, на маленьких — все строки
+SAMPLE_IDS_QUERY = """
+    SELECT id FROM pereval_added TABLESAMPLE SYSTEM (1) WHERE status = ANY(%s) LIMIT %s
+"""
+
+SAMPLE_IDS_FALLBACK_QUERY = """
+    SELECT id FROM pereval_added WHERE status = ANY(%s) LIMIT %s
+"""
+
+SAMPLE_EMAILS_QUERY = """
+    SELECT u.email
+    FROM users u
+    JOIN pereval_added pa ON pa.user_id = u.id
+    GROUP BY u.email
+    ORDER BY count(*) DESC
+    LIMIT %s
+"""
+
+
+def submit_body(n: int) -> dict:
+    return {
+        "data": {
+            "beautyTitle": "пер.",
+            "title": f"Нагрузка {n}",
+            "other_titles": "bench",
+            "connect": "",
+            "user": {"email": f"load{n % 1000}@example.com", "phone": "+79001234567",
+                     "fam": "Иванов", "name": "Иван", "otc": "Иванович"},
+            "coords": {"latitude": round(random.uniform(-70, 70), 6),
+                       "longitude": round(random.uniform(-180, 180), 6),
+                       "height": random.randint(500, 7000)},
+            "level": {"winter": "", "summer": "1А", "autumn": "1А", "spring": ""}
+        },
+        "images": [{"title": "Седловина", "img_url": "https://example.com/image.jpg"}],
+        "activities": [1, 2]
+    }
+
+
+class Scenario:
+    """Готовит запросы одного сценария: (метод, путь, тело)"""
+
+    def __init__(self, name: str, sample: dict, offset: int = 0):
+        self.name = name
+        self.sample = sample
+        # Процессы нагрузчика нумеруют добавляемые перевалы каждый со своего смещения
+        self._counter = offset
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        if self.name == 'detail':
+            return 'GET', f"/submitData/{random.choice(self.sample['ids'])}/", None
+        if self.name == 'listing':
+            email = quote(random.choice(self.sample['emails']))
+            return 'GET', f"/submitData/?user__email={email}&limit=50", None
+        with self._lock:
+            self._counter += 1
+            n = self._counter
+        if self.name == 'patch':
+            return 'PATCH', f"/submitData/{random.choice(self.sample['new_ids'])}/", submit_body(n)
+        return 'POST', "/submitData/", submit_body(n)
+
+
+def run_worker(base_url: str, scenario: Scenario, deadline: float, latencies: list, errors: list):
+    url = urlsplit(base_url)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+    local_latencies, local_errors = [], 0
+    while time.monotonic() < deadline:
+        method, path, body = scenario.next_request()
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {'Content-Type': 'application/json'} if payload else {}
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+            ok = False
+        local_latencies.append(time.perf_counter() - started)
+        if not ok:
+            local_errors += 1
+    conn.close()
+    latencies.extend(local_latencies)
+    errors.append(local_errors)
+
+
+def run_threads(base_url: str, name: str, sample: dict, offset: int, concurrency: int, duration: float):
+    """concurrency потоков одного процесса; возвращает задержки, число ошибок и время прогона"""
+    scenario = Scenario(name, sample, offset)
+    latencies, errors = [], []
+    started = time.monotonic()
+    deadline = started + duration
+    workers = [threading.Thread(target=run_worker, args=(base_url, scenario, deadline, latencies, errors))
+               for _ in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, sum(errors), time.monotonic() - started
+
+
+def run_scenario(base_url: str, name: str, sample: dict, concurrency: int, duration: float,
+                 clients: int = 1) -> dict:
+    """Прогон сценария: concurrency соединений, поделённых между clients процессами"""
+    clients = max(1, min(clients, concurrency))
+    if clients == 1:
+        latencies, errors, elapsed = run_threads(base_url, name, sample, 0, concurrency, duration)
+        return latency_summary(latencies, errors, elapsed)
+
+    shares = [concurrency // clients + (1 if index < concurrency % clients else 0) for index in range(clients)]
+    with multiprocessing.Pool(clients) as pool:
+        parts = pool.starmap(run_threads, [(base_url, name, sample, index * 1_000_000, share, duration)
+                                           for index, share in enumerate(shares)])
+    latencies = [latency for part in parts for latency in part[0]]
+    return latency_summary(latencies, sum(part[1] for part in parts), max(part[2] for part in parts))
+
+
+def load_sample(sample_size: int) -> dict:
+    db_manager = DatabaseManager()
+    if not db_manager.connect():
+        raise SystemExit("Cannot connect to database")
+    with db_manager.pool.connection() as conn, conn.cursor() as cursor:
+        def sample_ids(statuses):
+            for query in (SAMPLE_IDS_QUERY, SAMPLE_IDS_FALLBACK_QUERY):
+                cursor.execute(query, (statuses, sample_size))
+                rows = cursor.fetchall()
+                if rows:
+                    return [row[0] for row in rows]
+            return []
+
+        ids = sample_ids(['new', 'pending', 'accepted', 'rejected'])
+        new_ids = sample_ids(['new'])
+        cursor.execute(SAMPLE_EMAILS_QUERY, (max(1, sample_size // 10),))
+        emails = [row[0] for row in cursor.fetchall()]
+    db_manager.close()
+    if not ids or not new_ids or not emails:
+        raise SystemExit("Database is empty, run bench/seed.py first")
+    return {'ids': ids, 'new_ids': new_ids, 'emails': emails}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест Pereval API")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--concurrency', default='1,8,32', help="Уровни параллельности через запятую")
+    parser.add_argument('--duration', type=float, default=10.0, help="Секунд на каждый прогон")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--sample-size', type=int, default=5000, help="Сколько ID взять из базы")
+    parser.add_argument('--clients', type=int, default=1, help="Процессов нагрузчика")
+    parser.add_argument('-o', '--output', default='bench-load.json')
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    sample = load_sample(args.sample_size)
+    results = {}
+    for name in scenarios:
+        results[name] = {}
+        for level in levels:
+            summary = run_scenario(args.base_url, name, sample, level, args.duration, args.clients)
+            results[name][f"c{level}"] = summary
+            print(f"{name:8} c={level:<4} {summary['throughput_rps']:>9} rps  "
+                  f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms "
+                  f"errors={summary['errors']}")
+
+    meta = report_meta(kind='load', base_url=args.base_url, duration=args.duration, concurrency=levels,
+                       clients=args.clients)
+    write_report(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Микробенчмарки отдельных частей без HTTP: валидация и сериализация моделей pydantic
+и (с флагом --db) методы DatabaseManager на заполненной базе.
+
+    python bench/micro.py -o bench-micro.json
+    FSTR_CACHE_BACKEND=none python bench/micro.py --db -o bench-micro.json
+"""
+
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+from decimal import Decimal
+from typing import Callable
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from common import latency_summary, report_meta, write_report
+from models import PerevalSubmitRequest, PerevalResponse, UserPerevalsResponse
+from database import DatabaseManager
+from serialization import FastJSONResponse
+
+SAMPLE_PEREVAL = {
+    "id": 1,
+    "status": "new",
+    "beautyTitle": "пер.",
+    "title": "Пхия",
+    "other_titles": "Триев",
+    "connect": "",
+    "user": {"email": "user@example.com", "phone": "+79001234567",
+             "fam": "Иванов", "name": "Иван", "otc": "Иванович"},
+    "coords": {"latitude": 45.3842, "longitude": 7.1525, "height": 1200},
+    "level": {"winter": "", "summer": "1А", "autumn": "1А", "spring": ""},
+    "images": [{"title": f"Фото {n}", "img_url": f"https://example.com/{n}.jpg"} for n in range(3)],
+    "activities": [1, 2]
+}
+
+SAMPLE_SUBMIT = {
+    "data": {key: SAMPLE_PEREVAL[key] for key in
+             ("beautyTitle", "title", "other_titles", "connect", "user", "coords", "level")},
+    "images": SAMPLE_PEREVAL["images"],
+    "activities": SAMPLE_PEREVAL["activities"]
+}
+
+SAMPLE_LISTING = {
+    "perevals": [{"id": n, "title": f"Перевал {n}", "status": "new",
+                  "date_added": "2024-05-01T12:00:00"} for n in range(50)],
+    "next_cursor": None
+}
+
+# Карточка в том виде, в каком её возвращает база: координаты NUMERIC приходят как Decimal
+SAMPLE_DB_PEREVAL = {**SAMPLE_PEREVAL, "version": 1,
+                     "coords": {"latitude": Decimal("45.384200"), "longitude": Decimal("7.152500"),
+                                "height": 1200}}
+
+SAMPLE_DB_LISTING = {
+    "perevals": [{"id": n, "title": f"Перевал {n}", "status": "new",
+                  "date_added": datetime(2024, 5, 1, 12, 0, n % 60).isoformat()} for n in range(500)],
+    "next_cursor": "MjAyNC0wNS0wMVQxMjowMDowMHw0OTk="
+}
+
+
+def fastapi_response_body(model, content) -> bytes:
+    """Как FastAPI отдаёт dict при response_model: валидация, jsonable_encoder, json.dumps"""
+    return JSONResponse(jsonable_encoder(model.parse_obj(content))).body
+
+
+def measure(func: Callable[[], object], iterations: int) -> dict:
+    """Время каждого вызова отдельно, чтобы получить перцентили, а не только среднее"""
+    for _ in range(min(100, iterations)):
+        func()
+    latencies = []
+    started = time.monotonic()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    summary = latency_summary(latencies, 0, time.monotonic() - started)
+    summary['ops_per_sec'] = summary.pop('throughput_rps')
+    return summary
+
+
+def model_benchmarks(iterations: int) -> dict:
+    detail = PerevalResponse(**SAMPLE_PEREVAL)
+    return {
+        'submit_request_validate': measure(lambda: PerevalSubmitRequest.parse_obj(SAMPLE_SUBMIT), iterations),
+        'pereval_response_validate': measure(lambda: PerevalResponse.parse_obj(SAMPLE_PEREVAL), iterations),
+        'pereval_response_serialize': measure(detail.json, iterations),
+        'pereval_dict_json_dumps': measure(lambda: json.dumps(SAMPLE_PEREVAL, ensure_ascii=False), iterations),
+        'user_listing_validate': measure(lambda: UserPerevalsResponse.parse_obj(SAMPLE_LISTING), iterations),
+    }
+
+
+def response_benchmarks(iterations: int) -> dict:
+    """Отдача ответа: текущий путь через response_model против FastJSONResponse"""
+    return {
+        'detail_response_model': measure(
+            lambda: fastapi_response_body(PerevalResponse, SAMPLE_DB_PEREVAL), iterations),
+        'detail_fast_json': measure(lambda: FastJSONResponse(SAMPLE_DB_PEREVAL).body, iterations),
+        'listing500_response_model': measure(
+            lambda: fastapi_response_body(UserPerevalsResponse, SAMPLE_DB_LISTING), iterations // 10),
+        'listing500_fast_json': measure(lambda: FastJSONResponse(SAMPLE_DB_LISTING).body, iterations // 10),
+    }
+
+
+def database_benchmarks(iterations: int) -> dict:
+    db_manager = DatabaseManager()
+    if not db_manager.connect():
+        raise SystemExit("Cannot connect to database")
+    with db_manager.pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("SELECT max(id) FROM pereval_added")
+        max_id = cursor.fetchone()[0] or 1
+        cursor.execute("""
+            SELECT u.email FROM users u JOIN pereval_added pa ON pa.user_id = u.id
+            GROUP BY u.email ORDER BY count(*) DESC LIMIT 100
+        """)
+        emails = [row[0] for row in cursor.fetchall()] or ['test@example.com']
+
+    results = {
+        'get_pereval_by_id': measure(lambda: db_manager.get_pereval_by_id(random.randint(1, max_id)),
+                                     iterations),
+        'get_perevals_by_email': measure(lambda: db_manager.get_perevals_by_email(random.choice(emails)),
+                                         iterations),
+    }
+    db_manager.close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Микробенчмарки моделей и DatabaseManager")
+    parser.add_argument('--iterations', type=int, default=10000)
+    parser.add_argument('--db', action='store_true', help="Замерить и методы DatabaseManager")
+    parser.add_argument('--db-iterations', type=int, default=1000)
+    parser.add_argument('-o', '--output', default='bench-micro.json')
+    args = parser.parse_args(argv)
+
+    results = {'models': model_benchmarks(args.iterations),
+               'responses': response_benchmarks(args.iterations)}
+    if args.db:
+        results['database'] = database_benchmarks(args.db_iterations)
+
+    for group, benchmarks in results.items():
+        for name, summary in benchmarks.items():
+            print(f"{group}.{name:32} {summary['ops_per_sec']:>12} ops/s  p50={summary['p50_ms']}ms "
+                  f"p99={summary['p99_ms']}ms")
+
+    meta = report_meta(kind='micro', iterations=args.iterations,
+                       db_iterations=args.db_iterations if args.db else None)
+    write_report(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
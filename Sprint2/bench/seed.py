@@ -0,0 +1,120 @@
+"""
+Заполняет локальный PostgreSQL синтетическими данными для бенчмарков.
+Продолжает sql/sample_data.sql: пользователи, перевалы, изображения и виды деятельности
+генерируются на стороне сервера (generate_series) пачками, без передачи строк по сети.
+
+    python bench/seed.py --init-schema --users 20000 --passes 1000000 --images 3 --activities 2
+
+Параметры подключения — те же переменные FSTR_DB_*, что и у приложения.
+"""
+
+import time
+import argparse
+import psycopg2
+from common import ROOT
+from database import DatabaseManager
+from migrations import migrate
+
+SEED_USERS_QUERY = """
+    INSERT INTO users (email, phone, last_name, first_name, middle_name)
+    SELECT 'bench' || g || '@example.com', '7900' || lpad(g::text, 7, '0'),
+           'Фамилия' || g, 'Имя' || g, NULL
+    FROM generate_series(1, %(users)s) g
+    ON CONFLICT (email) DO NOTHING
+"""
+
+# Пользователи выбираются со смещением к первым (power(random(), 3)),
+# чтобы были «активные» авторы с тысячами перевалов, как в реальных данных.
+# Уровни сложности — общие строки, как их записывает приложение (intern_level)
+SEED_PASSES_QUERY = """
+    WITH bench_users AS (
+        SELECT array_agg(id ORDER BY id) AS ids
+        FROM users
+        WHERE email LIKE 'bench%%@example.com'
+    ),
+    ids AS (
+        SELECT g,
+               nextval(pg_get_serial_sequence('coords', 'id')) AS coords_id,
+               intern_level((ARRAY['', '1А', '1Б', '2А', '2Б', '3А'])[1 + mod(g, 6)],
+                            (ARRAY['', '1А', '1Б', '2А', '2Б', '3А'])[1 + mod(g + 1, 6)],
+                            (ARRAY['', '1А', '1Б', '2А', '2Б', '3А'])[1 + mod(g + 2, 6)],
+                            (ARRAY['', '1А', '1Б', '2А', '2Б', '3А'])[1 + mod(g + 3, 6)]) AS level_id,
+               nextval(pg_get_serial_sequence('pereval_added', 'id')) AS pereval_id
+        FROM generate_series(%(start)s, %(stop)s) g
+    ),
+    new_coords AS (
+        INSERT INTO coords (id, latitude, longitude, height)
+        SELECT coords_id, round((random() * 140 - 70)::numeric, 6),
+               round((random() * 360 - 180)::numeric, 6), (500 + random() * 6500)::int
+        FROM ids
+    ),
+    new_perevals AS (
+        INSERT INTO pereval_added (id, date_added, beauty_title, title, other_titles, connection,
+                                   user_id, coords_id, level_id, status)
+        SELECT pereval_id, now() - random() * interval '1000 days', 'пер.', 'Перевал ' || g,
+               'Bench pass ' || g, '',
+               bench_users.ids[1 + floor(power(random(), 3) * array_length(bench_users.ids, 1))::int],
+               coords_id, level_id,
+               (ARRAY['new', 'pending', 'accepted', 'rejected'])[1 + mod(g, 4)]
+        FROM ids, bench_users
+    ),
+    new_images AS (
+        INSERT INTO pereval_images (pereval_id, title, img_url)
+        SELECT pereval_id, 'Фото ' || k, 'https://example.com/bench/' || pereval_id || '/' || k || '.jpg'
+        FROM ids, generate_series(1, %(images)s) k
+    )
+    INSERT INTO pereval_activities (pereval_id, activity_id)
+    SELECT DISTINCT pereval_id, 1 + mod(g + k * 3, 11)
+    FROM ids, generate_series(1, %(activities)s) k
+"""
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетические данные для бенчмарков")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--passes', type=int, default=100000)
+    parser.add_argument('--images', type=int, default=3, help="Изображений на перевал")
+    parser.add_argument('--activities', type=int, default=2, help="Видов деятельности на перевал (до 11)")
+    parser.add_argument('--batch', type=int, default=50000, help="Перевалов в одной транзакции")
+    parser.add_argument('--init-schema', action='store_true',
+                        help="Выполнить sql/init_db.sql, sql/sample_data.sql и миграции перед заполнением")
+    args = parser.parse_args(argv)
+
+    db_manager = DatabaseManager()
+    if not db_manager.connect():
+        raise SystemExit("Cannot connect to database")
+
+    with db_manager.pool.connection() as conn, conn.cursor() as cursor:
+        if args.init_schema:
+            for name in ('init_db.sql', 'sample_data.sql'):
+                try:
+                    cursor.execute((ROOT / 'sql' / name).read_text(encoding='utf-8'))
+                    conn.commit()
+                except psycopg2.IntegrityError:
+                    # sample_data.sql уже загружен
+                    conn.rollback()
+            migrate(conn)
+            print("Schema initialized")
+
+        cursor.execute(SEED_USERS_QUERY, {'users': args.users})
+        conn.commit()
+        print(f"Users: {args.users}")
+
+        started = time.monotonic()
+        for start in range(1, args.passes + 1, args.batch):
+            stop = min(start + args.batch - 1, args.passes)
+            cursor.execute(SEED_PASSES_QUERY, {'start': start, 'stop': stop,
+                                               'images': args.images, 'activities': args.activities})
+            conn.commit()
+            elapsed = time.monotonic() - started
+            print(f"Passes {stop}/{args.passes} ({stop / elapsed:.0f} passes/s)")
+
+        conn.autocommit = True
+        cursor.execute("ANALYZE")
+        conn.autocommit = False
+
+    db_manager.close()
+
+
+if __name__ == '__main__':
+    main()
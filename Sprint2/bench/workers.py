@@ -0,0 +1,101 @@
+"""
+Масштабирование по процессам: для каждого числа рабочих процессов запускает app/server.py,
+гоняет сценарии bench/load.py при одной параллельности и останавливает сервер.
+
+    FSTR_CACHE_BACKEND=redis python bench/workers.py --workers 1,2,4 --concurrency 64 -o bench-workers.json
+
+В отчёте results[сценарий]["w<N>"] — сводка как у load.py и scaling — throughput
+относительно первого числа процессов в списке. Нагрузчик работает в --clients процессах
+и сам занимает ядра: на одной машине с сервером прирост упрётся в их общее число.
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+import http.client
+from common import ROOT, report_meta, write_report
+from load import SCENARIOS, load_sample, run_scenario
+
+
+def wait_ready(port: int, timeout: float) -> bool:
+    """Ждёт, пока /health/ready ответит 200 (пул открыт, цепь замкнута)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+        try:
+            conn.request('GET', '/health/ready')
+            if conn.getresponse().status == 200:
+                return True
+        except (OSError, http.client.HTTPException):
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.5)
+    return False
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, str(ROOT / 'app' / 'server.py'), '--workers', str(workers),
+                             '--port', str(port), '--host', '127.0.0.1', '--no-access-log',
+                             '--log-level', 'warning'],
+                            env={**os.environ, 'FSTR_WORKERS': str(workers)})
+
+
+def stop_server(server: subprocess.Popen):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput Pereval API в зависимости от числа процессов")
+    parser.add_argument('--workers', default='1,2,4', help="Числа рабочих процессов через запятую")
+    parser.add_argument('--concurrency', type=int, default=64, help="Одновременных соединений")
+    parser.add_argument('--clients', type=int, default=os.cpu_count() or 1, help="Процессов нагрузчика")
+    parser.add_argument('--duration', type=float, default=10.0, help="Секунд на каждый прогон")
+    parser.add_argument('--scenarios', default='detail,listing')
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--sample-size', type=int, default=5000, help="Сколько ID взять из базы")
+    parser.add_argument('-o', '--output', default='bench-workers.json')
+    args = parser.parse_args(argv)
+
+    counts = [int(count) for count in args.workers.split(',')]
+    scenarios = [name for name in args.scenarios.split(',') if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    sample = load_sample(args.sample_size)
+    base_url = f"http://127.0.0.1:{args.port}"
+    results = {name: {} for name in scenarios}
+    for count in counts:
+        server = start_server(count, args.port)
+        try:
+            if not wait_ready(args.port, args.startup_timeout):
+                raise SystemExit(f"Server with {count} workers is not ready after {args.startup_timeout:g} s")
+            for name in scenarios:
+                summary = run_scenario(base_url, name, sample, args.concurrency, args.duration, args.clients)
+                baseline = results[name].get(f"w{counts[0]}", summary)
+                summary['scaling'] = (round(summary['throughput_rps'] / baseline['throughput_rps'], 2)
+                                      if baseline['throughput_rps'] else 0.0)
+                results[name][f"w{count}"] = summary
+                print(f"{name:8} workers={count:<3} {summary['throughput_rps']:>9} rps  "
+                      f"x{summary['scaling']:<5} p50={summary['p50_ms']}ms p99={summary['p99_ms']}ms "
+                      f"errors={summary['errors']}")
+        finally:
+            stop_server(server)
+
+    meta = report_meta(kind='workers', duration=args.duration, concurrency=args.concurrency,
+                       clients=args.clients, workers=counts,
+                       cache_backend=os.getenv('FSTR_CACHE_BACKEND', 'memory'))
+    write_report(args.output, meta, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -40,9 +40,34 @@ CREATE TABLE IF NOT EXISTS public.pereval_added (
         CHECK (status IN ('new', 'pending', 'accepted', 'rejected'))
 );
 
+-- Версия записи для ETag: увеличивается триггером при любом UPDATE (правка, смена статуса модератором)
+ALTER TABLE pereval_added ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_pereval_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_pereval_version ON pereval_added;
+CREATE TRIGGER trg_pereval_version
+    BEFORE UPDATE ON pereval_added
+    FOR EACH ROW EXECUTE FUNCTION bump_pereval_version();
+
 -- Создание индекса для статуса (исправленный синтаксис)
 CREATE INDEX IF NOT EXISTS idx_status ON pereval_added (status);
 
+-- Индексы для постраничного списка перевалов пользователя (keyset по date_added, id)
+CREATE INDEX IF NOT EXISTS idx_pereval_user_date
+    ON pereval_added (user_id, date_added DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_pereval_user_status_date
+    ON pereval_added (user_id, status, date_added DESC, id DESC);
+
+-- Геопоиск: GiST по точке (долгота, широта) для запросов по прямоугольнику (<@) и ближайших (<->)
+CREATE INDEX IF NOT EXISTS idx_coords_point ON coords USING gist (point(longitude, latitude));
+CREATE INDEX IF NOT EXISTS idx_pereval_coords ON pereval_added (coords_id);
+
 -- Создание таблицы pereval_images
 CREATE TABLE IF NOT EXISTS public.pereval_images (
     id SERIAL PRIMARY KEY,
@@ -63,4 +88,102 @@ CREATE TABLE IF NOT EXISTS public.pereval_activities (
     pereval_id INTEGER REFERENCES pereval_added(id) ON DELETE CASCADE,
     activity_id INTEGER REFERENCES spr_activities_types(id) ON DELETE CASCADE,
     PRIMARY KEY (pereval_id, activity_id)
-);
\ No newline at end of file
+);
+
+-- Ключи идемпотентности для POST /submitData/ (повторы запросов клиентов)
+CREATE TABLE IF NOT EXISTS public.idempotency_keys (
+    key VARCHAR(255) PRIMARY KEY,
+    request_hash CHAR(64) NOT NULL,
+    pereval_id INTEGER REFERENCES pereval_added(id) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at);
+
+-- Модерация: кто и когда последним менял статус
+ALTER TABLE pereval_added ADD COLUMN IF NOT EXISTS moderated_by VARCHAR(255);
+ALTER TABLE pereval_added ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMP;
+
+-- Очередь модерации от старых к новым: частичный индекс только по статусам, ожидающим решения
+CREATE INDEX IF NOT EXISTS idx_pereval_moderation_queue
+    ON pereval_added (status, date_added, id)
+    WHERE status IN ('new', 'pending');
+
+-- Разрешённые переходы статусов; accepted и rejected — окончательные
+CREATE TABLE IF NOT EXISTS public.pereval_status_transitions (
+    from_status VARCHAR(10) NOT NULL,
+    to_status VARCHAR(10) NOT NULL,
+    PRIMARY KEY (from_status, to_status)
+);
+
+INSERT INTO pereval_status_transitions (from_status, to_status) VALUES
+    ('new', 'pending'), ('new', 'accepted'), ('new', 'rejected'),
+    ('pending', 'new'), ('pending', 'accepted'), ('pending', 'rejected')
+ON CONFLICT DO NOTHING;
+
+-- Переходы проверяются и для изменений в обход API
+CREATE OR REPLACE FUNCTION check_pereval_status_transition() RETURNS trigger AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pereval_status_transitions
+                   WHERE from_status = OLD.status AND to_status = NEW.status) THEN
+        RAISE EXCEPTION 'Status transition % -> % is not allowed', OLD.status, NEW.status
+            USING ERRCODE = 'check_violation';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_pereval_status_transition ON pereval_added;
+CREATE TRIGGER trg_pereval_status_transition
+    BEFORE UPDATE OF status ON pereval_added
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION check_pereval_status_transition();
+
+-- Изменение справочника видов деятельности: приложения перечитывают его по NOTIFY
+CREATE OR REPLACE FUNCTION notify_reference_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('reference_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_activities_types_changed ON spr_activities_types;
+CREATE TRIGGER trg_activities_types_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON spr_activities_types
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_changed();
+
+-- Обработка изображений: размеры, превью на локальном диске и состояние фоновой обработки.
+-- 'none' — изображение передано ссылкой при добавлении перевала и не обрабатывалось
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS height INTEGER;
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS thumb_url TEXT;
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS thumb_width INTEGER;
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS thumb_height INTEGER;
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS processing_status VARCHAR(10) NOT NULL DEFAULT 'none'
+    CHECK (processing_status IN ('none', 'pending', 'ready', 'failed'));
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS processing_error TEXT;
+
+-- Незавершённые задачи поднимаются при старте приложения
+CREATE INDEX IF NOT EXISTS idx_pereval_images_pending
+    ON pereval_images (id)
+    WHERE processing_status = 'pending';
+
+-- Поиск по названию: tsvector (конфигурация simple — названия собственные, без стемминга)
+-- и текст для триграмм pg_trgm (опечатки, неполные названия, транслитерация на стороне запроса)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE pereval_added ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(other_titles, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(beauty_title, '')), 'D')
+    ) STORED;
+ALTER TABLE pereval_added ADD COLUMN IF NOT EXISTS search_text TEXT
+    GENERATED ALWAYS AS (lower(coalesce(title, '') || ' ' || coalesce(other_titles, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_pereval_search_vector
+    ON pereval_added USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_pereval_search_trgm
+    ON pereval_added USING GIN (search_text gin_trgm_ops);
\ No newline at end of file
@@ -0,0 +1,13 @@
+-- migrate: no-transaction
+-- Индексы внешних ключей: без них соединения в карточке перевала и каскадное удаление
+-- перебирают таблицы целиком. pereval_added.user_id уже покрыт idx_pereval_user_date
+-- (user_id — первая колонка), pereval_added.coords_id — idx_pereval_coords
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pereval_level ON pereval_added (level_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pereval_images_pereval ON pereval_images (pereval_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_pereval_activities_activity ON pereval_activities (activity_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_idempotency_keys_pereval ON idempotency_keys (pereval_id);
+
+-- Поиск строки с теми же координатами или уровнями сложности (intern_coords, intern_level):
+-- id в конце индекса сразу даёт самую раннюю (каноническую) строку среди совпадающих
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_coords_value ON coords (latitude, longitude, height, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_levels_value ON levels (winter, summer, autumn, spring, id);
@@ -0,0 +1,70 @@
+-- Координаты и уровни сложности хранятся один раз для одинаковых значений: на строку coords
+-- или levels ссылаются все перевалы с такими значениями. Каскадное удаление из этих таблиц
+-- удалило бы все такие перевалы, поэтому внешние ключи пересоздаются без ON DELETE CASCADE.
+-- NOT VALID не проверяет существующие строки под блокировкой таблицы, проверка — в 0003
+ALTER TABLE pereval_added
+    DROP CONSTRAINT IF EXISTS pereval_added_coords_id_fkey,
+    ADD CONSTRAINT pereval_added_coords_id_fkey
+        FOREIGN KEY (coords_id) REFERENCES coords (id) NOT VALID,
+    DROP CONSTRAINT IF EXISTS pereval_added_level_id_fkey,
+    ADD CONSTRAINT pereval_added_level_id_fkey
+        FOREIGN KEY (level_id) REFERENCES levels (id) NOT VALID;
+
+-- Фоновое заполнение (миграции batch) переключает ссылки, не меняя содержимого перевала:
+-- версия записи (ETag) при этом остаётся прежней
+CREATE OR REPLACE FUNCTION bump_pereval_version() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('fstr.backfill', true) = 'on' THEN
+        RETURN NEW;
+    END IF;
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Возвращают самую раннюю строку с такими значениями или добавляют новую. Уникального
+-- ограничения нет: при одновременной вставке одинаковых новых значений могут появиться
+-- две строки, обе корректны — блокировать общую строку на время транзакции дороже
+CREATE OR REPLACE FUNCTION intern_coords(p_latitude NUMERIC, p_longitude NUMERIC, p_height INTEGER)
+RETURNS INTEGER AS $$
+DECLARE
+    found_id INTEGER;
+BEGIN
+    -- В таблице NUMERIC(9,6): сравниваем с тем значением, которое будет записано
+    p_latitude := round(p_latitude, 6);
+    p_longitude := round(p_longitude, 6);
+    SELECT id INTO found_id FROM coords
+    WHERE latitude = p_latitude AND longitude = p_longitude AND height = p_height
+    ORDER BY id
+    LIMIT 1;
+    IF found_id IS NULL THEN
+        INSERT INTO coords (latitude, longitude, height)
+        VALUES (p_latitude, p_longitude, p_height)
+        RETURNING id INTO found_id;
+    END IF;
+    RETURN found_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Не указанный уровень сложности хранится как '' (NULL не совпал бы при сравнении)
+CREATE OR REPLACE FUNCTION intern_level(p_winter TEXT, p_summer TEXT, p_autumn TEXT, p_spring TEXT)
+RETURNS INTEGER AS $$
+DECLARE
+    found_id INTEGER;
+BEGIN
+    p_winter := coalesce(p_winter, '');
+    p_summer := coalesce(p_summer, '');
+    p_autumn := coalesce(p_autumn, '');
+    p_spring := coalesce(p_spring, '');
+    SELECT id INTO found_id FROM levels
+    WHERE winter = p_winter AND summer = p_summer AND autumn = p_autumn AND spring = p_spring
+    ORDER BY id
+    LIMIT 1;
+    IF found_id IS NULL THEN
+        INSERT INTO levels (winter, summer, autumn, spring)
+        VALUES (p_winter, p_summer, p_autumn, p_spring)
+        RETURNING id INTO found_id;
+    END IF;
+    RETURN found_id;
+END;
+$$ LANGUAGE plpgsql;
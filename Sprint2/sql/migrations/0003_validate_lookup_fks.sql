@@ -0,0 +1,3 @@
+-- Проверка существующих строк под SHARE UPDATE EXCLUSIVE: чтение и запись таблицы не блокируются
+ALTER TABLE pereval_added VALIDATE CONSTRAINT pereval_added_coords_id_fkey;
+ALTER TABLE pereval_added VALIDATE CONSTRAINT pereval_added_level_id_fkey;
@@ -0,0 +1,18 @@
+-- migrate: batch
+-- NULL в уровнях сложности приводится к '', как их записывает intern_level,
+-- иначе одинаковые уровни не совпадут при объединении в 0005
+WITH batch AS (
+    SELECT id FROM levels
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(batch_size)s
+),
+normalized AS (
+    UPDATE levels l
+    SET winter = coalesce(l.winter, ''), summer = coalesce(l.summer, ''),
+        autumn = coalesce(l.autumn, ''), spring = coalesce(l.spring, '')
+    FROM batch
+    WHERE l.id = batch.id
+      AND (l.winter IS NULL OR l.summer IS NULL OR l.autumn IS NULL OR l.spring IS NULL)
+)
+SELECT max(id) AS last_id FROM batch
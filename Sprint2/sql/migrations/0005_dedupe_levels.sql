@@ -0,0 +1,25 @@
+-- migrate: batch
+-- Перевалы переключаются на самую раннюю строку levels с теми же значениями
+WITH batch AS (
+    SELECT id, level_id FROM pereval_added
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(batch_size)s
+),
+canonical AS (
+    SELECT batch.id,
+           (SELECT c.id FROM levels c
+            WHERE c.winter = l.winter AND c.summer = l.summer
+              AND c.autumn = l.autumn AND c.spring = l.spring
+            ORDER BY c.id
+            LIMIT 1) AS level_id
+    FROM batch
+    JOIN levels l ON l.id = batch.level_id
+),
+repointed AS (
+    UPDATE pereval_added pa
+    SET level_id = canonical.level_id
+    FROM canonical
+    WHERE pa.id = canonical.id AND pa.level_id <> canonical.level_id
+)
+SELECT max(id) AS last_id FROM batch
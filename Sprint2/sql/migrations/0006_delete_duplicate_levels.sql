@@ -0,0 +1,18 @@
+-- migrate: batch
+-- Удаляются повторы, на которые после 0005 никто не ссылается
+WITH batch AS (
+    SELECT id FROM levels
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(batch_size)s
+),
+deleted AS (
+    DELETE FROM levels l
+    USING batch
+    WHERE l.id = batch.id
+      AND EXISTS (SELECT 1 FROM levels c
+                  WHERE c.winter = l.winter AND c.summer = l.summer
+                    AND c.autumn = l.autumn AND c.spring = l.spring AND c.id < l.id)
+      AND NOT EXISTS (SELECT 1 FROM pereval_added pa WHERE pa.level_id = l.id)
+)
+SELECT max(id) AS last_id FROM batch
@@ -0,0 +1,24 @@
+-- migrate: batch
+-- Перевалы переключаются на самую раннюю строку coords с теми же координатами
+WITH batch AS (
+    SELECT id, coords_id FROM pereval_added
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(batch_size)s
+),
+canonical AS (
+    SELECT batch.id,
+           (SELECT c.id FROM coords c
+            WHERE c.latitude = p.latitude AND c.longitude = p.longitude AND c.height = p.height
+            ORDER BY c.id
+            LIMIT 1) AS coords_id
+    FROM batch
+    JOIN coords p ON p.id = batch.coords_id
+),
+repointed AS (
+    UPDATE pereval_added pa
+    SET coords_id = canonical.coords_id
+    FROM canonical
+    WHERE pa.id = canonical.id AND pa.coords_id <> canonical.coords_id
+)
+SELECT max(id) AS last_id FROM batch
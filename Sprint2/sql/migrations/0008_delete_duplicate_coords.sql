@@ -0,0 +1,18 @@
+-- migrate: batch
+-- Удаляются повторы, на которые после 0007 никто не ссылается
+WITH batch AS (
+    SELECT id FROM coords
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(batch_size)s
+),
+deleted AS (
+    DELETE FROM coords p
+    USING batch
+    WHERE p.id = batch.id
+      AND EXISTS (SELECT 1 FROM coords c
+                  WHERE c.latitude = p.latitude AND c.longitude = p.longitude
+                    AND c.height = p.height AND c.id < p.id)
+      AND NOT EXISTS (SELECT 1 FROM pereval_added pa WHERE pa.coords_id = p.id)
+)
+SELECT max(id) AS last_id FROM batch
@@ -0,0 +1,32 @@
+-- Очередь отложенной записи POST /submitData/ (FSTR_SUBMIT_MODE=queue): запрос сохраняется
+-- одной строкой и сразу получает 202 с номером (ticket), фоновые обработчики переносят
+-- строки пачками в основные таблицы и записывают результат
+CREATE TABLE IF NOT EXISTS submission_queue (
+    id BIGSERIAL PRIMARY KEY,
+    ticket UUID NOT NULL UNIQUE,
+    payload JSONB NOT NULL,
+    idempotency_key VARCHAR(255),
+    request_hash CHAR(64),
+    status VARCHAR(10) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'done', 'failed')),
+    pereval_id INTEGER REFERENCES pereval_added (id) ON DELETE SET NULL,
+    error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+-- Повтор с тем же Idempotency-Key получает тот же номер
+CREATE UNIQUE INDEX IF NOT EXISTS idx_submission_queue_idempotency_key
+    ON submission_queue (idempotency_key)
+    WHERE idempotency_key IS NOT NULL;
+
+-- Обработчики берут самые старые необработанные строки
+CREATE INDEX IF NOT EXISTS idx_submission_queue_queued
+    ON submission_queue (id)
+    WHERE status = 'queued';
+
+-- Удаление старых обработанных номеров и внешний ключ на перевал
+CREATE INDEX IF NOT EXISTS idx_submission_queue_processed
+    ON submission_queue (processed_at)
+    WHERE status <> 'queued';
+CREATE INDEX IF NOT EXISTS idx_submission_queue_pereval ON submission_queue (pereval_id);
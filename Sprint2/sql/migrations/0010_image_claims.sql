@@ -0,0 +1,4 @@
+-- Изображение в обработке закрепляется за процессом, который его принял: при нескольких
+-- рабочих процессах (app/server.py) каждый при старте забирает только брошенные строки
+-- 'pending', а не все сразу. Столбец без значения по умолчанию — только запись в каталоге
+ALTER TABLE pereval_images ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP;
@@ -0,0 +1,155 @@
+-- Счётчики для GET /stats/ и GET /stats/users/: сколько перевалов в каждом статусе, с каждой
+-- категорией трудности по сезонам, с каждым видом деятельности и у каждого пользователя.
+-- Триггеры меняют счётчики в той же транзакции, что и данные (add_pereval, пакетное добавление,
+-- PATCH, модерация), поэтому чтение статистики не зависит от размера таблиц.
+--
+-- Общий счётчик разбит на 16 строк (shard) по номеру серверного процесса: одновременные
+-- записи из разных соединений не ждут блокировку одной строки до конца транзакции.
+-- Чтение суммирует строки одного ключа.
+CREATE TABLE IF NOT EXISTS stats_rollup (
+    dimension VARCHAR(16) NOT NULL,   -- status, winter/summer/autumn/spring, activity
+    key TEXT NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    shard SMALLINT NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (dimension, key, status, shard)
+);
+
+-- Счётчик пользователя не делится: один пользователь редко пишет из нескольких соединений сразу.
+-- Без внешнего ключа: строки удалённого пользователя обнуляются триггером и ничему не мешают
+CREATE TABLE IF NOT EXISTS user_stats_rollup (
+    user_id INTEGER NOT NULL,
+    status VARCHAR(10) NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, status)
+);
+
+CREATE OR REPLACE FUNCTION stats_bump(p_dimension TEXT, p_key TEXT, p_status TEXT, p_delta BIGINT)
+RETURNS void AS $$
+    INSERT INTO stats_rollup (dimension, key, status, shard, total)
+    VALUES (p_dimension, p_key, p_status, pg_backend_pid() % 16, p_delta)
+    ON CONFLICT (dimension, key, status, shard) DO UPDATE SET total = stats_rollup.total + EXCLUDED.total;
+$$ LANGUAGE sql;
+
+-- Вклад перевала (p_delta = 1 или -1) в счётчики статуса, пользователя и категорий трудности.
+-- Строки levels не меняются (intern_level), категории читаются по ссылке перевала
+CREATE OR REPLACE FUNCTION pereval_stats_apply(p_status TEXT, p_user_id INTEGER, p_level_id INTEGER,
+                                               p_delta BIGINT)
+RETURNS void AS $$
+BEGIN
+    PERFORM stats_bump('status', p_status, p_status, p_delta);
+    IF p_user_id IS NOT NULL THEN
+        INSERT INTO user_stats_rollup (user_id, status, total)
+        VALUES (p_user_id, p_status, p_delta)
+        ON CONFLICT (user_id, status) DO UPDATE SET total = user_stats_rollup.total + EXCLUDED.total;
+    END IF;
+    PERFORM stats_bump(season.name, season.value, p_status, p_delta)
+    FROM levels l
+    CROSS JOIN LATERAL (VALUES ('winter', l.winter), ('summer', l.summer),
+                               ('autumn', l.autumn), ('spring', l.spring)) AS season (name, value)
+    WHERE l.id = p_level_id AND season.value <> '';
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION pereval_activities_stats_apply(p_pereval_id INTEGER, p_status TEXT, p_delta BIGINT)
+RETURNS void AS $$
+BEGIN
+    PERFORM stats_bump('activity', a.activity_id::text, p_status, p_delta)
+    FROM pereval_activities a
+    WHERE a.pereval_id = p_pereval_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Виды деятельности нового перевала добавляются после его строки и учитываются триггером
+-- pereval_activities. При смене статуса они переносятся здесь. При удалении (BEFORE DELETE)
+-- строки pereval_activities ещё на месте: каскадное удаление выполняется после оператора
+CREATE OR REPLACE FUNCTION pereval_stats_rollup() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pereval_stats_apply(OLD.status, OLD.user_id, OLD.level_id, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pereval_stats_apply(NEW.status, NEW.user_id, NEW.level_id, 1);
+    END IF;
+    IF TG_OP = 'UPDATE' AND OLD.status IS DISTINCT FROM NEW.status THEN
+        PERFORM pereval_activities_stats_apply(NEW.id, OLD.status, -1);
+        PERFORM pereval_activities_stats_apply(NEW.id, NEW.status, 1);
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pereval_activities_stats_apply(OLD.id, OLD.status, -1);
+        RETURN OLD;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Строка перевала при каскадном удалении уже не видна: её вклад снял триггер pereval_added
+CREATE OR REPLACE FUNCTION pereval_activity_stats_rollup() RETURNS trigger AS $$
+DECLARE
+    pereval_status TEXT;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT status INTO pereval_status FROM pereval_added WHERE id = NEW.pereval_id;
+        PERFORM stats_bump('activity', NEW.activity_id::text, pereval_status, 1);
+    ELSE
+        SELECT status INTO pereval_status FROM pereval_added WHERE id = OLD.pereval_id;
+        IF FOUND THEN
+            PERFORM stats_bump('activity', OLD.activity_id::text, pereval_status, -1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pereval_stats_insert ON pereval_added;
+CREATE TRIGGER pereval_stats_insert
+    AFTER INSERT ON pereval_added
+    FOR EACH ROW EXECUTE FUNCTION pereval_stats_rollup();
+
+-- PATCH всегда записывает level_id: счётчики меняются, только если значение другое
+DROP TRIGGER IF EXISTS pereval_stats_update ON pereval_added;
+CREATE TRIGGER pereval_stats_update
+    AFTER UPDATE OF status, user_id, level_id ON pereval_added
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.user_id IS DISTINCT FROM NEW.user_id
+          OR OLD.level_id IS DISTINCT FROM NEW.level_id)
+    EXECUTE FUNCTION pereval_stats_rollup();
+
+DROP TRIGGER IF EXISTS pereval_stats_delete ON pereval_added;
+CREATE TRIGGER pereval_stats_delete
+    BEFORE DELETE ON pereval_added
+    FOR EACH ROW EXECUTE FUNCTION pereval_stats_rollup();
+
+DROP TRIGGER IF EXISTS pereval_activity_stats ON pereval_activities;
+CREATE TRIGGER pereval_activity_stats
+    AFTER INSERT OR DELETE ON pereval_activities
+    FOR EACH ROW EXECUTE FUNCTION pereval_activity_stats_rollup();
+
+-- Начальные значения. CREATE TRIGGER держит до конца транзакции блокировку, запрещающую
+-- запись в таблицу, поэтому строки, добавленные во время подсчёта, не учитываются дважды:
+-- их запись ждёт фиксации миграции (один GROUP BY по каждой таблице)
+INSERT INTO stats_rollup (dimension, key, status, shard, total)
+SELECT 'status', status, status, 0, count(*)
+FROM pereval_added
+GROUP BY status;
+
+INSERT INTO stats_rollup (dimension, key, status, shard, total)
+SELECT season.name, season.value, pa.status, 0, count(*)
+FROM pereval_added pa
+JOIN levels l ON l.id = pa.level_id
+CROSS JOIN LATERAL (VALUES ('winter', l.winter), ('summer', l.summer),
+                           ('autumn', l.autumn), ('spring', l.spring)) AS season (name, value)
+WHERE season.value <> ''
+GROUP BY season.name, season.value, pa.status;
+
+INSERT INTO stats_rollup (dimension, key, status, shard, total)
+SELECT 'activity', a.activity_id::text, pa.status, 0, count(*)
+FROM pereval_activities a
+JOIN pereval_added pa ON pa.id = a.pereval_id
+GROUP BY a.activity_id, pa.status;
+
+INSERT INTO user_stats_rollup (user_id, status, total)
+SELECT user_id, status, count(*)
+FROM pereval_added
+WHERE user_id IS NOT NULL
+GROUP BY user_id, status;
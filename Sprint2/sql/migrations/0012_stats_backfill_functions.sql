@@ -0,0 +1,136 @@
+-- Подсчёт счётчиков 0011 без остановки записи. 0011 считает существующие перевалы сразу, под
+-- блокировкой CREATE TRIGGER, которая запрещает запись в pereval_added и pereval_activities на
+-- время четырёх полных просмотров; 0011 уже применена и не меняется. Эта миграция добавляет
+-- границу подсчёта (stats_backfill) и пачечный подсчёт, которые выполняет 0013: перевалы с id
+-- в (done_upto, watermark] триггеры пропускают, а пачка считает их в текущем состоянии.
+-- Пока строки stats_backfill нет (после 0011 всё посчитано), триггеры учитывают все перевалы.
+--
+-- Пересчитать счётчики, не останавливая запись: в одной транзакции заблокировать pereval_added
+-- (LOCK TABLE ... IN SHARE ROW EXCLUSIVE MODE), очистить stats_rollup и user_stats_rollup
+-- и вставить в stats_backfill (max(id), 0); затем вызывать pereval_stats_backfill, пока он
+-- не вернёт NULL.
+
+-- Ход подсчёта: перевалы с id в (done_upto, watermark] ещё не учтены, триггеры их
+-- пропускают — подсчёт пачки увидит их текущее состояние. Строка удаляется, когда подсчёт закончен
+CREATE TABLE IF NOT EXISTS stats_backfill (
+    watermark INTEGER NOT NULL,
+    done_upto INTEGER NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION stats_counted(p_pereval_id INTEGER) RETURNS boolean AS $$
+    SELECT NOT EXISTS (SELECT 1 FROM stats_backfill
+                       WHERE p_pereval_id > done_upto AND p_pereval_id <= watermark);
+$$ LANGUAGE sql;
+
+-- Виды деятельности нового перевала добавляются после его строки и учитываются триггером
+-- pereval_activities. При смене статуса они переносятся здесь. При удалении (BEFORE DELETE)
+-- строки pereval_activities ещё на месте: каскадное удаление выполняется после оператора
+CREATE OR REPLACE FUNCTION pereval_stats_rollup() RETURNS trigger AS $$
+BEGIN
+    IF stats_counted(CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END) THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM pereval_stats_apply(OLD.status, OLD.user_id, OLD.level_id, -1);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM pereval_stats_apply(NEW.status, NEW.user_id, NEW.level_id, 1);
+        END IF;
+        IF TG_OP = 'UPDATE' AND OLD.status IS DISTINCT FROM NEW.status THEN
+            PERFORM pereval_activities_stats_apply(NEW.id, OLD.status, -1);
+            PERFORM pereval_activities_stats_apply(NEW.id, NEW.status, 1);
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            PERFORM pereval_activities_stats_apply(OLD.id, OLD.status, -1);
+        END IF;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Строка перевала при каскадном удалении уже не видна: её вклад снял триггер pereval_added
+CREATE OR REPLACE FUNCTION pereval_activity_stats_rollup() RETURNS trigger AS $$
+DECLARE
+    pereval_status TEXT;
+BEGIN
+    IF NOT stats_counted(CASE WHEN TG_OP = 'DELETE' THEN OLD.pereval_id ELSE NEW.pereval_id END) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'INSERT' THEN
+        SELECT status INTO pereval_status FROM pereval_added WHERE id = NEW.pereval_id;
+        PERFORM stats_bump('activity', NEW.activity_id::text, pereval_status, 1);
+    ELSE
+        SELECT status INTO pereval_status FROM pereval_added WHERE id = OLD.pereval_id;
+        IF FOUND THEN
+            PERFORM stats_bump('activity', OLD.activity_id::text, pereval_status, -1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Пачка подсчёта (миграция 0013): перевалы с id больше p_after и done_upto, не больше
+-- watermark. Строки пачки блокируются: правка, начатая раньше, успевает зафиксироваться и
+-- попадает в подсчёт (каждый запрос функции видит свежий снимок), начатая позже ждёт фиксации
+-- пачки, и её триггер уже учитывает перевал. PATCH, модерация и удаление тоже блокируют строку
+-- перевала до изменения видов деятельности. Возвращает последний id пачки или NULL, если всё посчитано
+CREATE OR REPLACE FUNCTION pereval_stats_backfill(p_after INTEGER, p_limit INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    progress stats_backfill%ROWTYPE;
+    first_id INTEGER;
+    last_id INTEGER;
+BEGIN
+    SELECT * INTO progress FROM stats_backfill FOR UPDATE;
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+    first_id := GREATEST(p_after, progress.done_upto);
+
+    SELECT max(id) INTO last_id
+    FROM (SELECT id FROM pereval_added
+          WHERE id > first_id AND id <= progress.watermark
+          ORDER BY id
+          LIMIT p_limit
+          FOR UPDATE) AS batch;
+    IF last_id IS NULL THEN
+        DELETE FROM stats_backfill;
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO stats_rollup (dimension, key, status, shard, total)
+    SELECT 'status', status, status, 0, count(*)
+    FROM pereval_added
+    WHERE id > first_id AND id <= last_id
+    GROUP BY status
+    ON CONFLICT (dimension, key, status, shard) DO UPDATE SET total = stats_rollup.total + EXCLUDED.total;
+
+    INSERT INTO stats_rollup (dimension, key, status, shard, total)
+    SELECT season.name, season.value, pa.status, 0, count(*)
+    FROM pereval_added pa
+    JOIN levels l ON l.id = pa.level_id
+    CROSS JOIN LATERAL (VALUES ('winter', l.winter), ('summer', l.summer),
+                               ('autumn', l.autumn), ('spring', l.spring)) AS season (name, value)
+    WHERE pa.id > first_id AND pa.id <= last_id AND season.value <> ''
+    GROUP BY season.name, season.value, pa.status
+    ON CONFLICT (dimension, key, status, shard) DO UPDATE SET total = stats_rollup.total + EXCLUDED.total;
+
+    INSERT INTO stats_rollup (dimension, key, status, shard, total)
+    SELECT 'activity', a.activity_id::text, pa.status, 0, count(*)
+    FROM pereval_activities a
+    JOIN pereval_added pa ON pa.id = a.pereval_id
+    WHERE pa.id > first_id AND pa.id <= last_id
+    GROUP BY a.activity_id, pa.status
+    ON CONFLICT (dimension, key, status, shard) DO UPDATE SET total = stats_rollup.total + EXCLUDED.total;
+
+    INSERT INTO user_stats_rollup (user_id, status, total)
+    SELECT user_id, status, count(*)
+    FROM pereval_added
+    WHERE id > first_id AND id <= last_id AND user_id IS NOT NULL
+    GROUP BY user_id, status
+    ON CONFLICT (user_id, status) DO UPDATE SET total = user_stats_rollup.total + EXCLUDED.total;
+
+    UPDATE stats_backfill SET done_upto = last_id;
+    RETURN last_id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,5 @@
+-- migrate: batch
+-- Пачечный подсчёт счётчиков 0011 по границе stats_backfill (0012): пачками по id, каждая
+-- пачка — своя короткая транзакция, запись в таблицы не останавливается. Если подсчитывать
+-- нечего (строки stats_backfill нет), первая же пачка возвращает NULL
+SELECT pereval_stats_backfill(%(after)s, %(batch_size)s) AS last_id
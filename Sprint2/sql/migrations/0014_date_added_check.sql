@@ -0,0 +1,6 @@
+-- Постраничные списки (перевалы пользователя, очередь модерации) идут по keyset (date_added, id):
+-- строка с NULL в date_added не попадает ни на одну страницу, а курсор по ней не кодируется.
+-- NOT VALID сразу запрещает новые NULL, не проверяя существующие строки под блокировкой таблицы;
+-- существующие заполняет 0015, проверка — в 0016
+ALTER TABLE pereval_added
+    ADD CONSTRAINT pereval_added_date_added_not_null CHECK (date_added IS NOT NULL) NOT VALID;
@@ -0,0 +1,15 @@
+-- migrate: batch
+-- Дата добавления неизвестна: такие перевалы считаются самыми старыми
+WITH batch AS (
+    SELECT id FROM pereval_added
+    WHERE id > %(after)s
+    ORDER BY id
+    LIMIT %(batch_size)s
+),
+filled AS (
+    UPDATE pereval_added pa
+    SET date_added = 'epoch'
+    FROM batch
+    WHERE pa.id = batch.id AND pa.date_added IS NULL
+)
+SELECT max(id) AS last_id FROM batch
@@ -0,0 +1,2 @@
+-- Проверка существующих строк под SHARE UPDATE EXCLUSIVE: чтение и запись таблицы не блокируются
+ALTER TABLE pereval_added VALIDATE CONSTRAINT pereval_added_date_added_not_null;
@@ -0,0 +1,5 @@
+-- Проверенное ограничение CHECK избавляет SET NOT NULL от просмотра таблицы:
+-- ACCESS EXCLUSIVE держится только на время изменения каталога. Ограничение удаляется
+-- отдельной командой: в одном ALTER TABLE оно было бы удалено раньше, чем его учтёт SET NOT NULL
+ALTER TABLE pereval_added ALTER COLUMN date_added SET NOT NULL;
+ALTER TABLE pereval_added DROP CONSTRAINT pereval_added_date_added_not_null;
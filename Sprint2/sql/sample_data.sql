@@ -37,7 +37,7 @@ BEGIN
 
     -- Добавляем перевал
     INSERT INTO public.pereval_added (
-        beauty_title, title, other_titles, connect,
+        beauty_title, title, other_titles, connection,
         user_id, coords_id, level_id, status
     )
     VALUES (
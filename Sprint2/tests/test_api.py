@@ -13,9 +13,7 @@ def test_update_pereval_invalid_status():
     response = client.patch(
         "/submitData/1/",
         json={
-            "data": {"title": "Новое название", ...},
-            "images": [...],
-            "activities": [...]
+            "data": {"title": "Новое название"}
         }
     )
     assert response.status_code == 400
@@ -24,4 +22,42 @@ def test_update_pereval_invalid_status():
 def test_get_user_perevals():
     response = client.get("/submitData/?user__email=test@example.com")
     assert response.status_code == 200
-    assert isinstance(response.json()["perevals"], list)
\ No newline at end of file
+    assert isinstance(response.json()["perevals"], list)
+
+def test_nearest_skips_coords_without_perevals():
+    import json
+    from database import DatabaseManager
+
+    response = client.post("/submitData/", json={
+        "data": {
+            "beautyTitle": "пер.", "title": "Безымянный", "other_titles": "", "connect": "",
+            "user": {"email": "nearest@example.com", "phone": "+79001234567", "fam": "Иванов", "name": "Иван"},
+            "coords": {"latitude": 89.5011, "longitude": 179.5011, "height": 100},
+            "level": {"summer": "1А"}
+        },
+        "images": [],
+        "activities": []
+    })
+    pereval_id = response.json()["id"]
+
+    # Координаты без перевалов ближе к точке, чем перевал, и их больше, чем кандидатов на limit=1
+    db_manager = DatabaseManager()
+    assert db_manager.connect()
+    with db_manager.pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("INSERT INTO coords (latitude, longitude, height) "
+                       "SELECT 89.5, 179.5, 100 FROM generate_series(1, 10) RETURNING id")
+        orphan_ids = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+    try:
+        response = client.get("/perevals/nearest/", params={"latitude": 89.5, "longitude": 179.5, "limit": 1})
+        assert response.status_code == 200
+        assert [json.loads(line)["id"] for line in response.text.splitlines()] == [pereval_id]
+    finally:
+        with db_manager.pool.connection() as conn, conn.cursor() as cursor:
+            cursor.execute("DELETE FROM pereval_added WHERE id = %s RETURNING coords_id", (pereval_id,))
+            orphan_ids.append(cursor.fetchone()[0])
+            cursor.execute("DELETE FROM coords c WHERE id = ANY(%s) "
+                           "AND NOT EXISTS (SELECT 1 FROM pereval_added pa WHERE pa.coords_id = c.id)",
+                           (orphan_ids,))
+            conn.commit()
+        db_manager.close()
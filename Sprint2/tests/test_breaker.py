@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import pytest
+from psycopg_pool import PoolTimeout
+from fastapi.testclient import TestClient
+import main
+from async_database import AsyncDatabaseManager, handle_async_db_errors
+from database import PerevalVersionMismatch
+from reference import UnknownActivityTypes
+from breaker import CircuitBreaker, DatabaseUnavailable
+from cache import LRUCache, PerevalCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=1, clock=FakeClock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(DatabaseUnavailable) as error:
+        breaker.check()
+    assert error.value.retry_after == 1
+    assert breaker.stats()['rejected'] == 1
+
+
+def test_breaker_probe_backoff_doubles_until_reset():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1, max_reset_timeout=4, clock=clock)
+    breaker.trip()
+    assert not breaker.attempt_due()
+    clock.now += 1
+    assert breaker.attempt_due()
+    delays = []
+    for _ in range(4):
+        breaker.record_probe_failure()
+        delays.append(breaker.retry_after())
+    assert delays == [2, 4, 4, 4]
+    # Успешный запрос из кэша не замыкает цепь, только проверка базы
+    breaker.record_success()
+    assert breaker.is_open
+    breaker.reset()
+    breaker.check()
+
+
+def test_lru_keeps_expired_entries_for_stale_reads():
+    cache = PerevalCache(LRUCache(max_size=10), ttl=-1)
+    cache.put({'id': 1, 'status': 'new'})
+    assert cache.get(1) is None
+    assert cache.get_stale(1) == {'id': 1, 'status': 'new'}
+    cache.invalidate(1)
+    assert cache.get_stale(1) is None
+
+
+@pytest.fixture
+def open_circuit():
+    breaker = main.db_manager.breaker
+    breaker.trip()
+    yield breaker
+    breaker.reset()
+
+
+def test_open_circuit_fails_fast_with_retry_after(open_circuit):
+    client = TestClient(main.app)
+    response = client.get("/submitData/?user__email=test@example.com")
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+    ready = client.get("/health/ready")
+    assert ready.status_code == 503
+    assert ready.json()["breaker"]["state"] == "open"
+    assert client.get("/health/live").status_code == 200
+
+
+def test_open_circuit_serves_stale_card(open_circuit):
+    pereval = {'id': 424242, 'status': 'new', 'title': 'Пхия', 'version': 2}
+    main.db_manager.cache.backend.set('pereval:424242', pereval, -1)
+    response = TestClient(main.app).get("/submitData/424242/")
+    assert response.status_code == 200
+    assert response.json()['title'] == 'Пхия'
+    assert 'Stale' in response.headers['Warning']
+
+class RejectingManager(AsyncDatabaseManager):
+    @handle_async_db_errors
+    async def reject(self, error):
+        raise error
+
+
+@pytest.mark.parametrize('error', [ValueError("bad status"), PerevalVersionMismatch("changed"),
+                                   UnknownActivityTypes([99])])
+def test_client_errors_are_not_logged_as_database_failures(error, caplog):
+    manager = RejectingManager()
+    with caplog.at_level(logging.WARNING, logger='async_database'):
+        with pytest.raises(type(error)):
+            asyncio.run(manager.reject(error))
+    assert not caplog.records
+    assert not manager.breaker.is_open
+
+
+def test_pool_timeout_fails_request_without_opening_circuit():
+    manager = RejectingManager()
+    for _ in range(manager.breaker.failure_threshold + 1):
+        with pytest.raises(DatabaseUnavailable) as error:
+            asyncio.run(manager.reject(PoolTimeout("couldn't get a connection")))
+        assert error.value.retry_after == 1
+    assert not manager.breaker.is_open
+    assert manager.breaker.stats()['state'] == 'closed'
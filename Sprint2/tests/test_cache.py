@@ -0,0 +1,140 @@
+import time
+import asyncio
+from decimal import Decimal
+from async_database import AsyncDatabaseManager
+from cache import LRUCache, RedisCache, InMemoryRedis, PerevalCache
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_size=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+
+def test_lru_expires_entries():
+    cache = LRUCache(max_size=10, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.stats()['expired'] == 1
+
+
+def test_pereval_cache_uses_long_ttl_for_final_status():
+    backend = LRUCache(max_size=10)
+    cache = PerevalCache(backend, ttl=0.01, final_ttl=60)
+    cache.put({'id': 1, 'status': 'new'})
+    cache.put({'id': 2, 'status': 'accepted'})
+    time.sleep(0.02)
+    assert cache.get(1) is None
+    assert cache.get(2)['status'] == 'accepted'
+
+
+def test_pereval_cache_invalidate():
+    cache = PerevalCache(LRUCache(max_size=10))
+    cache.put({'id': 1, 'status': 'new'})
+    cache.invalidate(1)
+    assert cache.get(1) is None
+
+
+def test_redis_cache_round_trip_with_stand_in():
+    cache = PerevalCache(RedisCache(InMemoryRedis()))
+    cache.put({'id': 1, 'status': 'new', 'coords': {'latitude': Decimal('45.384200')}})
+    assert cache.get(1)['coords']['latitude'] == 45.3842
+    cache.invalidate(1)
+    assert cache.get(1) is None
+    assert cache.stats() == {'backend': 'redis', 'hits': 1, 'misses': 1, 'errors': 0}
+
+
+class FlakyRedis(InMemoryRedis):
+    """Заглушка Redis, которую можно «выключить»"""
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("redis is down")
+
+    def get(self, key):
+        self._check()
+        return super().get(key)
+
+    def set(self, key, value, ex=None):
+        self._check()
+        return super().set(key, value, ex)
+
+    def delete(self, *keys):
+        self._check()
+        return super().delete(*keys)
+
+
+def test_redis_cache_falls_back_to_memory_and_replays_deletes():
+    client = FlakyRedis()
+    backend = RedisCache(client, fallback=LRUCache(max_size=10), fallback_ttl=5, retry_interval=0.01)
+    cache = PerevalCache(backend)
+    cache.put({'id': 1, 'status': 'new', 'title': 'old'})
+
+    client.down = True
+    assert cache.get(1) is None
+    cache.put({'id': 2, 'status': 'new'})
+    assert cache.get(2)['id'] == 2
+    assert backend.stats()['fallback_active'] == 1
+    # Карточку 1 изменили во время сбоя: в Redis осталась старая версия
+    cache.invalidate(1)
+
+    client.down = False
+    time.sleep(0.02)
+    assert cache.get(1) is None
+    assert backend.stats()['fallback_active'] == 0
+
+
+def test_redis_cache_without_fallback_counts_errors_as_misses():
+    client = FlakyRedis()
+    client.down = True
+    backend = RedisCache(client)
+    cache = PerevalCache(backend)
+    cache.put({'id': 1, 'status': 'new'})
+    assert cache.get(1) is None
+    assert backend.stats()['errors'] == 2
+
+class SlowRedis(InMemoryRedis):
+    """Redis, отвечающий за 0.2 с"""
+
+    def get(self, key):
+        time.sleep(0.2)
+        return super().get(key)
+
+
+def test_redis_calls_do_not_block_event_loop():
+    manager = AsyncDatabaseManager()
+    manager.cache = PerevalCache(RedisCache(SlowRedis()))
+    assert manager.cache.blocking and not PerevalCache(LRUCache()).blocking
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await manager.cache_call(manager.cache.put, {'id': 1, 'status': 'new'})
+        cached = await manager.cache_call(manager.cache.get, 1)
+        task.cancel()
+        return cached, ticks
+
+    cached, ticks = asyncio.run(scenario())
+    assert cached == {'id': 1, 'status': 'new'}
+    # Пока поток ждал Redis, цикл событий продолжал работать
+    assert ticks >= 5
@@ -0,0 +1,174 @@
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from database import (pereval_from_row, encode_cursor, decode_cursor,
+                      build_user_perevals_query, user_perevals_page, bulk_insert_params,
+                      submit_request_hash, resolve_idempotency_replay, IdempotencyKeyMismatch,
+                      pereval_etag, etag_matches, etag_version, PerevalVersionMismatch,
+                      pereval_update_plan, build_moderation_queue_query, moderation_results)
+
+
+def test_pereval_from_row_maps_columns_by_name():
+    row = {
+        'id': 7, 'status': 'new', 'beauty_title': 'пер.', 'title': 'Пхия',
+        'other_titles': 'Триев', 'connection': '',
+        'email': 'user@example.com', 'phone': '+79001234567',
+        'last_name': 'Иванов', 'first_name': 'Иван', 'middle_name': 'Иванович',
+        'latitude': 45.3842, 'longitude': 7.1525, 'height': 1200,
+        'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': '',
+        'images': [{'title': 'Седловина', 'img_url': 'https://example.com/image.jpg'}],
+        'activities': [1, 2], 'version': 3,
+    }
+    pereval = pereval_from_row(row)
+    assert pereval['beautyTitle'] == 'пер.'
+    assert pereval['connect'] == ''
+    assert pereval['user']['fam'] == 'Иванов'
+    assert pereval['coords']['height'] == 1200
+    assert pereval['level']['summer'] == '1А'
+    assert pereval['images'][0]['title'] == 'Седловина'
+    assert pereval['activities'] == [1, 2]
+    assert pereval['version'] == 3
+
+
+def test_cursor_round_trip():
+    date_added = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(date_added, 42)) == (date_added, 42)
+
+
+def test_bad_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_user_perevals_query_applies_filters():
+    cursor = encode_cursor(datetime(2024, 5, 1), 10)
+    query, params = build_user_perevals_query('user@example.com', 20, 'new', cursor)
+    assert "pa.status = %(status)s" in query
+    assert "(pa.date_added, pa.id) < (%(cursor_date)s, %(cursor_id)s)" in query
+    assert params['limit'] == 21
+    assert params['cursor_id'] == 10
+
+
+def test_user_perevals_page_sets_next_cursor_only_when_more_rows():
+    rows = [{'id': i, 'title': 'Пхия', 'status': 'new', 'date_added': datetime(2024, 5, i)}
+            for i in (3, 2, 1)]
+    page = user_perevals_page(rows, 2)
+    assert [p['id'] for p in page['perevals']] == [3, 2]
+    assert decode_cursor(page['next_cursor']) == (datetime(2024, 5, 2), 2)
+    assert user_perevals_page(rows, 3)['next_cursor'] is None
+
+
+def make_submit_request(email, images=(), activities=()):
+    return {
+        'data': {
+            'beautyTitle': 'пер.', 'title': 'Пхия', 'other_titles': 'Триев', 'connect': '',
+            'user': {'email': email, 'phone': '+79001234567', 'fam': 'Иванов', 'name': 'Иван', 'otc': None},
+            'coords': {'latitude': 45.3842, 'longitude': 7.1525, 'height': 1200},
+            'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        },
+        'images': [{'title': title, 'img_url': f'https://example.com/{title}.jpg'} for title in images],
+        'activities': list(activities),
+    }
+
+
+def test_bulk_insert_params_flattens_children_by_ordinal():
+    params = bulk_insert_params([
+        make_submit_request('a@example.com', images=['one', 'two'], activities=[2, 1, 2]),
+        make_submit_request('b@example.com', images=['three']),
+    ])
+    assert params['email'] == ['a@example.com', 'b@example.com']
+    assert params['img_ord'] == [1, 1, 2]
+    assert params['img_title'] == ['one', 'two', 'three']
+    assert params['act_ord'] == [1, 1]
+    assert params['act_id'] == [1, 2]
+
+
+def test_idempotency_replay_returns_stored_id_for_same_request():
+    request_hash = submit_request_hash(make_submit_request('a@example.com'))
+    assert submit_request_hash(make_submit_request('a@example.com')) == request_hash
+    assert resolve_idempotency_replay('key-1', request_hash, request_hash, 42) == 42
+
+
+def test_idempotency_replay_rejects_different_request():
+    stored_hash = submit_request_hash(make_submit_request('a@example.com'))
+    request_hash = submit_request_hash(make_submit_request('b@example.com'))
+    with pytest.raises(IdempotencyKeyMismatch):
+        resolve_idempotency_replay('key-1', request_hash, stored_hash, 42)
+
+
+def test_etag_matches_list_and_weak_tags():
+    etag = pereval_etag(7, 3)
+    assert etag_matches('"7-2", W/"7-3"', etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"7-2"', etag)
+
+
+def test_etag_version_parses_if_match():
+    assert etag_version(pereval_etag(7, 3), 7) == 3
+    assert etag_version('*', 7) is None
+    with pytest.raises(PerevalVersionMismatch):
+        etag_version(pereval_etag(8, 3), 7)
+    with pytest.raises(PerevalVersionMismatch):
+        etag_version('garbage', 7)
+
+
+def make_locked_row():
+    return {
+        'status': 'new', 'version': 2, 'coords_id': 10, 'level_id': 20,
+        'beauty_title': 'пер.', 'title': 'Пхия', 'other_titles': 'Триев', 'connection': '',
+        'latitude': Decimal('45.384200'), 'longitude': Decimal('7.152500'), 'height': 1200,
+        'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': '',
+        'images': [{'id': 1, 'title': 'Седловина', 'img_url': 'https://example.com/1.jpg'},
+                   {'id': 2, 'title': 'Подъём', 'img_url': 'https://example.com/2.jpg'}],
+        'activities': [1, 2],
+    }
+
+
+def test_update_plan_title_only_touches_pereval_row():
+    plan = pereval_update_plan(make_locked_row(), {'title': 'Пхия Новая'})
+    assert plan['changed']
+    assert plan['pereval']['title'] == 'Пхия Новая'
+    assert plan['pereval']['beauty_title'] == 'пер.'
+    assert plan['coords'] is None and plan['level'] is None
+    assert not plan['delete_images'] and not plan['insert_images']
+    assert not plan['delete_activities'] and not plan['insert_activities']
+
+
+def test_update_plan_same_values_is_noop():
+    data = {'title': 'Пхия', 'coords': {'latitude': 45.3842, 'longitude': 7.1525, 'height': 1200},
+            'level': {'summer': '1А'}}
+    images = [{'title': 'Подъём', 'img_url': 'https://example.com/2.jpg'},
+              {'title': 'Седловина', 'img_url': 'https://example.com/1.jpg'}]
+    assert not pereval_update_plan(make_locked_row(), data, images, [2, 1])['changed']
+
+
+def test_update_plan_diffs_children():
+    images = [{'title': 'Седловина', 'img_url': 'https://example.com/1.jpg'},
+              {'title': 'Вершина', 'img_url': 'https://example.com/3.jpg'}]
+    plan = pereval_update_plan(make_locked_row(), {'level': {'winter': '1Б'}}, images, [2, 3])
+    assert plan['level'] == {'winter': '1Б', 'summer': '1А', 'autumn': '1А', 'spring': ''}
+    assert plan['delete_images'] == [2]
+    assert plan['insert_images'] == [images[1]]
+    assert plan['delete_activities'] == [1]
+    assert plan['insert_activities'] == [3]
+
+
+def test_moderation_queue_query_is_oldest_first_keyset():
+    cursor = encode_cursor(datetime(2024, 5, 1, 12, 0), 42)
+    query, params = build_moderation_queue_query('pending', 20, cursor)
+    assert "ORDER BY pa.date_added, pa.id" in query
+    assert "(pa.date_added, pa.id) >" in query
+    assert params['status'] == 'pending'
+    assert params['limit'] == 21
+    with pytest.raises(ValueError):
+        build_moderation_queue_query('accepted', 20)
+
+
+def test_moderation_results_explain_rejected_ids():
+    rows = [{'id': 1, 'version': 5, 'previous_status': 'pending'},
+            {'id': 2, 'version': None, 'previous_status': 'accepted'},
+            {'id': 3, 'version': None, 'previous_status': None}]
+    results = moderation_results(rows, 'rejected')
+    assert results[0] == {'id': 1, 'status': 'rejected', 'updated': True, 'error': None}
+    assert results[1]['status'] == 'accepted' and 'accepted -> rejected' in results[1]['error']
+    assert results[2]['status'] is None and not results[2]['updated']
@@ -0,0 +1,35 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from export import format_records, CSV_COLUMNS
+
+
+def make_record(pereval_id):
+    return {
+        'id': pereval_id, 'date_added': '2024-05-01T12:00:00', 'status': 'accepted',
+        'beautyTitle': 'пер.', 'title': 'Пхия', 'other_titles': 'Триев', 'connect': '',
+        'user': {'email': 'user@example.com', 'phone': '+79001234567', 'fam': 'Иванов',
+                 'name': 'Иван', 'otc': None},
+        'coords': {'latitude': Decimal('45.384200'), 'longitude': Decimal('7.152500'), 'height': 1200},
+        'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        'images': [{'title': 'Седловина', 'img_url': 'https://example.com/image.jpg'}],
+        'activities': [1, 2],
+    }
+
+
+def test_ndjson_export_one_record_per_line():
+    lines = list(format_records(iter([make_record(1), make_record(2)]), 'ndjson'))
+    assert len(lines) == 2
+    record = json.loads(lines[1])
+    assert record['id'] == 2
+    assert record['coords']['latitude'] == 45.3842
+
+
+def test_csv_export_has_header_and_flat_rows():
+    text = ''.join(format_records(iter([make_record(1)]), 'csv'))
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == list(CSV_COLUMNS)
+    row = dict(zip(rows[0], rows[1]))
+    assert row['email'] == 'user@example.com'
+    assert json.loads(row['activities']) == [1, 2]
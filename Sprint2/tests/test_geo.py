@@ -0,0 +1,25 @@
+import pytest
+from geo import haversine_km, split_bbox
+from database import rank_nearest
+
+
+def test_haversine_known_distance():
+    # Москва — Санкт-Петербург, около 634 км
+    assert haversine_km(55.7558, 37.6173, 59.9343, 30.3351) == pytest.approx(634, abs=5)
+
+
+def test_split_bbox_across_antimeridian():
+    assert split_bbox(40, 10, 50, 20) == [(40, 10, 50, 20)]
+    assert split_bbox(40, 170, 50, -170) == [(40, 170, 50, 180.0), (40, -180.0, 50, -170)]
+
+
+def test_rank_nearest_orders_by_surface_distance():
+    rows = [
+        {'id': 1, 'title': 'far', 'status': 'new', 'latitude': 46.0, 'longitude': 7.0, 'height': 1},
+        {'id': 2, 'title': 'near', 'status': 'new', 'latitude': 45.4, 'longitude': 7.2, 'height': 1},
+        {'id': 3, 'title': 'mid', 'status': 'new', 'latitude': 45.6, 'longitude': 7.1, 'height': 1},
+    ]
+    ranked = rank_nearest(rows, 45.3842, 7.1525, 2)
+    assert [r['id'] for r in ranked] == [2, 3]
+    assert ranked[0]['distance_km'] < ranked[1]['distance_km']
+    assert ranked[0]['coords'] == {'latitude': 45.4, 'longitude': 7.2, 'height': 1}
@@ -0,0 +1,197 @@
+import io
+import asyncio
+import threading
+import ipaddress
+import pytest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from PIL import Image
+import images
+from breaker import DatabaseUnavailable
+from images import (ImageIngestor, ImageProcessingError, fetch_url, media_path, process_image, public_address,
+                    save_upload)
+
+
+def make_png(width=800, height=600):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (120, 160, 200)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def test_process_image_stores_original_and_thumbnail(tmp_path):
+    result = process_image(make_png(), tmp_path, thumb_size=320)
+    assert (result['width'], result['height']) == (800, 600)
+    assert (result['thumb_width'], result['thumb_height']) == (320, 240)
+    assert result['img_url'].endswith(f"/{result['content_hash']}.png")
+    assert media_path(tmp_path, f"{result['content_hash']}.png").exists()
+    with Image.open(media_path(tmp_path, f"{result['content_hash']}_320.jpg")) as thumb:
+        assert thumb.size == (320, 240)
+
+
+def test_same_content_is_stored_once(tmp_path):
+    data = make_png()
+    first = process_image(data, tmp_path)
+    second = process_image(data, tmp_path, store_original=False)
+    assert second['content_hash'] == first['content_hash']
+    assert second['thumb_url'] == first['thumb_url']
+    assert second['img_url'] is None
+    assert len([path for path in tmp_path.rglob('*') if path.is_file()]) == 2
+
+
+def test_invalid_data_is_rejected(tmp_path):
+    with pytest.raises(ImageProcessingError):
+        process_image(b'not an image', tmp_path)
+
+
+def test_save_upload_enforces_size_limit(tmp_path):
+    path = tmp_path / 'incoming' / 'upload'
+    with pytest.raises(ImageProcessingError):
+        save_upload(io.BytesIO(b'x' * 11), path, max_bytes=10)
+    assert not path.exists()
+    assert save_upload(io.BytesIO(b'x' * 10), path, max_bytes=10) == 10
+
+
+def test_save_upload_stops_reading_past_limit(tmp_path):
+    source = io.BytesIO(b'x' * 1000)
+    path = tmp_path / 'incoming' / 'upload'
+    with pytest.raises(ImageProcessingError):
+        save_upload(source, path, max_bytes=10, chunk_size=4)
+    assert source.tell() == 11
+    assert not path.exists()
+
+@pytest.mark.parametrize('host', ['127.0.0.1', '10.1.2.3', '192.168.0.10', '169.254.169.254',
+                                  '100.64.0.1', '0.0.0.0', '::1', 'fe80::1', '::ffff:127.0.0.1', 'localhost'])
+def test_public_address_rejects_internal_hosts(host):
+    with pytest.raises(ImageProcessingError):
+        public_address(host, 80)
+
+
+def test_public_address_accepts_internet_host():
+    assert public_address('93.184.216.34', 443) == '93.184.216.34'
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(302)
+        self.send_header('Location', 'http://169.254.169.254/latest/meta-data/')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def redirect_server():
+    server = HTTPServer(('127.0.0.1', 0), RedirectHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/image.jpg"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_url_rejects_loopback(redirect_server):
+    with pytest.raises(ImageProcessingError, match='внутреннюю сеть: 127.0.0.1'):
+        fetch_url(redirect_server, timeout=2)
+
+
+def test_fetch_url_checks_every_redirect_hop(redirect_server, monkeypatch):
+    # Первый хоп на loopback разрешён только в тесте, перенаправление на метаданные облака — нет
+    monkeypatch.setattr(images, 'is_public_address',
+                        lambda address: address == ipaddress.ip_address('127.0.0.1'))
+    with pytest.raises(ImageProcessingError, match='внутреннюю сеть: 169.254.169.254'):
+        fetch_url(redirect_server, timeout=2)
+
+class FakeImageDb:
+    def __init__(self, available=True):
+        self.available = available
+        self.processed = {}
+        self.failed = {}
+
+    async def set_image_processed(self, image_id, result):
+        if not self.available:
+            raise DatabaseUnavailable(5)
+        self.processed[image_id] = result
+
+    async def set_image_failed(self, image_id, error):
+        if not self.available:
+            raise DatabaseUnavailable(5)
+        self.failed[image_id] = error
+
+
+def ingest(db, tmp_path, data):
+    async def scenario():
+        ingestor = ImageIngestor(db, tmp_path, workers=1)
+        ingestor.start()
+        try:
+            upload = await ingestor.save_upload(io.BytesIO(data))
+            await ingestor.submit(7, upload)
+            await ingestor.queue.join()
+        finally:
+            await ingestor.stop()
+        return ingestor.incoming_path(7)
+
+    return asyncio.run(scenario())
+
+
+def test_incoming_file_removed_after_result_is_recorded(tmp_path):
+    db = FakeImageDb()
+    assert not ingest(db, tmp_path, make_png()).exists()
+    assert 7 in db.processed
+    assert not ingest(db, tmp_path, b'not an image').exists()
+    assert 7 in db.failed
+
+
+@pytest.mark.parametrize('data', [make_png(), b'not an image'])
+def test_incoming_file_kept_when_result_is_not_recorded(tmp_path, data):
+    db = FakeImageDb(available=False)
+    assert ingest(db, tmp_path, data).exists()
+
+class PendingImagesDb:
+    def __init__(self, rows):
+        self.rows = rows
+        self.refreshed = []
+
+    async def get_pending_images(self, claim_timeout):
+        return self.rows
+
+    async def refresh_image_claims(self, image_ids):
+        self.refreshed.append(image_ids)
+
+
+def test_resume_skips_images_already_queued_by_this_process(tmp_path):
+    db = PendingImagesDb([{'id': 1, 'img_url': 'https://example.com/1.jpg'},
+                          {'id': 2, 'img_url': 'https://example.com/2.jpg'}])
+
+    async def scenario():
+        ingestor = ImageIngestor(db, tmp_path, workers=1, claim_timeout=0.02)
+        await ingestor.submit(1, url='https://example.com/1.jpg')
+        assert await ingestor.resume() == 1
+        assert await ingestor.resume() == 0
+        assert ingestor.queue.qsize() == 2
+
+        # Пока изображения ждут в очереди, их закрепление продлевается
+        reclaimer = asyncio.create_task(ingestor._reclaimer())
+        await asyncio.sleep(0.05)
+        reclaimer.cancel()
+        assert ingestor.queue.qsize() == 2
+        assert db.refreshed and db.refreshed[0] == [1, 2]
+
+    asyncio.run(scenario())
+
+def test_wake_picks_up_new_pending_images_without_waiting(tmp_path):
+    db = PendingImagesDb([])
+
+    async def scenario():
+        ingestor = ImageIngestor(db, tmp_path, workers=1, claim_timeout=600)
+        reclaimer = asyncio.create_task(ingestor._reclaimer())
+        await asyncio.sleep(0)
+        db.rows = [{'id': 3, 'img_url': 'https://example.com/3.jpg'}]
+        ingestor.wake()
+        for _ in range(100):
+            if ingestor.queue.qsize():
+                break
+            await asyncio.sleep(0.01)
+        reclaimer.cancel()
+        return ingestor.queue.qsize()
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,50 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from metrics import (Counter, Histogram, MetricsMiddleware, HTTP_REQUEST_DURATION,
+                     track_db_method, record_query, render_prometheus)
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('test_seconds', 'test', ('route',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, '/a')
+    histogram.observe(0.5, '/a')
+    histogram.observe(5, '/a')
+    lines = histogram.render()
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{route="/a"} 3' in lines
+
+
+def test_counter_escapes_labels():
+    counter = Counter('test_total', 'test', ('method',))
+    counter.inc('a"b')
+    assert 'test_total{method="a\\"b"} 1.0' in counter.render()
+
+
+def test_queries_attributed_to_db_method():
+    with track_db_method('get_pereval_by_id_test'):
+        record_query("SELECT 1", 0.001)
+        record_query("SELECT 2", 0.001)
+    text = render_prometheus({'fstr_db_pool': {'in_use': 3, 'backend': 'memory'}})
+    assert 'fstr_db_queries_total{method="get_pereval_by_id_test"} 2.0' in text
+    assert 'fstr_db_pool_in_use 3' in text
+    assert 'fstr_db_pool_backend' not in text
+
+
+def test_middleware_uses_route_template_and_server_timing():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, server_timing=True)
+
+    @app.get("/items/{item_id}/")
+    async def get_item(item_id: int):
+        with track_db_method('get_item'):
+            record_query("SELECT 1", 0.002)
+        return {"id": item_id}
+
+    response = TestClient(app).get("/items/42/")
+    assert response.status_code == 200
+    assert 'desc="1 queries"' in response.headers['server-timing']
+    lines = HTTP_REQUEST_DURATION.render()
+    assert any('route="/items/{item_id}/"' in line and 'status="200"' in line for line in lines)
+    assert not any('/items/42/' in line for line in lines)
@@ -0,0 +1,175 @@
+import re
+import pytest
+import psycopg2
+from migrations import (Migration, load_migrations, pending_migrations, split_statements,
+                        apply_batches, migrate, APPLIED_MIGRATIONS_QUERY)
+
+
+def test_migrations_are_numbered_without_gaps():
+    migrations = load_migrations()
+    assert [migration.version for migration in migrations] == list(range(1, len(migrations) + 1))
+    assert migrations[0].mode == 'no-transaction'
+
+
+def test_batch_migrations_take_keyset_parameters():
+    for migration in load_migrations():
+        if migration.mode == 'batch':
+            assert '%(after)s' in migration.sql and '%(batch_size)s' in migration.sql
+            assert 'last_id' in migration.sql
+
+
+def test_migrations_parse():
+    pglast = pytest.importorskip('pglast')
+    for migration in load_migrations():
+        sql = re.sub(r"%\(\w+\)s", "0", migration.sql)
+        statements = split_statements(sql) if migration.mode == 'no-transaction' else [sql]
+        for statement in statements:
+            pglast.parse_sql(statement)
+
+
+def test_no_transaction_statements_are_concurrent():
+    migration = load_migrations()[0]
+    statements = split_statements(migration.sql)
+    assert statements
+    assert all('CONCURRENTLY' in statement and not statement.lstrip().startswith('--')
+               for statement in statements)
+
+
+def test_split_statements_skips_comments():
+    sql = "-- migrate: no-transaction\n-- комментарий\nCREATE INDEX a ON t (x);\n\nCREATE INDEX b\n    ON t (y);\n"
+    assert split_statements(sql) == ["CREATE INDEX a ON t (x)", "CREATE INDEX b\n    ON t (y)"]
+
+
+def test_mode_defaults_to_transaction_and_checksum_ignores_line_endings():
+    migration = Migration(1, 'test', "ALTER TABLE t ADD COLUMN x INT;\n")
+    assert migration.mode == 'transaction'
+    assert Migration(1, 'test', "ALTER TABLE t ADD COLUMN x INT;\r\n").checksum == migration.checksum
+
+
+def test_unknown_mode_rejected():
+    with pytest.raises(ValueError):
+        Migration(1, 'test', "-- migrate: sometimes\nSELECT 1")
+
+
+def test_pending_migrations_skip_applied_and_detect_changes():
+    first, second = Migration(1, 'first', "SELECT 1"), Migration(2, 'second', "SELECT 2")
+    assert pending_migrations([first, second], {1: first.checksum}) == [second]
+    with pytest.raises(ValueError):
+        pending_migrations([first, second], {1: second.checksum})
+
+
+def test_load_migrations_rejects_duplicates_and_bad_names(tmp_path):
+    (tmp_path / '0001_first.sql').write_text("SELECT 1", encoding='utf-8')
+    (tmp_path / '0001_again.sql').write_text("SELECT 1", encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_migrations(tmp_path)
+
+    (tmp_path / '0001_again.sql').unlink()
+    (tmp_path / 'first.sql').write_text("SELECT 1", encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_migrations(tmp_path)
+
+
+class FakeCursor:
+    def __init__(self, last_ids):
+        self.last_ids = list(last_ids)
+        self.params = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if isinstance(params, dict):
+            self.params.append(params)
+
+    def fetchone(self):
+        return (self.last_ids.pop(0),)
+
+
+class FakeConnection:
+    def __init__(self, last_ids):
+        self.cursor_ = FakeCursor(last_ids)
+        self.commits = 0
+
+    def cursor(self):
+        return self.cursor_
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_apply_batches_continues_after_last_key_until_empty_batch():
+    conn = FakeConnection([500, 900, None])
+    migration = Migration(4, 'backfill', "-- migrate: batch\nSELECT %(after)s, %(batch_size)s")
+    assert apply_batches(conn, migration, batch_size=500) == 2
+    assert [params['after'] for params in conn.cursor_.params] == [0, 500, 900]
+    assert conn.commits == 3
+
+class StrictCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if not self.conn.autocommit:
+            self.conn.in_transaction = True
+        self.conn.executed.append(query)
+        if 'to_regclass' in query:
+            self.rows = [('schema_migrations',)]
+        else:
+            self.rows = []
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+class StrictConnection:
+    """Как psycopg2: autocommit нельзя переключить, пока транзакция открыта"""
+
+    def __init__(self):
+        self._autocommit = False
+        self.in_transaction = False
+        self.executed = []
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if self.in_transaction:
+            raise psycopg2.ProgrammingError("set_session cannot be used inside a transaction")
+        self._autocommit = value
+
+    def cursor(self):
+        return StrictCursor(self)
+
+    def commit(self):
+        self.in_transaction = False
+
+    def rollback(self):
+        self.in_transaction = False
+
+
+def test_migrate_switches_autocommit_outside_transaction(tmp_path):
+    (tmp_path / '0001_index.sql').write_text(
+        "-- migrate: no-transaction\nCREATE INDEX CONCURRENTLY IF NOT EXISTS t_x_idx ON t (x);\n",
+        encoding='utf-8')
+    conn = StrictConnection()
+    applied = migrate(conn, directory=tmp_path)
+    assert [migration.version for migration in applied] == [1]
+    assert APPLIED_MIGRATIONS_QUERY in conn.executed
+    assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS t_x_idx ON t (x)" in conn.executed
+    assert not conn.autocommit and not conn.in_transaction
@@ -0,0 +1,119 @@
+import threading
+import pytest
+from pool import ConnectionPool, PoolTimeoutError
+from database import DatabaseManager
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if self.conn.broken:
+            raise RuntimeError("connection lost")
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    created = []
+
+    def connect():
+        conn = FakeConnection()
+        created.append(conn)
+        return conn
+
+    return ConnectionPool(connect, **kwargs), created
+
+
+def test_pool_reuses_connections():
+    pool, created = make_pool(minconn=1, maxconn=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(created) == 1
+    assert pool.stats()['acquired_total'] == 2
+
+
+def test_pool_times_out_when_exhausted():
+    pool, _ = make_pool(minconn=0, maxconn=1, timeout=0.05)
+    conn = pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    pool.putconn(conn)
+    stats = pool.stats()
+    assert stats['timeouts_total'] == 1
+    assert stats['in_use'] == 0
+    assert stats['idle'] == 1
+
+
+def test_pool_waiter_gets_returned_connection():
+    pool, _ = make_pool(minconn=0, maxconn=1, timeout=2)
+    conn = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+    waiter.join()
+    assert got == [conn]
+    assert pool.stats()['wait_time_max'] > 0
+
+
+def test_pool_replaces_broken_connection_on_pre_ping():
+    pool, created = make_pool(minconn=1, maxconn=1, pre_ping=True)
+    created[0].broken = True
+    with pool.connection() as conn:
+        assert conn is not created[0]
+    assert created[0].closed
+    assert pool.stats()['broken_total'] == 1
+
+
+def test_pool_recycles_expired_connection():
+    pool, created = make_pool(minconn=1, maxconn=1, max_lifetime=0.01, pre_ping=False)
+    threading.Event().wait(0.02)
+    with pool.connection() as conn:
+        assert conn is not created[0]
+    assert pool.stats()['recycled_total'] == 1
+    assert pool.stats()['size'] == 1
+
+
+def test_pool_rolls_back_on_error():
+    pool, created = make_pool(minconn=1, maxconn=1, pre_ping=False)
+    with pytest.raises(ValueError):
+        with pool.connection():
+            raise ValueError("boom")
+    assert created[0].rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_pool_inherited_through_fork_is_not_reused():
+    manager = DatabaseManager()
+    inherited = object()
+    manager.pool = inherited
+    assert manager.pool is inherited
+    # Так выглядит пул в дочернем процессе: открыт другим pid
+    manager._pool_pid = -1
+    assert manager.pool is None
+    assert manager._inherited_pools == [inherited]
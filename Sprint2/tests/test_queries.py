@@ -0,0 +1,92 @@
+import asyncio
+import re
+import pytest
+import database
+import reference
+from psycopg import AsyncCursor
+from async_database import InstrumentedAsyncCursor
+from collections import namedtuple
+from queries import STATEMENTS, Statement, StatementColumnsMismatch, check_columns, statement
+
+pglast = pytest.importorskip('pglast')
+
+
+def result_columns(text):
+    """Имена полей результата по разбору SQL: список SELECT или RETURNING"""
+    sql = re.sub(r"%\(\w+\)s|%s", "NULL", text).replace('%%', '%')
+    stmt = pglast.parse_sql(sql)[0].stmt
+    if isinstance(stmt, pglast.ast.SelectStmt):
+        targets = stmt.targetList
+    else:
+        # У UPDATE targetList — это SET; поля результата — RETURNING (returningClause в новых версиях)
+        returning = getattr(stmt, 'returningList', None) or getattr(stmt, 'returningClause', None)
+        targets = getattr(returning, 'exprs', returning) or ()
+    names = []
+    for target in targets:
+        if target.name:
+            names.append(target.name)
+        elif hasattr(target.val, 'fields'):
+            names.append(target.val.fields[-1].sval)
+        else:
+            names.append(target.val.funcname[-1].sval)
+    return tuple(names)
+
+
+@pytest.mark.parametrize('name', sorted(STATEMENTS))
+def test_declared_columns_match_sql(name):
+    assert STATEMENTS[name].columns == result_columns(STATEMENTS[name])
+
+
+def test_statement_is_plain_query_text():
+    assert database.PEREVAL_VERSION_QUERY.name == 'pereval_version'
+    assert 'SELECT version' in database.PEREVAL_VERSION_QUERY
+    assert reference.ACTIVITY_TYPES_QUERY is STATEMENTS['activity_types']
+    with pytest.raises(ValueError):
+        statement('pereval_version', 'SELECT 1')
+
+
+def test_registered_statements_are_prepared(monkeypatch):
+    calls = []
+
+    async def fake_execute(self, query, params=None, **kwargs):
+        calls.append(kwargs.get('prepare'))
+
+    monkeypatch.setattr(AsyncCursor, 'execute', fake_execute)
+    monkeypatch.setattr(AsyncCursor, 'description', None)
+    cursor = object.__new__(InstrumentedAsyncCursor)
+    asyncio.run(cursor.execute(database.PEREVAL_DETAIL_QUERY, (1,)))
+    asyncio.run(cursor.execute("SELECT 1"))
+    assert calls == [True, None]
+
+Column = namedtuple('Column', 'name')
+
+
+def test_check_columns_once_per_statement():
+    query = Statement('check_columns_test', "SELECT id, title FROM t", columns=('id', 'title'))
+    check_columns(query, None)
+    assert not query.checked
+    check_columns(query, [Column('id'), Column('title')])
+    assert query.checked
+    # Обычные строки запросов не проверяются
+    check_columns("SELECT 1", [Column('?column?')])
+
+
+def test_cursor_rejects_columns_that_drifted_from_sql(monkeypatch):
+    async def fake_execute(self, query, params=None, **kwargs):
+        pass
+
+    monkeypatch.setattr(AsyncCursor, 'execute', fake_execute)
+    monkeypatch.setattr(AsyncCursor, 'description', [Column('id'), Column('name')])
+    cursor = object.__new__(InstrumentedAsyncCursor)
+    query = Statement('drifted_columns_test', "SELECT id, name FROM t", columns=('id', 'title'))
+    with pytest.raises(StatementColumnsMismatch, match='drifted_columns_test'):
+        asyncio.run(cursor.execute(query))
+    assert not query.checked
+
+
+def test_bulk_insert_updates_known_user():
+    sql = re.sub(r"%\(\w+\)s|%s", "NULL", database.BULK_INSERT_QUERY)
+    ctes = {cte.ctename: cte.ctequery for cte in pglast.parse_sql(sql)[0].stmt.withClause.ctes}
+    conflict = ctes['user_ids'].onConflictClause
+    assert [target.name for target in conflict.targetList] == ['phone', 'last_name', 'first_name', 'middle_name']
+    assert all(target.val.fields[0].sval == 'excluded' for target in conflict.targetList)
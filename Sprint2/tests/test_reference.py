@@ -0,0 +1,43 @@
+import asyncio
+import pytest
+from reference import ActivityTypes, UnknownActivityTypes
+from async_database import AsyncDatabaseManager
+
+
+def test_unknown_ids_are_rejected_once_loaded():
+    activity_types = ActivityTypes()
+    assert activity_types.unknown([1, 99]) == []
+    activity_types.replace([(1, 'пешком'), (2, 'лыжи')])
+    assert activity_types.unknown([1, 2, 99, 99, 7]) == [7, 99]
+    with pytest.raises(UnknownActivityTypes) as error:
+        activity_types.check([2, 7])
+    assert error.value.activity_ids == [7]
+
+
+def test_etag_changes_with_content():
+    activity_types = ActivityTypes()
+    activity_types.replace([(1, 'пешком')])
+    etag = activity_types.etag
+    activity_types.replace([(1, 'пешком')])
+    assert activity_types.etag == etag
+    activity_types.replace([(1, 'пешком'), (2, 'лыжи')])
+    assert activity_types.etag != etag
+    assert activity_types.items() == [{'id': 1, 'title': 'пешком'}, {'id': 2, 'title': 'лыжи'}]
+
+
+def test_bulk_skips_items_with_unknown_activities():
+    db_manager = AsyncDatabaseManager()
+    db_manager.activity_types.replace([(1, 'пешком'), (2, 'лыжи')])
+    sent = []
+
+    async def fake_insert(items):
+        sent.extend(items)
+        return [{'index': n, 'id': 100 + n, 'error': None} for n in range(len(items))]
+
+    db_manager._insert_perevals_bulk = fake_insert
+    items = [{'activities': [1]}, {'activities': [5]}, {'activities': [2]}]
+    results = asyncio.run(db_manager.add_perevals_bulk(items))
+    assert sent == [items[0], items[2]]
+    assert [result['index'] for result in results] == [0, 1, 2]
+    assert results[0]['id'] == 100 and results[2]['id'] == 101
+    assert results[1]['id'] is None and '5' in results[1]['error']
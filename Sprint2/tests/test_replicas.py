@@ -0,0 +1,165 @@
+import os
+import asyncio
+import psycopg
+import pytest
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from async_database import AsyncDatabaseManager
+from replicas import (READ_AFTER_LSN, READ_AFTER_COOKIE, Replica, ReplicaSet, ReadYourWritesMiddleware,
+                      parse_lsn, parse_replicas)
+
+DEFAULTS = {'user': 'postgres', 'password': 'secret', 'dbname': 'pereval'}
+
+
+def test_parse_lsn():
+    assert parse_lsn('0/16B3748') == 0x16B3748
+    assert parse_lsn('1/0') > parse_lsn('0/FFFFFFFF')
+    assert parse_lsn('') is None
+    assert parse_lsn('garbage') is None
+    assert parse_lsn('x/1') is None
+
+
+def test_parse_replicas_fills_credentials_from_primary():
+    first, second = parse_replicas('replica1:5433, postgresql://reader@replica2/pereval', DEFAULTS)
+    assert first.name == 'replica1:5433'
+    assert 'password=secret' in first.conninfo and 'dbname=pereval' in first.conninfo
+    assert second.name == 'replica2:5432'
+    assert 'user=reader' in second.conninfo and 'password=secret' in second.conninfo
+    assert parse_replicas('', DEFAULTS) == []
+
+
+def healthy_replica(name, replay_lsn=0):
+    replica = Replica(name, '')
+    replica.pool = object()
+    replica.update(True, f"0/{replay_lsn:X}", 0.0, max_lag=5)
+    return replica
+
+
+def test_choose_round_robin_over_healthy_replicas():
+    first, second, down = healthy_replica('a'), healthy_replica('b'), healthy_replica('c')
+    down.mark_down('connection refused')
+    replicas = ReplicaSet([first, second, down])
+    assert [replicas.choose().name for _ in range(4)] == ['a', 'b', 'a', 'b']
+    assert replicas.stats()['healthy'] == 2
+
+
+def test_choose_skips_replicas_behind_client_write():
+    behind, caught_up = healthy_replica('behind', 0x100), healthy_replica('caught-up', 0x200)
+    replicas = ReplicaSet([behind, caught_up])
+    assert {replicas.choose(0x180).name for _ in range(3)} == {'caught-up'}
+    assert replicas.choose(0x300) is None
+
+
+def test_lagging_or_promoted_replica_is_excluded():
+    replica = healthy_replica('a')
+    replica.update(True, '0/10', 12.0, max_lag=5)
+    assert not replica.healthy
+    replica.update(True, '0/20', 0.1, max_lag=5)
+    assert replica.healthy
+    replica.update(False, None, 0.0, max_lag=5)
+    assert not replica.healthy
+
+
+class FakeConnection:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakePool:
+    def __init__(self, name, error=None):
+        self.name = name
+        self.error = error
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        if self.error:
+            raise self.error
+        yield FakeConnection(self.name)
+
+
+def manager_with(replica_pool):
+    manager = AsyncDatabaseManager()
+    manager.pool = FakePool('primary')
+    replica = healthy_replica('replica')
+    replica.pool = replica_pool
+    manager.replicas = ReplicaSet([replica])
+    return manager, replica
+
+
+async def connection_name(conn):
+    return conn.name
+
+
+def test_run_read_prefers_replica():
+    manager, replica = manager_with(FakePool('replica'))
+    assert asyncio.run(manager.run_read(connection_name)) == 'replica'
+    assert replica.reads == 1
+
+
+def test_run_read_falls_back_to_primary_when_replica_is_down():
+    manager, replica = manager_with(FakePool('replica', psycopg.OperationalError("connection refused")))
+    assert asyncio.run(manager.run_read(connection_name)) == 'primary'
+    assert not replica.healthy
+    assert asyncio.run(manager.run_read(connection_name)) == 'primary'
+    assert manager.replicas.stats()['primary_reads'] == 1
+
+
+def test_run_read_uses_primary_for_client_with_recent_write():
+    manager, replica = manager_with(FakePool('replica'))
+
+    async def scenario():
+        READ_AFTER_LSN.set(parse_lsn('1/0'))
+        return await manager.run_read(connection_name)
+
+    assert asyncio.run(scenario()) == 'primary'
+
+
+def test_middleware_sets_cookie_after_write_and_reads_it_back():
+    app = FastAPI()
+    seen = []
+
+    async def current_lsn():
+        return '0/3000060'
+
+    @app.patch("/item/")
+    async def patch_item():
+        return {}
+
+    @app.get("/item/")
+    async def get_item():
+        seen.append(READ_AFTER_LSN.get())
+        return {}
+
+    app.add_middleware(ReadYourWritesMiddleware, replicas=ReplicaSet([healthy_replica('a')]),
+                       current_lsn=current_lsn, window=10)
+    client = TestClient(app)
+    response = client.patch("/item/")
+    assert response.cookies[READ_AFTER_COOKIE] == '0/3000060'
+    assert 'set-cookie' not in client.get("/item/").headers
+    assert seen[0] == parse_lsn('0/3000060')
+
+
+@pytest.mark.skipif(not os.getenv('FSTR_TEST_REPLICAS'),
+                    reason="needs a primary (FSTR_DB_*) and a streaming replica (FSTR_TEST_REPLICAS)")
+def test_replica_catches_up_with_primary_write(monkeypatch):
+    monkeypatch.setenv('FSTR_DB_REPLICAS', os.environ['FSTR_TEST_REPLICAS'])
+
+    async def scenario():
+        manager = AsyncDatabaseManager()
+        try:
+            assert await manager.connect()
+            replica = manager.replicas.replicas[0]
+            await manager.check_replica(replica)
+            assert replica.healthy
+            lsn = parse_lsn(await manager.current_wal_lsn())
+            for _ in range(50):
+                await manager.check_replica(replica)
+                if replica.replay_lsn >= lsn:
+                    break
+                await asyncio.sleep(0.1)
+            assert manager.replicas.choose(lsn) is replica
+        finally:
+            await manager.close()
+
+    asyncio.run(scenario())
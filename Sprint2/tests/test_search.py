@@ -0,0 +1,45 @@
+import pytest
+from search import query_variants, build_tsquery, encode_search_cursor, decode_search_cursor
+from database import build_search_query, search_page
+
+
+def test_query_variants_add_transliteration():
+    assert query_variants('Pkhiya') == ['pkhiya', 'пхия']
+    assert query_variants('Домбай-Ульген') == ['домбай ульген', 'dombay ulgen']
+    assert query_variants('Dombay') == ['dombay', 'домбай']
+
+
+def test_short_query_is_rejected():
+    with pytest.raises(ValueError):
+        query_variants(' ! a ')
+
+
+def test_tsquery_uses_prefixes_and_or_between_variants():
+    assert build_tsquery(['пхия пасс', 'pkhiya pass']) == '(пхия:* & пасс:*) | (pkhiya:* & pass:*)'
+
+
+def test_search_cursor_round_trip():
+    rank = 0.7368421052631579
+    assert decode_search_cursor(encode_search_cursor(rank, 42)) == (rank, 42)
+    with pytest.raises(ValueError):
+        decode_search_cursor('not-a-cursor')
+
+
+def test_build_search_query_filters_and_continues_from_cursor():
+    query, params = build_search_query('Pkhiya', 20, 'accepted', encode_search_cursor(0.5, 7))
+    assert "pa.search_text %%> %(variant1)s" in query
+    assert "pa.status = %(status)s" in query
+    assert "(found.rank, found.id) < (%(cursor_rank)s, %(cursor_id)s)" in query
+    assert params['limit'] == 21
+    assert (params['cursor_rank'], params['cursor_id']) == (0.5, 7)
+
+
+def test_search_page_sets_next_cursor_only_when_more_rows():
+    rows = [{'id': n, 'title': f'Перевал {n}', 'beauty_title': 'пер.', 'other_titles': None,
+             'status': 'accepted', 'latitude': 45.0, 'longitude': 7.0, 'height': 1200,
+             'rank': 1.0 - n / 10} for n in range(3)]
+    page = search_page(rows, 2)
+    assert [item['id'] for item in page['perevals']] == [0, 1]
+    assert page['perevals'][0]['other_titles'] == ''
+    assert decode_search_cursor(page['next_cursor']) == (0.9, 1)
+    assert search_page(rows, 3)['next_cursor'] is None
@@ -0,0 +1,36 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from fastapi.encoders import jsonable_encoder
+import serialization
+from serialization import FastJSONResponse
+from models import PerevalResponse
+
+
+def make_db_pereval():
+    return {
+        'id': 7, 'status': 'new', 'beautyTitle': 'пер.', 'title': 'Пхия', 'other_titles': 'Триев',
+        'connect': '',
+        'user': {'email': 'user@example.com', 'phone': '+79001234567', 'fam': 'Иванов',
+                 'name': 'Иван', 'otc': None},
+        'coords': {'latitude': Decimal('45.384200'), 'longitude': Decimal('7.152500'), 'height': 1200},
+        'level': {'winter': '', 'summer': '1А', 'autumn': '1А', 'spring': ''},
+        'images': [{'title': 'Седловина', 'img_url': 'https://example.com/image.jpg',
+                    'width': 1600, 'height': 1200, 'thumb_url': '/media/ab/ab_320.jpg',
+                    'thumb_width': 320, 'thumb_height': 240, 'processing_status': 'ready'}],
+        'activities': [1, 2],
+        'version': 3,
+    }
+
+
+def test_fast_json_matches_response_model_output():
+    pereval = make_db_pereval()
+    expected = jsonable_encoder(PerevalResponse.parse_obj(pereval))
+    assert json.loads(FastJSONResponse(pereval).body) == expected
+
+
+def test_stdlib_fallback_without_orjson(monkeypatch):
+    monkeypatch.setattr(serialization, 'orjson', None)
+    body = serialization.dumps({'value': Decimal('1.5'), 'at': datetime(2024, 5, 1, 12, 0)})
+    assert json.loads(body) == {'value': 1.5, 'at': '2024-05-01T12:00:00'}
+    assert serialization.dumps({'title': 'Пхия'}) == '{"title":"Пхия"}'.encode('utf-8')
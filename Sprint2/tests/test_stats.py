@@ -0,0 +1,72 @@
+from fastapi.testclient import TestClient
+import main
+from stats import stats_from_rows, user_stats_from_rows
+
+# Строки STATS_QUERY: shard уже просуммированы
+ROWS = [
+    {'dimension': 'status', 'key': 'new', 'status': 'new', 'total': 3},
+    {'dimension': 'status', 'key': 'accepted', 'status': 'accepted', 'total': 5},
+    {'dimension': 'summer', 'key': '2А', 'status': 'accepted', 'total': 4},
+    {'dimension': 'summer', 'key': '1А', 'status': 'accepted', 'total': 1},
+    {'dimension': 'summer', 'key': '1А', 'status': 'new', 'total': 2},
+    {'dimension': 'winter', 'key': 'н/к', 'status': 'new', 'total': 3},
+    {'dimension': 'activity', 'key': '2', 'status': 'accepted', 'total': 5},
+    {'dimension': 'activity', 'key': '1', 'status': 'new', 'total': 1},
+]
+TITLES = {1: 'пешком', 2: 'лыжи'}
+
+
+def test_stats_from_rows_counts_all_statuses():
+    stats = stats_from_rows(ROWS, TITLES)
+    assert stats['total'] == 8
+    assert stats['by_status'] == {'new': 3, 'pending': 0, 'accepted': 5, 'rejected': 0}
+    assert stats['by_level']['summer'] == {'1А': 3, '2А': 4}
+    assert list(stats['by_level']['summer']) == ['1А', '2А']
+    assert stats['by_level']['winter'] == {'н/к': 3}
+    assert stats['by_level']['spring'] == {}
+    assert stats['by_activity'] == [{'id': 1, 'title': 'пешком', 'count': 1},
+                                    {'id': 2, 'title': 'лыжи', 'count': 5}]
+
+
+def test_stats_from_rows_filters_by_status():
+    stats = stats_from_rows(ROWS, TITLES, status='accepted')
+    assert stats['total'] == 5
+    # Разбивка по статусам не фильтруется
+    assert stats['by_status']['new'] == 3
+    assert stats['by_level']['summer'] == {'1А': 1, '2А': 4}
+    assert stats['by_level']['winter'] == {}
+    assert stats['by_activity'] == [{'id': 2, 'title': 'лыжи', 'count': 5}]
+
+
+def test_user_stats_from_rows_fills_missing_statuses():
+    stats = user_stats_from_rows('user@example.com', [{'status': 'accepted', 'total': 2},
+                                                      {'status': 'new', 'total': 1}])
+    assert stats == {'email': 'user@example.com', 'total': 3,
+                     'by_status': {'new': 1, 'pending': 0, 'accepted': 2, 'rejected': 0}}
+    assert user_stats_from_rows('nobody@example.com', [])['total'] == 0
+
+
+def test_stats_endpoints(monkeypatch):
+    calls = []
+
+    async def get_stats(status=None):
+        calls.append(status)
+        return stats_from_rows(ROWS, TITLES, status)
+
+    async def get_user_stats(email):
+        return user_stats_from_rows(email, [{'status': 'new', 'total': 1}])
+
+    monkeypatch.setattr(main.db_manager, 'get_stats', get_stats)
+    monkeypatch.setattr(main.db_manager, 'get_user_stats', get_user_stats)
+    client = TestClient(main.app)
+
+    response = client.get("/stats/", params={'status': 'accepted'})
+    assert response.status_code == 200
+    assert response.json()['total'] == 5
+    assert calls == ['accepted']
+    assert client.get("/stats/", params={'status': 'unknown'}).status_code == 422
+
+    response = client.get("/stats/users/", params={'user__email': 'user@example.com'})
+    assert response.json() == {'email': 'user@example.com', 'total': 1,
+                               'by_status': {'new': 1, 'pending': 0, 'accepted': 0, 'rejected': 0}}
+    assert client.get("/stats/users/").status_code == 422
@@ -0,0 +1,147 @@
+import asyncio
+import psycopg
+import pytest
+from fastapi.testclient import TestClient
+import main
+from submissions import SubmissionQueue
+
+TICKET = '7f1c2a9e-5b1d-4c36-9a57-3c2e8d0f4b61'
+
+SUBMIT_REQUEST = {
+    "data": {
+        "beautyTitle": "пер.", "title": "Пхия", "other_titles": "Триев", "connect": "",
+        "user": {"email": "user@example.com", "phone": "+79001234567", "fam": "Иванов", "name": "Иван"},
+        "coords": {"latitude": 45.3842, "longitude": 7.1525, "height": 1200},
+        "level": {"summer": "1А"}
+    },
+    "images": [{"title": "Седловина", "img_url": "https://example.com/image.jpg"}],
+    "activities": [1]
+}
+
+
+class FakeManager:
+    """Очередь в памяти вместо submission_queue"""
+
+    def __init__(self):
+        self.queued = []
+        self.batch_sizes = []
+
+    async def enqueue_submission(self, item, idempotency_key=None):
+        self.queued.append(item)
+        return f"ticket-{len(self.queued)}"
+
+    async def drain_submissions(self, limit):
+        batch, self.queued = self.queued[:limit], self.queued[limit:]
+        self.batch_sizes.append(len(batch))
+        return [{'ticket': f"t{index}", 'id': None if item.get('bad') else index, 'error': None, 'age': 0.5}
+                for index, item in enumerate(batch)]
+
+
+def test_drain_takes_batches_until_queue_is_empty():
+    manager = FakeManager()
+    manager.queued = [{}] * 5 + [{'bad': True}]
+    queue = SubmissionQueue(manager, enabled=True, batch_size=4)
+    assert asyncio.run(queue.drain()) == 6
+    assert manager.batch_sizes == [4, 2]
+    stats = queue.stats()
+    assert (stats['drained'], stats['failed'], stats['batches']) == (6, 1, 2)
+    assert stats['lag_seconds'] == 0.5
+
+
+def test_enqueue_wakes_drainer():
+    async def scenario():
+        manager = FakeManager()
+        queue = SubmissionQueue(manager, enabled=True, drainers=1, batch_size=10, poll_interval=60)
+        queue.start()
+        try:
+            assert await queue.enqueue({}) == 'ticket-1'
+            for _ in range(100):
+                if queue.drained:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert queue.enqueued == 1 and queue.drained == 1
+
+
+def test_drained_perevals_wake_image_processing():
+    manager = FakeManager()
+    wakes = []
+    queue = SubmissionQueue(manager, enabled=True, batch_size=4, on_drained=lambda: wakes.append(1))
+    manager.queued = [{'bad': True}]
+    asyncio.run(queue.drain())
+    assert wakes == []
+    manager.queued = [{}, {'bad': True}]
+    asyncio.run(queue.drain())
+    assert wakes == [1]
+
+
+def test_sync_submit_wakes_image_processing(monkeypatch):
+    wakes = []
+
+    async def add_pereval(data, images, activities, idempotency_key=None):
+        return 42
+
+    monkeypatch.setattr(main.submission_queue, 'enabled', False)
+    monkeypatch.setattr(main.db_manager, 'add_pereval', add_pereval)
+    monkeypatch.setattr(main.image_ingestor, 'wake', lambda: wakes.append(1))
+    client = TestClient(main.app)
+    assert client.post("/submitData/", json=SUBMIT_REQUEST).json()['id'] == 42
+    assert wakes == [1]
+    assert client.post("/submitData/", json={**SUBMIT_REQUEST, "images": []}).status_code == 200
+    assert wakes == [1]
+
+
+@pytest.mark.parametrize('error', [psycopg.errors.StringDataRightTruncation("value too long"),
+                                   psycopg.errors.ForeignKeyViolation("violates foreign key")])
+def test_sync_submit_rejects_invalid_data(monkeypatch, error):
+    async def add_pereval(data, images, activities, idempotency_key=None):
+        raise error
+
+    monkeypatch.setattr(main.submission_queue, 'enabled', False)
+    monkeypatch.setattr(main.db_manager, 'add_pereval', add_pereval)
+    response = TestClient(main.app).post("/submitData/", json=SUBMIT_REQUEST)
+    assert response.status_code == 400
+    assert response.json()['id'] is None
+
+
+def test_disabled_queue_starts_no_drainers():
+    queue = SubmissionQueue(FakeManager(), enabled=False)
+    queue.start()
+    assert queue.stats()['drainers'] == 0
+
+
+@pytest.fixture
+def queue_mode(monkeypatch):
+    async def enqueue(item, idempotency_key=None):
+        assert item['data']['title'] == 'Пхия'
+        return TICKET
+
+    monkeypatch.setattr(main.submission_queue, 'enabled', True)
+    monkeypatch.setattr(main.db_manager, 'enqueue_submission', enqueue)
+
+
+def test_submit_in_queue_mode_returns_ticket(queue_mode):
+    response = TestClient(main.app).post("/submitData/", json=SUBMIT_REQUEST)
+    assert response.status_code == 202
+    assert response.json()['ticket'] == TICKET
+    assert response.headers['Location'] == f"/submitData/tickets/{TICKET}/"
+
+
+def test_ticket_status(monkeypatch):
+    async def get_submission(ticket):
+        if ticket != TICKET:
+            return None
+        return {'ticket': ticket, 'status': 'done', 'id': 42, 'error': None,
+                'created_at': '2024-06-01T10:00:00', 'processed_at': '2024-06-01T10:00:01'}
+
+    monkeypatch.setattr(main.db_manager, 'get_submission', get_submission)
+    client = TestClient(main.app)
+    response = client.get(f"/submitData/tickets/{TICKET}/")
+    assert response.status_code == 200
+    assert response.json()['id'] == 42
+    assert client.get("/submitData/tickets/00000000-0000-0000-0000-000000000000/").status_code == 404
+    assert client.get("/submitData/tickets/not-a-ticket/").status_code == 422